@@ -1,4 +1,4 @@
-from flask import Flask, render_template, jsonify, request, send_from_directory, session, redirect, url_for, flash
+from flask import Flask, render_template, jsonify, request, send_from_directory, session, redirect, url_for, flash, abort, make_response
 import json
 import os
 import re
@@ -8,11 +8,32 @@ from werkzeug.security import generate_password_hash, check_password_hash
 import uuid
 from datetime import datetime, timedelta
 import threading
+import atexit
 import time
+import heapq
+import itertools
+import math
 from functools import wraps
+from contextlib import contextmanager
 from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
 import base64
 import hashlib
+import bisect
+from collections import OrderedDict
+from markupsafe import Markup
+import gzip
+import zlib
+import mimetypes
+
+try:
+    import brotli  # Optional - responses fall back to gzip without it
+except ImportError:
+    brotli = None
+
+try:
+    from PIL import Image  # Optional - reel thumbnails are served at full size without it
+except ImportError:
+    Image = None
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-change-this-in-production')  # Change this in production!
@@ -88,8 +109,157 @@ def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+# ==================== Content-Addressed Media Store ====================
+# Uploaded media for posts, events, shop, groups and avatars is stored once per
+# unique content under database/media/<sha256>.<ext>. Records keep storing a bare
+# filename, and the per-collection serve routes resolve it against the store first.
+
+MEDIA_STORE_FOLDER = os.path.join('database', 'media')
+MEDIA_STORE_INDEX = 'database/media_store.json'
+MEDIA_HASH_CHUNK_SIZE = 64 * 1024
+MEDIA_BLOB_PATTERN = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]+$')
+app.config['MEDIA_STORE_FOLDER'] = MEDIA_STORE_FOLDER
+
+_media_store_lock = threading.Lock()
+
+def load_media_store():
+    """Load the media blob index (filename -> reference info) from JSON database"""
+    try:
+        with open(MEDIA_STORE_INDEX, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+            return data.get('blobs', {})
+    except FileNotFoundError:
+        return {}
+    except json.JSONDecodeError:
+        return {}
+
+def save_media_store(blobs):
+    """Save the media blob index to JSON database"""
+    try:
+        if not isinstance(blobs, dict):
+            print("Error: media blobs must be a dict")
+            return False
+
+        os.makedirs('database', exist_ok=True)
+        with open(MEDIA_STORE_INDEX, 'w', encoding='utf-8') as f:
+            json.dump({'blobs': blobs}, f, indent=2, ensure_ascii=False)
+        return True
+    except Exception as e:
+        print(f"Error saving media store: {e}")
+        return False
+
+def is_media_blob(filename):
+    """Check if a filename refers to a content-addressed blob"""
+    return bool(filename) and bool(MEDIA_BLOB_PATTERN.match(filename))
+
+def get_uploaded_image(field):
+    """The upload in a form field if it is an allowed image file, else None"""
+    file = request.files.get(field)
+    if file and file.filename and allowed_file(file.filename):
+        return file
+    return None
+
+def store_uploaded_image(file):
+    """Store a validated upload in the media store. Returns None if there is no file."""
+    if not file:
+        return None
+    filename = secure_filename(file.filename)
+    file_extension = filename.rsplit('.', 1)[1].lower()
+    return store_media_file(file, file_extension)
+
+def store_media_file(file, file_ext):
+    """
+    Store an uploaded file in the content-addressed media store.
+    Hashes the upload while writing it to a temporary file; if a blob with the
+    same content already exists the temporary file is discarded and the
+    existing blob's reference count is incremented.
+    Returns the blob filename (<sha256>.<ext>).
+    """
+    media_folder = app.config.get('MEDIA_STORE_FOLDER', MEDIA_STORE_FOLDER)
+    os.makedirs(media_folder, exist_ok=True)
+
+    file_ext = file_ext.lower()
+    temp_path = os.path.join(media_folder, f".upload-{uuid.uuid4().hex}")
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        with open(temp_path, 'wb') as out:
+            while True:
+                chunk = file.stream.read(MEDIA_HASH_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+
+        blob_filename = f"{digest.hexdigest()}.{file_ext}"
+        blob_path = os.path.join(media_folder, blob_filename)
+
+        with _media_store_lock:
+            if os.path.exists(blob_path):
+                os.remove(temp_path)
+            else:
+                os.replace(temp_path, blob_path)
+
+            blobs = load_media_store()
+            blob_info = blobs.get(blob_filename)
+            if blob_info:
+                blob_info['ref_count'] = blob_info.get('ref_count', 0) + 1
+            else:
+                blobs[blob_filename] = {
+                    'ref_count': 1,
+                    'size': size,
+                    'created_at': datetime.now().isoformat()
+                }
+            save_media_store(blobs)
+
+        return blob_filename
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def release_media_file(filename):
+    """
+    Drop one reference to a content-addressed blob, deleting it when unused.
+    Legacy (non content-addressed) filenames are ignored.
+    """
+    if not is_media_blob(filename):
+        return
+
+    media_folder = app.config.get('MEDIA_STORE_FOLDER', MEDIA_STORE_FOLDER)
+    with _media_store_lock:
+        blobs = load_media_store()
+        blob_info = blobs.get(filename)
+        if not blob_info:
+            return
+
+        blob_info['ref_count'] = blob_info.get('ref_count', 0) - 1
+        if blob_info['ref_count'] <= 0:
+            del blobs[filename]
+            try:
+                blob_path = os.path.join(media_folder, filename)
+                if os.path.exists(blob_path):
+                    os.remove(blob_path)
+            except Exception as e:
+                print(f"Error deleting media blob {filename}: {e}")
+        save_media_store(blobs)
+
+def send_media(legacy_dir, filename):
+    """
+    Serve a media file, resolving content-addressed blobs from the media store
+    and falling back to the collection's legacy directory.
+    Blobs never change content, so they are cached as immutable.
+    """
+    media_folder = app.config.get('MEDIA_STORE_FOLDER', MEDIA_STORE_FOLDER)
+    if is_media_blob(filename) and os.path.exists(os.path.join(media_folder, filename)):
+        response = send_from_directory(media_folder, filename, max_age=31536000)
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
+    return send_from_directory(legacy_dir, filename)
+
 def load_temp_media():
-    """Load temporary media tracking from JSON database"""
+    """Load the temporary media snapshot from JSON database"""
     try:
         with open('database/temp_media.json', 'r', encoding='utf-8') as f:
             data = json.load(f)
@@ -100,7 +270,7 @@ def load_temp_media():
         return []
 
 def save_temp_media(temp_files):
-    """Save temporary media tracking to JSON database"""
+    """Save the temporary media snapshot to JSON database"""
     try:
         os.makedirs('database', exist_ok=True)
         with open('database/temp_media.json', 'w', encoding='utf-8') as f:
@@ -110,43 +280,309 @@ def save_temp_media(temp_files):
         print(f"Error saving temp media: {e}")
         return False
 
+# ==================== Temp Media Registry ====================
+# Temp files are indexed in memory by filename and by owner. The registry is
+# persisted as the temp_media.json snapshot plus an append-only journal of
+# add/remove operations, so uploads never rewrite the whole file. Workers
+# replay the journal tail to see each other's uploads, and the cleaner folds
+# the journal back into the snapshot once it grows past the size limit.
+
+TEMP_MEDIA_JOURNAL = 'database/temp_media.journal'
+TEMP_MEDIA_JOURNAL_LOCK = 'database/.temp_media_journal.lock'
+TEMP_MEDIA_JOURNAL_COMPACT_BYTES = 128 * 1024
+
+_temp_media_registry = {}  # filename -> file_info
+_temp_media_by_owner = {}  # owner -> set of filenames
+_temp_media_registry_lock = threading.RLock()
+_temp_media_registry_loaded = False
+_temp_media_journal_offset = 0
+_temp_media_journal_inode = None
+
+@contextmanager
+def _temp_media_journal_locked():
+    """Hold an exclusive cross-process lock on the temp media journal"""
+    os.makedirs('database', exist_ok=True)
+    with open(TEMP_MEDIA_JOURNAL_LOCK, 'a') as lock_file:
+        try:
+            import fcntl
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        except ImportError:
+            pass
+        yield
+
+def _index_temp_media(file_info):
+    """Add a temp file to the in-memory indexes"""
+    filename = file_info.get('filename')
+    if not filename:
+        return
+    _unindex_temp_media(filename)
+    _temp_media_registry[filename] = file_info
+    _temp_media_by_owner.setdefault(file_info.get('owner'), set()).add(filename)
+
+def _unindex_temp_media(filename):
+    """Remove a temp file from the in-memory indexes"""
+    file_info = _temp_media_registry.pop(filename, None)
+    if file_info is None:
+        return
+    owner = file_info.get('owner')
+    owner_files = _temp_media_by_owner.get(owner)
+    if owner_files is not None:
+        owner_files.discard(filename)
+        if not owner_files:
+            del _temp_media_by_owner[owner]
+
+def _apply_temp_media_op(op):
+    """Apply a single journal operation (operations are idempotent)"""
+    if op.get('op') == 'add' and isinstance(op.get('file'), dict):
+        _index_temp_media(op['file'])
+    elif op.get('op') == 'remove':
+        for filename in op.get('filenames', []):
+            _unindex_temp_media(filename)
+
+def _append_temp_media_journal(op):
+    """Append an operation to the journal"""
+    try:
+        with _temp_media_journal_locked():
+            with open(TEMP_MEDIA_JOURNAL, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(op, ensure_ascii=False) + '\n')
+        return True
+    except Exception as e:
+        print(f"Error writing temp media journal: {e}")
+        return False
+
+def _sync_temp_media_registry():
+    """Bring the in-memory registry up to date by replaying new journal entries"""
+    global _temp_media_registry_loaded, _temp_media_journal_offset, _temp_media_journal_inode
+
+    with _temp_media_registry_lock:
+        try:
+            stat = os.stat(TEMP_MEDIA_JOURNAL)
+            journal_size, journal_inode = stat.st_size, stat.st_ino
+        except OSError:
+            journal_size, journal_inode = 0, None
+
+        # First load, or the journal was compacted (replaced) by the cleaner: reload the snapshot
+        if (not _temp_media_registry_loaded or journal_inode != _temp_media_journal_inode
+                or journal_size < _temp_media_journal_offset):
+            _temp_media_registry.clear()
+            _temp_media_by_owner.clear()
+            for file_info in load_temp_media():
+                _index_temp_media(file_info)
+            _temp_media_journal_offset = 0
+            _temp_media_journal_inode = journal_inode
+            _temp_media_registry_loaded = True
+
+        if journal_size == _temp_media_journal_offset:
+            return
+
+        try:
+            with open(TEMP_MEDIA_JOURNAL, 'r', encoding='utf-8') as f:
+                f.seek(_temp_media_journal_offset)
+                for line in f:
+                    if not line.endswith('\n'):
+                        break  # Partially written line, pick it up next time
+                    _temp_media_journal_offset += len(line.encode('utf-8'))
+                    try:
+                        _apply_temp_media_op(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+        except FileNotFoundError:
+            pass
+
+def register_temp_media(file_info):
+    """Record a new temp file (O(1), appends one journal line)"""
+    _sync_temp_media_registry()
+    with _temp_media_registry_lock:
+        _index_temp_media(file_info)
+    return _append_temp_media_journal({'op': 'add', 'file': file_info})
+
+def unregister_temp_media(filenames):
+    """Forget a batch of temp files (appends one journal line)"""
+    filenames = list(filenames)
+    if not filenames:
+        return True
+    with _temp_media_registry_lock:
+        for filename in filenames:
+            _unindex_temp_media(filename)
+    return _append_temp_media_journal({'op': 'remove', 'filenames': filenames})
+
+def get_temp_media(filename):
+    """Look up a temp file by filename, replaying the journal only on a miss"""
+    file_info = _temp_media_registry.get(filename)
+    if file_info is None:
+        _sync_temp_media_registry()
+        file_info = _temp_media_registry.get(filename)
+    return file_info
+
+def get_user_temp_media(owner):
+    """Get all temp files uploaded by a user"""
+    _sync_temp_media_registry()
+    with _temp_media_registry_lock:
+        return [_temp_media_registry[f] for f in _temp_media_by_owner.get(owner, ())]
+
+def get_all_temp_media():
+    """Get all tracked temp files"""
+    _sync_temp_media_registry()
+    with _temp_media_registry_lock:
+        return list(_temp_media_registry.values())
+
+def compact_temp_media_registry():
+    """Fold the journal into the temp_media.json snapshot and replace it with an empty one"""
+    global _temp_media_journal_offset, _temp_media_journal_inode
+
+    with _temp_media_journal_locked():
+        _sync_temp_media_registry()
+        with _temp_media_registry_lock:
+            if save_temp_media(list(_temp_media_registry.values())):
+                # A new file (new inode) tells other workers to reload the snapshot,
+                # even if the new journal has already grown past their offset
+                temp_path = TEMP_MEDIA_JOURNAL + '.tmp'
+                open(temp_path, 'w').close()
+                os.replace(temp_path, TEMP_MEDIA_JOURNAL)
+                _temp_media_journal_offset = 0
+                _temp_media_journal_inode = os.stat(TEMP_MEDIA_JOURNAL).st_ino
+
+# ==================== Temp Media Expiry Scheduler ====================
+# Expiry deadlines are kept in a min-heap keyed on expiry_time. The cleaner thread
+# sleeps until the earliest deadline and removes every due file in one batch.
+# Only one process runs the cleaner: workers compete for an exclusive lock on
+# TEMP_MEDIA_CLEANER_LOCK and the losers block on it until the holder exits.
+#
+# Uploads from other workers are picked up by re-reading the registry whenever
+# the cleaner wakes. Every file lives for the full TTL, so a file uploaded while
+# the cleaner sleeps always expires after that sleep ends. An idle cleaner
+# therefore only needs to wake once per TTL.
+
+TEMP_MEDIA_TTL_MINUTES = 20
+TEMP_MEDIA_CLEANER_LOCK = 'database/.temp_media_cleaner.lock'
+
+_temp_media_heap = []  # (expiry_timestamp, filename)
+_temp_media_scheduled = set()
+_temp_media_condition = threading.Condition()
+_temp_media_cleaner_started = False
+_temp_media_is_cleaner = False
+
+def get_temp_media_expiry(file_info):
+    """Get the expiry timestamp of a temp file (falls back to upload_time + TTL)"""
+    try:
+        if file_info.get('expiry_time'):
+            return datetime.fromisoformat(file_info['expiry_time']).timestamp()
+        upload_time = datetime.fromisoformat(file_info['upload_time'])
+        return (upload_time + timedelta(minutes=TEMP_MEDIA_TTL_MINUTES)).timestamp()
+    except (KeyError, TypeError, ValueError):
+        # Unparseable entries are treated as already expired
+        return 0
+
+def schedule_temp_media_expiry(file_info):
+    """Add a temp file to the expiry heap and wake the cleaner if it is the earliest deadline"""
+    if not _temp_media_is_cleaner:
+        # Another worker owns the cleaner - it reads new entries from the registry
+        return
+
+    filename = file_info.get('filename')
+    expiry = get_temp_media_expiry(file_info)
+    with _temp_media_condition:
+        if filename in _temp_media_scheduled:
+            return
+        heapq.heappush(_temp_media_heap, (expiry, filename))
+        _temp_media_scheduled.add(filename)
+        if _temp_media_heap[0][1] == filename:
+            _temp_media_condition.notify()
+
+def _merge_temp_media_registry():
+    """Push registry entries not yet on the heap (e.g. uploaded by other workers)"""
+    temp_files = get_all_temp_media()
+    with _temp_media_condition:
+        for file_info in temp_files:
+            filename = file_info.get('filename')
+            if filename and filename not in _temp_media_scheduled:
+                heapq.heappush(_temp_media_heap, (get_temp_media_expiry(file_info), filename))
+                _temp_media_scheduled.add(filename)
+
+def expire_temp_media(filenames):
+    """Delete a batch of expired temp files and drop them from the registry in one journal write"""
+    expired = []
+    for filename in filenames:
+        file_info = get_temp_media(filename)
+        if not file_info:
+            continue
+        expired.append(filename)
+
+        file_path = file_info.get('file_path')
+        try:
+            if file_path and os.path.exists(file_path):
+                os.remove(file_path)
+                print(f"Deleted expired file: {file_path}")
+        except Exception as e:
+            print(f"Error deleting file {file_path}: {e}")
+
+    unregister_temp_media(expired)
+
+    try:
+        if os.path.getsize(TEMP_MEDIA_JOURNAL) > TEMP_MEDIA_JOURNAL_COMPACT_BYTES:
+            compact_temp_media_registry()
+    except OSError:
+        pass
+
+def _acquire_temp_media_cleaner_lock():
+    """Block until this process holds the cleaner lock. Returns the open lock file."""
+    os.makedirs('database', exist_ok=True)
+    lock_file = open(TEMP_MEDIA_CLEANER_LOCK, 'a')
+    try:
+        import fcntl
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+    except ImportError:
+        # No flock (e.g. Windows) - single process dev server, run the cleaner here
+        pass
+    return lock_file
+
 def cleanup_expired_media():
-    """Background task to clean up expired temporary media files"""
+    """Background task that deletes temporary media files as their deadlines pass"""
+    global _temp_media_is_cleaner
+
+    # Keep a reference to the lock file so the lock is held for the life of the process
+    lock_file = _acquire_temp_media_cleaner_lock()
+    _temp_media_is_cleaner = True
+    ttl_seconds = TEMP_MEDIA_TTL_MINUTES * 60
+
     while True:
         try:
-            time.sleep(60)  # Check every minute
-            
-            temp_files = load_temp_media()
-            current_time = datetime.now()
-            files_to_keep = []
-            
-            for file_info in temp_files:
-                upload_time = datetime.fromisoformat(file_info['upload_time'])
-                expiry_time = upload_time + timedelta(minutes=20)
-                
-                if current_time >= expiry_time:
-                    # Delete the file
-                    file_path = file_info['file_path']
-                    try:
-                        if os.path.exists(file_path):
-                            os.remove(file_path)
-                            print(f"Deleted expired file: {file_path}")
-                    except Exception as e:
-                        print(f"Error deleting file {file_path}: {e}")
+            _merge_temp_media_registry()
+
+            with _temp_media_condition:
+                if _temp_media_heap:
+                    timeout = _temp_media_heap[0][0] - time.time()
                 else:
-                    # Keep the file
-                    files_to_keep.append(file_info)
-            
-            # Update the tracking file
-            if len(files_to_keep) != len(temp_files):
-                save_temp_media(files_to_keep)
-                
+                    timeout = ttl_seconds
+                if timeout > 0:
+                    _temp_media_condition.wait(timeout)
+
+                # Pop every entry that is due in a single batch
+                now = time.time()
+                due = []
+                while _temp_media_heap and _temp_media_heap[0][0] <= now:
+                    _, filename = heapq.heappop(_temp_media_heap)
+                    _temp_media_scheduled.discard(filename)
+                    due.append(filename)
+
+            if due:
+                expire_temp_media(due)
+
         except Exception as e:
             print(f"Error in cleanup task: {e}")
+            time.sleep(1)
+
+def start_temp_media_cleaner():
+    """Start the temp media cleaner thread (once per process)"""
+    global _temp_media_cleaner_started
+    if _temp_media_cleaner_started:
+        return
+    _temp_media_cleaner_started = True
+    cleanup_thread = threading.Thread(target=cleanup_expired_media, daemon=True)
+    cleanup_thread.start()
 
 # Start cleanup background thread
-cleanup_thread = threading.Thread(target=cleanup_expired_media, daemon=True)
-cleanup_thread.start()
+start_temp_media_cleaner()
 
 # Add template filter for category icons
 @app.template_filter('get_category_icon')
@@ -165,8 +601,8 @@ def load_posts():
     except json.JSONDecodeError:
         return []
 
-def save_posts(posts):
-    """Save posts to JSON database"""
+def save_posts(posts, changed_ids=None):
+    """Save posts to JSON database (changed_ids optionally names the posts that were added or modified)"""
     try:
         # Validate posts data
         if not isinstance(posts, list):
@@ -179,17 +615,134 @@ def save_posts(posts):
             return False
             
         os.makedirs('database', exist_ok=True)
-        with open('database/posts.json', 'w', encoding='utf-8') as f:
-            json.dump({'posts': posts}, f, indent=2, ensure_ascii=False)
+        with collection_locked('posts'):
+            keep_counter_values('posts', posts)
+            previous_version = get_collection_version('posts')
+            with open('database/posts.json', 'w', encoding='utf-8') as f:
+                json.dump({'posts': posts}, f, indent=2, ensure_ascii=False)
+            remember_counter_values('posts', posts)
+            set_post_index(posts, changed_ids, previous_version)
+        invalidate_fragments('posts')
         return True
     except Exception as e:
         print(f"Error saving posts: {e}")
         return False
 
-def load_notifications():
-    """Load notifications from JSON database"""
+# ==================== ID Sequences ====================
+# New ids come from persistent per-collection counters instead of scanning for
+# max(id) + 1. Allocation holds a cross-process lock, so ids stay unique across
+# threads and worker processes.
+#
+# Top-level collections ('posts', 'users', ...) share database/sequences.json.
+# Per-thread sequences ('conversation:7:messages', ...) are spread over
+# SEQUENCE_SHARDS files in database/sequences/, each with its own lock, so
+# messages and comments in different threads don't serialize on one file.
+
+SEQUENCES_FILE = 'database/sequences.json'
+SEQUENCES_LOCK = 'database/.sequences.lock'
+SEQUENCES_FOLDER = 'database/sequences'
+SEQUENCE_SHARDS = 64
+
+_sequences_thread_locks = {shard: threading.Lock() for shard in [None, *range(SEQUENCE_SHARDS)]}
+
+@contextmanager
+def _file_locked(lock_path):
+    """Hold an exclusive cross-process lock on a lock file"""
+    os.makedirs(os.path.dirname(lock_path) or '.', exist_ok=True)
+    with open(lock_path, 'a') as lock_file:
+        try:
+            import fcntl
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        except ImportError:
+            pass
+        yield
+
+def get_sequence_shard(collection):
+    """Get the shard of a sequence: None for top-level collections, else 0..SEQUENCE_SHARDS-1"""
+    if ':' not in collection:
+        return None
+    # crc32 rather than hash(): the shard must be the same in every process
+    return zlib.crc32(collection.encode('utf-8')) % SEQUENCE_SHARDS
+
+def get_sequence_paths(shard):
+    """Get the (file, lock file) paths of a sequence shard"""
+    if shard is None:
+        return SEQUENCES_FILE, SEQUENCES_LOCK
+    return (os.path.join(SEQUENCES_FOLDER, f'{shard:02d}.json'),
+            os.path.join(SEQUENCES_FOLDER, f'.{shard:02d}.lock'))
+
+def load_sequences(path=SEQUENCES_FILE):
+    """Load id sequences from JSON database"""
     try:
-        with open('database/notifications.json', 'r', encoding='utf-8') as f:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+            return data.get('sequences', {})
+    except FileNotFoundError:
+        return {}
+    except json.JSONDecodeError:
+        return {}
+
+def save_sequences(sequences, path=SEQUENCES_FILE):
+    """Save id sequences to JSON database (atomic replace)"""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'sequences': sequences}, f, indent=2, ensure_ascii=False)
+        os.replace(temp_path, path)
+        return True
+    except Exception as e:
+        print(f"Error saving sequences: {e}")
+        return False
+
+def allocate_id(collection, seed=None):
+    """
+    Allocate the next id for a collection.
+    seed() is called once, the first time a collection is seen, and should
+    return the highest id already in use.
+    """
+    shard = get_sequence_shard(collection)
+    path, lock_path = get_sequence_paths(shard)
+    with _sequences_thread_locks[shard], _file_locked(lock_path):
+        sequences = load_sequences(path)
+        current = sequences.get(collection)
+        if current is None:
+            current = seed() if seed else 0
+        current += 1
+        sequences[collection] = current
+        save_sequences(sequences, path)
+        return current
+
+def ensure_sequence(collection, max_id):
+    """Make sure a collection's sequence is at least max_id (used when importing existing data)"""
+    shard = get_sequence_shard(collection)
+    path, lock_path = get_sequence_paths(shard)
+    with _sequences_thread_locks[shard], _file_locked(lock_path):
+        sequences = load_sequences(path)
+        if sequences.get(collection, 0) < max_id:
+            sequences[collection] = max_id
+            save_sequences(sequences, path)
+
+# ==================== Notification Inboxes ====================
+# Notifications are stored per recipient in database/notifications/<username>.json
+# (newest first, capped at NOTIFICATION_RETENTION), so inbox and badge reads only
+# touch the current user's notifications.
+
+NOTIFICATIONS_FOLDER = 'database/notifications'
+NOTIFICATIONS_LOCK = 'database/.notifications.lock'
+LEGACY_NOTIFICATIONS_FILE = 'database/notifications.json'
+NOTIFICATION_RETENTION = 200
+
+def get_inbox_path(username):
+    """Get the inbox file path for a user"""
+    return os.path.join(NOTIFICATIONS_FOLDER, f'{username}.json')
+
+def load_user_notifications(username):
+    """Load a user's notifications (newest first)"""
+    if not validate_username(username):
+        return []
+    try:
+        with open(get_inbox_path(username), 'r', encoding='utf-8') as f:
             data = json.load(f)
             return data.get('notifications', [])
     except FileNotFoundError:
@@ -197,22 +750,77 @@ def load_notifications():
     except json.JSONDecodeError:
         return []
 
-def save_notifications(notifications):
-    """Save notifications to JSON database"""
+def save_user_notifications(username, notifications):
+    """Save a user's notifications, keeping only the newest NOTIFICATION_RETENTION"""
     try:
-        # Validate notifications data
+        if not validate_username(username):
+            print(f"Error: invalid inbox username {username!r}")
+            return False
         if not isinstance(notifications, list):
             print("Error: notifications must be a list")
             return False
             
-        os.makedirs('database', exist_ok=True)
-        with open('database/notifications.json', 'w', encoding='utf-8') as f:
+        os.makedirs(NOTIFICATIONS_FOLDER, exist_ok=True)
+        notifications = notifications[:NOTIFICATION_RETENTION]
+        with open(get_inbox_path(username), 'w', encoding='utf-8') as f:
             json.dump({'notifications': notifications}, f, indent=2, ensure_ascii=False)
+        set_badge_part('notifications', username, get_inbox_version(username), count_unread_notifications(notifications))
+        invalidate_badges(username)
         return True
     except Exception as e:
         print(f"Error saving notifications: {e}")
         return False
 
+def add_notification(notification):
+    """Assign an id to a notification and add it to the front of its recipient's inbox"""
+    username = notification.get('target_user')
+    if not validate_username(username):
+        return None
+    
+    notification = {'id': allocate_id('notifications'), **notification}
+    with _file_locked(NOTIFICATIONS_LOCK):
+        notifications = load_user_notifications(username)
+        notifications.insert(0, notification)
+        save_user_notifications(username, notifications)
+    return notification
+
+def get_inbox_version(username):
+    """Version token for a user's inbox - changes whenever it is rewritten"""
+    return get_file_version(get_inbox_path(username))
+
+def migrate_notifications():
+    """
+    Split the legacy global notifications.json into per-user inboxes.
+    Notifications without a target_user were shown to everyone except their
+    author, so they are copied into each of those users' inboxes.
+    The legacy file is left in place untouched.
+    """
+    if os.path.isdir(NOTIFICATIONS_FOLDER) or not os.path.exists(LEGACY_NOTIFICATIONS_FILE):
+        return
+    
+    try:
+        with open(LEGACY_NOTIFICATIONS_FILE, 'r', encoding='utf-8') as f:
+            legacy = json.load(f).get('notifications', [])
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Error migrating notifications: {e}")
+        return
+    
+    usernames = [u.get('username') for u in load_users() if u.get('username')]
+    inboxes = {}
+    for notification in legacy:
+        target = notification.get('target_user')
+        recipients = [target] if target else [u for u in usernames if u != notification.get('user')]
+        for username in recipients:
+            inboxes.setdefault(username, []).append(dict(notification, target_user=username))
+    
+    with _file_locked(NOTIFICATIONS_LOCK):
+        os.makedirs(NOTIFICATIONS_FOLDER, exist_ok=True)
+        for username, notifications in inboxes.items():
+            notifications.sort(key=lambda n: n.get('id', 0), reverse=True)
+            save_user_notifications(username, notifications)
+    
+    ensure_sequence('notifications', max((n.get('id', 0) for n in legacy), default=0))
+
 def load_events():
     """Load events from JSON database"""
     try:
@@ -233,8 +841,12 @@ def save_events(events):
             return False
             
         os.makedirs('database', exist_ok=True)
-        with open('database/events.json', 'w', encoding='utf-8') as f:
-            json.dump({'events': events}, f, indent=2, ensure_ascii=False)
+        with collection_locked('events'):
+            with open('database/events.json', 'w', encoding='utf-8') as f:
+                json.dump({'events': events}, f, indent=2, ensure_ascii=False)
+        invalidate_badges()
+        invalidate_fragments('events')
+        set_event_index(events)
         return True
     except Exception as e:
         print(f"Error saving events: {e}")
@@ -295,22 +907,26 @@ def save_shop(products):
             return False
             
         os.makedirs('database', exist_ok=True)
-        with open('database/shop.json', 'w', encoding='utf-8') as f:
-            json.dump({'products': products}, f, indent=2, ensure_ascii=False)
+        with collection_locked('shop'):
+            keep_counter_values('shop', products)
+            with open('database/shop.json', 'w', encoding='utf-8') as f:
+                json.dump({'products': products}, f, indent=2, ensure_ascii=False)
+            remember_counter_values('shop', products)
+        invalidate_badges()
+        invalidate_fragments('shop')
+        
+        # Keep the sorted shop indexes in sync with what was written
+        set_shop_index(products)
         return True
     except Exception as e:
         print(f"Error saving products: {e}")
         return False
 
 def get_shop_categories():
-    """Get unique categories from shop products"""
-    products = load_shop()
-    categories = set()
-    for product in products:
-        if 'category' in product and product['category']:
-            categories.add(product['category'])
-    return sorted(list(categories))
+    """Get unique categories from shop products (maintained by the shop index)"""
+    return list(get_shop_index()['categories'])
 
+@app.template_global()
 def get_shop_category_icon(category):
     """Get appropriate icon for shop category"""
     category_icons = {
@@ -333,6 +949,802 @@ def get_shop_category_icon(category):
     }
     return category_icons.get(category, 'bi-shop')
 
+# ==================== Comment Threads ====================
+# Post and reel comments live in one file per thread
+# (database/comments/<kind>-<id>.json) rather than inside posts.json and
+# reels.json, so feed loads don't carry every comment and adding one rewrites
+# a single small file. A thread is a flat list in id order where each comment
+# names its parent_id (None at the top level). The parent index - top-level
+# ids plus replies grouped by parent - is cached until the file changes, and
+# pages are cut from it by cursor (the last top-level id already shown).
+# Writes lock one of COMMENT_LOCK_SHARDS shards of the threads (crc32 of the
+# thread key, like the sequence shards), so comments on different threads
+# don't wait on each other.
+
+COMMENTS_FOLDER = 'database/comments'
+COMMENT_LOCK_SHARDS = 64
+COMMENT_PAGE_DEFAULT_LIMIT = 20
+COMMENT_PAGE_MAX_LIMIT = 100
+COMMENT_INDEX_CACHE_SIZE = 500
+
+_comment_indexes = OrderedDict()  # (kind, thread id) -> (file version, index)
+_comment_indexes_lock = threading.Lock()
+_comment_thread_locks = [threading.Lock() for _ in range(COMMENT_LOCK_SHARDS)]
+
+def get_comment_thread_path(kind, thread_id):
+    """Path of a post's or reel's comment file"""
+    return os.path.join(COMMENTS_FOLDER, f'{kind}-{int(thread_id)}.json')
+
+@contextmanager
+def comment_thread_locked(kind, thread_id):
+    """Hold the thread and cross-process locks of a comment thread's shard"""
+    shard = zlib.crc32(f'{kind}:{int(thread_id)}'.encode('utf-8')) % COMMENT_LOCK_SHARDS
+    with _comment_thread_locks[shard], _file_locked(os.path.join(COMMENTS_FOLDER, f'.{shard:02d}.lock')):
+        yield
+
+def load_comment_thread(kind, thread_id):
+    """Load a thread's comments (flat, in id order)"""
+    try:
+        with open(get_comment_thread_path(kind, thread_id), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+            return data.get('comments', [])
+    except FileNotFoundError:
+        return []
+    except json.JSONDecodeError:
+        return []
+
+def save_comment_thread(kind, thread_id, comments):
+    """Save a thread's comments (atomic replace)"""
+    try:
+        os.makedirs(COMMENTS_FOLDER, exist_ok=True)
+        path = get_comment_thread_path(kind, thread_id)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'comments': comments}, f, indent=2, ensure_ascii=False)
+        os.replace(temp_path, path)
+        return True
+    except Exception as e:
+        print(f"Error saving {kind} {thread_id} comments: {e}")
+        return False
+
+def get_comment_index(kind, thread_id):
+    """Parent index of a thread: {'top': [top-level ids], 'comments': {id: comment}, 'replies': {parent id: [replies]}}"""
+    key = (kind, thread_id)
+    file_version = get_file_version(get_comment_thread_path(kind, thread_id))
+    with _comment_indexes_lock:
+        cached = _comment_indexes.get(key)
+        if cached and cached[0] == file_version:
+            _comment_indexes.move_to_end(key)
+            return cached[1]
+    
+    index = {'top': [], 'comments': {}, 'replies': {}}
+    for comment in load_comment_thread(kind, thread_id):
+        index['comments'][comment.get('id')] = comment
+        if comment.get('parent_id') is None:
+            index['top'].append(comment.get('id'))
+        else:
+            index['replies'].setdefault(comment['parent_id'], []).append(comment)
+    
+    with _comment_indexes_lock:
+        _comment_indexes[key] = (file_version, index)
+        while len(_comment_indexes) > COMMENT_INDEX_CACHE_SIZE:
+            _comment_indexes.popitem(last=False)
+    return index
+
+def build_comment_tree(index, comment):
+    """A comment with its replies nested under 'replies' (the shape clients render)"""
+    replies = index['replies'].get(comment.get('id'), [])
+    return {**comment, 'replies': [build_comment_tree(index, reply) for reply in replies]}
+
+def get_comment_page(kind, thread_id, cursor=None, limit=None):
+    """
+    Get (top-level comments with replies, next cursor) after a cursor.
+    limit=None returns the rest of the thread.
+    """
+    index = get_comment_index(kind, thread_id)
+    top = index['top']
+    start = bisect.bisect_right(top, cursor) if cursor is not None else 0
+    end = len(top) if limit is None else min(start + limit, len(top))
+    page = [build_comment_tree(index, index['comments'][comment_id]) for comment_id in top[start:end]]
+    next_cursor = top[end - 1] if page and end < len(top) else None
+    return page, next_cursor
+
+def add_comment(kind, thread_id, comment, parent_id=None):
+    """
+    Append a comment (or a reply to a top-level comment) to a thread.
+    Returns (stored comment, top-level count, total count), or None if the
+    parent isn't a top-level comment or the thread couldn't be saved.
+    """
+    with comment_thread_locked(kind, thread_id):
+        comments = load_comment_thread(kind, thread_id)
+        if parent_id is not None and not any(c.get('id') == parent_id and c.get('parent_id') is None
+                                             for c in comments):
+            return None
+        
+        new_comment = {
+            'id': allocate_id(f'{kind}:{thread_id}:comments',
+                              seed=lambda: max((c.get('id', 0) for c in comments), default=0)),
+            **comment,
+            'parent_id': parent_id
+        }
+        comments.append(new_comment)
+        if not save_comment_thread(kind, thread_id, comments):
+            return None
+    
+    top_level_count = sum(1 for c in comments if c.get('parent_id') is None)
+    return new_comment, top_level_count, len(comments)
+
+def comment_page_response(kind, thread_id):
+    """
+    JSON response for a thread's comments. Without parameters returns the
+    whole thread; with cursor and/or limit returns one page:
+    ?limit=20&cursor=<last top-level comment id>
+    """
+    if 'cursor' not in request.args and 'limit' not in request.args:
+        comments, _ = get_comment_page(kind, thread_id)
+        return jsonify({'success': True, 'comments': comments})
+    
+    limit = request.args.get('limit', type=int, default=COMMENT_PAGE_DEFAULT_LIMIT)
+    limit = max(1, min(limit, COMMENT_PAGE_MAX_LIMIT))
+    cursor = request.args.get('cursor', type=int)
+    if request.args.get('cursor') and cursor is None:
+        return jsonify({'success': False, 'error': 'Invalid cursor'}), 400
+    
+    comments, next_cursor = get_comment_page(kind, thread_id, cursor, limit)
+    return jsonify({
+        'success': True,
+        'comments': comments,
+        'limit': limit,
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
+    })
+
+# ==================== Relations ====================
+# Likes, saves, bookmarks, favorites and follows are (user, kind, object)
+# edges rather than one global flag on the record. A toggle appends a single
+# line to an append-only journal, which every process replays from its last
+# offset into per-object and per-user sets - no collection file is rewritten,
+# and "liked by me" for a page of records is one set lookup per kind.
+# Stored counts (likes_count, followers_count) only hold what predates the
+# edges; the count shown adds the object's edges on top.
+#
+# Edges are numbered in journal order as they are replayed, so every process
+# gives an edge the same sequence number; the compacting process replays the
+# rewritten journal too, like the others. Subject pages (event attendees) are
+# cut from a per-object list sorted by sequence number with a bisect, and
+# their cursor carries the username so it stays valid across a compaction.
+
+RELATIONS_JOURNAL = 'database/relations.journal'
+RELATIONS_LOCK = 'database/.relations.lock'
+RELATIONS_COMPACT_SLACK = 1000  # Superseded journal lines tolerated before compaction
+
+# Viewer flags per collection: flag -> (kind, record field the edge points at)
+RELATION_FLAGS = {
+    'posts': {'is_liked': ('post_like', 'id'), 'is_saved': ('post_save', 'id')},
+    'reels': {'is_liked': ('reel_like', 'id'), 'is_saved': ('reel_save', 'id'),
+              'is_following': ('follow', 'username')},
+    'events': {'is_bookmarked': ('event_bookmark', 'id'), 'is_attending': ('event_attend', 'id')},
+    'shop': {'is_favorite': ('product_favorite', 'id'), 'is_bookmarked': ('product_bookmark', 'id')},
+    'users': {'is_following': ('follow', 'username')}
+}
+
+# Edge-backed counters per collection: count field -> (kind, record field)
+RELATION_COUNTS = {
+    'posts': {'likes_count': ('post_like', 'id')},
+    'reels': {'likes_count': ('reel_like', 'id')},
+    'events': {'attendees_count': ('event_attend', 'id')},
+    'users': {'followers_count': ('follow', 'username')}
+}
+
+# Both maps keep edges in the order they were added; the value is the edge's
+# sequence number, which compaction uses to write them back in that order
+_relation_objects = {}  # (kind, object id) -> {username: seq}
+_relation_users = {}  # (kind, username) -> {object id: seq}
+_relation_edges = {}  # (kind, object id) -> [(seq, username)] sorted by seq
+_relations_seq = 0
+_relations_live = 0  # Edges currently on
+_relations_lines = 0  # Lines replayed from the journal
+_relations_offset = 0
+_relations_inode = None
+_relations_lock = threading.RLock()
+
+def _apply_relation(kind, username, object_id, on):
+    """Apply one journal entry to the in-memory maps"""
+    global _relations_live, _relations_seq
+    
+    usernames = _relation_objects.setdefault((kind, object_id), {})
+    if (username in usernames) == on:
+        return
+    if on:
+        _relations_seq += 1
+        usernames[username] = _relations_seq
+        _relation_users.setdefault((kind, username), {})[object_id] = _relations_seq
+        # New edges always have the highest sequence number, so this stays sorted
+        _relation_edges.setdefault((kind, object_id), []).append((_relations_seq, username))
+        _relations_live += 1
+    else:
+        seq = usernames.pop(username)
+        _relation_users.get((kind, username), {}).pop(object_id, None)
+        edges = _relation_edges[(kind, object_id)]
+        del edges[bisect.bisect_left(edges, (seq,))]
+        _relations_live -= 1
+
+def _sync_relations():
+    """Replay journal lines written since the last sync (by any process)"""
+    global _relations_offset, _relations_lines, _relations_live, _relations_inode, _relations_seq
+    
+    try:
+        stat = os.stat(RELATIONS_JOURNAL)
+        size, inode = stat.st_size, stat.st_ino
+    except OSError:
+        size, inode = 0, None
+    
+    with _relations_lock:
+        if inode != _relations_inode or size < _relations_offset:
+            # Journal was compacted (replaced) - replay from the start
+            _relation_objects.clear()
+            _relation_users.clear()
+            _relation_edges.clear()
+            _relations_live = 0
+            _relations_seq = 0
+            _relations_lines = 0
+            _relations_offset = 0
+            _relations_inode = inode
+        if size == _relations_offset:
+            return
+        
+        with open(RELATIONS_JOURNAL, 'r', encoding='utf-8') as f:
+            f.seek(_relations_offset)
+            for line in f:
+                if not line.endswith('\n'):
+                    break  # Partial line still being written
+                _relations_offset += len(line.encode('utf-8'))
+                _relations_lines += 1
+                try:
+                    entry = json.loads(line)
+                    _apply_relation(entry['kind'], entry['user'], entry['object'], entry['on'])
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    continue
+
+def _compact_relations():
+    """Rewrite the journal as one line per live edge, in the order the edges were added (journal lock held)"""
+    global _relations_inode
+    
+    with _relations_lock:
+        edges = sorted((seq, kind, username, object_id)
+                       for (kind, username), object_ids in _relation_users.items()
+                       for object_id, seq in object_ids.items())
+        temp_path = RELATIONS_JOURNAL + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for _, kind, username, object_id in edges:
+                f.write(json.dumps({'kind': kind, 'user': username, 'object': object_id, 'on': True}) + '\n')
+        os.replace(temp_path, RELATIONS_JOURNAL)
+        # Replay the new journal as the other workers will, so sequence numbers agree
+        _relations_inode = None
+        _sync_relations()
+
+def _write_relation(kind, username, object_id, on):
+    """Append an edge change if it changes anything (relations locks held)"""
+    if has_relation(kind, username, object_id) == on:
+        return
+    with open(RELATIONS_JOURNAL, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'kind': kind, 'user': username, 'object': object_id, 'on': on}) + '\n')
+    _sync_relations()
+    
+    if _relations_lines > 2 * _relations_live + RELATIONS_COMPACT_SLACK:
+        _compact_relations()
+
+def has_relation(kind, username, object_id):
+    """Check whether a user has an edge of a kind to an object"""
+    _sync_relations()
+    with _relations_lock:
+        return username in _relation_objects.get((kind, object_id), ())
+
+def get_relation_subjects(kind, object_id):
+    """Usernames with an edge of a kind to an object (e.g. a user's followers)"""
+    _sync_relations()
+    with _relations_lock:
+        return set(_relation_objects.get((kind, object_id), ()))
+
+def encode_relation_cursor(edge):
+    """Encode an edge (seq, username) as an opaque cursor"""
+    return base64.urlsafe_b64encode(json.dumps(list(edge)).encode('utf-8')).decode('ascii')
+
+def decode_relation_cursor(cursor):
+    """Decode a cursor back into an edge (seq, username), or None if invalid"""
+    try:
+        seq, username = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        if isinstance(seq, int) and not isinstance(seq, bool) and isinstance(username, str):
+            return (seq, username)
+    except (ValueError, TypeError, UnicodeError):
+        pass
+    return None
+
+def get_relation_subjects_page(kind, object_id, cursor=None, limit=50):
+    """
+    Users with an edge of a kind to an object, most recent first.
+    Returns (usernames, next_cursor); the cursor is the last edge shown, (seq, username).
+    """
+    _sync_relations()
+    with _relations_lock:
+        edges = _relation_edges.get((kind, object_id), [])
+        end = len(edges)
+        if cursor is not None:
+            seq, username = cursor
+            # The user's current number wins, in case the journal was compacted since
+            seq = _relation_objects.get((kind, object_id), {}).get(username, seq)
+            end = bisect.bisect_left(edges, (seq,))
+        start = max(0, end - limit)
+        page = edges[start:end][::-1]
+        next_cursor = encode_relation_cursor(page[-1]) if page and start > 0 else None
+        return [username for _, username in page], next_cursor
+
+def get_user_relations(kind, username):
+    """Ids of the objects a user has an edge of a kind to"""
+    _sync_relations()
+    with _relations_lock:
+        return set(_relation_users.get((kind, username), ()))
+
+def get_user_relation_order(kind, username):
+    """Ids of the objects a user has an edge of a kind to, most recent edge first"""
+    _sync_relations()
+    with _relations_lock:
+        return list(reversed(_relation_users.get((kind, username), {})))
+
+def count_relations(kind, object_id):
+    """Number of users with an edge of a kind to an object"""
+    _sync_relations()
+    with _relations_lock:
+        return len(_relation_objects.get((kind, object_id), ()))
+
+def set_relation(kind, username, object_id, on):
+    """Add or remove a user's edge to an object"""
+    with _relations_lock, _file_locked(RELATIONS_LOCK):
+        _sync_relations()
+        _write_relation(kind, username, object_id, on)
+    return on
+
+def toggle_relation(kind, username, object_id):
+    """Flip a user's edge to an object and return whether it is now on"""
+    with _relations_lock, _file_locked(RELATIONS_LOCK):
+        _sync_relations()
+        on = not has_relation(kind, username, object_id)
+        _write_relation(kind, username, object_id, on)
+    return on
+
+def mark_relations(records, collection, username):
+    """Set the viewer's relation flags and the edge-backed counts on records"""
+    _sync_relations()
+    with _relations_lock:
+        for flag, (kind, key_field) in RELATION_FLAGS.get(collection, {}).items():
+            object_ids = _relation_users.get((kind, username), {})
+            for record in records:
+                record[flag] = record.get(key_field) in object_ids
+        for field, (kind, key_field) in RELATION_COUNTS.get(collection, {}).items():
+            for record in records:
+                record[field] = record.get(field, 0) + len(_relation_objects.get((kind, record.get(key_field)), ()))
+    return records
+
+# ==================== Event Attendance ====================
+# Attendance is an event_attend edge (user -> event) in the relation store:
+# the per-event map gives is_attending and attendees_count, and the per-user
+# map is the "events I'm attending" index. Event pages render only the
+# newest EVENT_ATTENDEE_PREVIEW attendees and page through the rest.
+
+EVENT_ATTENDEE_PREVIEW = 12
+EVENT_ATTENDEES_PAGE_SIZE = 50
+EVENT_ATTENDEES_MAX_LIMIT = 200
+
+def get_event_attendees_page(event_id, cursor=None, limit=EVENT_ATTENDEES_PAGE_SIZE):
+    """One page of an event's attendees with their profile info, and the next cursor"""
+    usernames, next_cursor = get_relation_subjects_page('event_attend', event_id, cursor, limit)
+    users_by_name = {u.get('username'): u for u in load_users()} if usernames else {}
+    
+    attendees = []
+    for username in usernames:
+        user = users_by_name.get(username, {})
+        attendees.append({
+            'username': username,
+            'name': user.get('full_name', username),
+            'avatar': user.get('avatar', 'avatar-1.jpg'),
+            'user_id': user.get('id')
+        })
+    return attendees, next_cursor
+
+# ==================== Created-At Normalization ====================
+# created_at is normalized to a YYYY-MM-DD string when events and products are
+# written (and once at startup for older records). ISO dates sort the same as
+# strings, so listing pages derive is_new by comparing against a cached
+# "today" window instead of parsing every record's date on each request.
+
+NEW_ITEM_DAYS = 7
+CREATED_AT_FORMAT = '%Y-%m-%d'
+
+_new_item_window = {'date': None, 'today': None, 'new_since': None}
+
+def normalize_created_at(record, today_str=None):
+    """Ensure record['created_at'] is a valid YYYY-MM-DD string. Returns True if it changed."""
+    if today_str is None:
+        today_str = datetime.now().strftime(CREATED_AT_FORMAT)
+    
+    created_at = record.get('created_at')
+    normalized = today_str
+    if isinstance(created_at, str) and created_at.strip():
+        try:
+            # Accept full ISO timestamps as well as plain dates
+            normalized = datetime.strptime(created_at.strip()[:10], CREATED_AT_FORMAT).strftime(CREATED_AT_FORMAT)
+        except ValueError:
+            normalized = today_str
+    
+    if created_at != normalized:
+        record['created_at'] = normalized
+        return True
+    return False
+
+def get_new_item_window():
+    """Get (new_since, today) date strings, recomputed only when the day changes"""
+    today = datetime.now().date()
+    if _new_item_window['date'] != today:
+        _new_item_window['today'] = today.strftime(CREATED_AT_FORMAT)
+        _new_item_window['new_since'] = (today - timedelta(days=NEW_ITEM_DAYS)).strftime(CREATED_AT_FORMAT)
+        _new_item_window['date'] = today
+    return _new_item_window['new_since'], _new_item_window['today']
+
+def is_new_item(record):
+    """Check if a record was created within the last NEW_ITEM_DAYS days"""
+    new_since, today = get_new_item_window()
+    return new_since <= record.get('created_at', '') <= today
+
+def mark_new_items(records):
+    """Set is_new on each record from its normalized created_at"""
+    new_since, today = get_new_item_window()
+    for record in records:
+        record['is_new'] = new_since <= record.get('created_at', '') <= today
+    return records
+
+def migrate_created_at():
+    """One-time normalization of created_at for existing events and products"""
+    today_str = datetime.now().strftime(CREATED_AT_FORMAT)
+    
+    events = load_events()
+    if sum(normalize_created_at(e, today_str) for e in events):
+        save_events(events)
+    
+    products = load_shop()
+    if sum(normalize_created_at(p, today_str) for p in products):
+        save_shop(products)
+
+# ==================== Shop Indexes ====================
+# Products are indexed in memory by id, plus sorted (key, id) lists per
+# (category, field) for created_at, price and views. Category None holds the
+# whole catalog. Listing a category in any order is then a bisect and a slice.
+# save_shop rebuilds the index from the list it writes. Other workers notice
+# the change through the shop.json modification time.
+
+SHOP_INDEX_FIELDS = ('created_at', 'price', 'views')
+SHOP_SORTS = {
+    'newest': ('created_at', True),
+    'oldest': ('created_at', False),
+    'price_asc': ('price', False),
+    'price_desc': ('price', True),
+    'popular': ('views', True)
+}
+SHOP_PAGE_DEFAULT_LIMIT = 20
+SHOP_PAGE_MAX_LIMIT = 100
+
+_shop_index = None
+_shop_index_mtime = None
+
+def get_shop_sort_key(product, field):
+    """Get the index key of a product for a sortable field"""
+    if field == 'created_at':
+        return product.get('created_at', '')
+    try:
+        if field == 'price':
+            return float(product.get('price', 0) or 0)
+        return int(product.get(field, 0) or 0)
+    except (TypeError, ValueError):
+        return 0
+
+def build_shop_index(products):
+    """Build the product id map and sorted secondary indexes"""
+    by_id = {}
+    unsorted = {}
+    
+    for product in products:
+        product_id = product.get('id')
+        if product_id is None:
+            continue
+        by_id[product_id] = product
+        category = product.get('category') or None
+        for field in SHOP_INDEX_FIELDS:
+            entry = (get_shop_sort_key(product, field), product_id)
+            unsorted.setdefault((None, field), []).append(entry)
+            if category:
+                unsorted.setdefault((category, field), []).append(entry)
+    
+    return {
+        'products': by_id,
+        'sorted': {key: sorted(entries) for key, entries in unsorted.items()},
+        'categories': sorted({c for c, _ in unsorted if c})
+    }
+
+def set_shop_index(products):
+    """Replace the in-memory shop index after products were written"""
+    global _shop_index, _shop_index_mtime
+    _shop_index = build_shop_index(products)
+    try:
+        _shop_index_mtime = os.path.getmtime('database/shop.json')
+    except OSError:
+        _shop_index_mtime = None
+
+def get_shop_index():
+    """Get the shop index, rebuilding it if shop.json changed on disk"""
+    try:
+        mtime = os.path.getmtime('database/shop.json')
+    except OSError:
+        mtime = None
+    
+    if _shop_index is None or mtime != _shop_index_mtime:
+        set_shop_index(load_shop())
+    return _shop_index
+
+def encode_shop_cursor(entry):
+    """Encode an index entry (key, id) as an opaque cursor"""
+    return base64.urlsafe_b64encode(json.dumps(list(entry)).encode('utf-8')).decode('ascii')
+
+def decode_shop_cursor(cursor, sort='newest'):
+    """Decode a cursor back into an index entry of the sort's field, or None if invalid"""
+    try:
+        key, product_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (ValueError, TypeError, UnicodeError):
+        return None
+    # Keys must compare against the index entries: ISO strings for created_at, numbers otherwise
+    key_types = (str,) if SHOP_SORTS[sort][0] == 'created_at' else (int, float)
+    if isinstance(key, bool) or not isinstance(key, key_types):
+        return None
+    if isinstance(product_id, bool) or not isinstance(product_id, int):
+        return None
+    return (key, product_id)
+
+def query_shop_index(category=None, sort='newest', cursor=None, limit=SHOP_PAGE_DEFAULT_LIMIT):
+    """
+    Read one page of products from a sorted index.
+    Returns (products, next_cursor); next_cursor is None on the last page.
+    """
+    index = get_shop_index()
+    field, descending = SHOP_SORTS[sort]
+    entries = index['sorted'].get((category or None, field), [])
+    
+    if descending:
+        end = bisect.bisect_left(entries, cursor) if cursor else len(entries)
+        start = max(0, end - limit)
+        page = entries[start:end][::-1]
+        has_more = start > 0
+    else:
+        start = bisect.bisect_right(entries, cursor) if cursor else 0
+        page = entries[start:start + limit]
+        has_more = start + limit < len(entries)
+    
+    products = [index['products'][product_id] for _, product_id in page]
+    next_cursor = encode_shop_cursor(page[-1]) if page and has_more else None
+    return products, next_cursor
+
+def get_featured_shop_products():
+    """
+    Get all products in shop page order: new products first, then older and
+    future-dated ones, each by created_at - read straight off the recency index.
+    """
+    index = get_shop_index()
+    entries = index['sorted'].get((None, 'created_at'), [])
+    new_since, today = get_new_item_window()
+    
+    # created_at keys are ISO dates, so the new window is a contiguous slice
+    new_start = bisect.bisect_left(entries, (new_since,))
+    new_end = bisect.bisect_left(entries, (today + '\uffff',))
+    ordered = entries[new_start:new_end] + entries[:new_start] + entries[new_end:]
+    
+    return [index['products'][product_id] for _, product_id in ordered]
+
+# ==================== Event Indexes ====================
+# Events are indexed in memory by date - sorted (date, time, id) entries per
+# category, with category None holding every event - and by geohash cell for
+# events that have latitude/longitude. A from/to range is a bisect and a
+# slice. near= reads the cell containing the point and its eight neighbours
+# at the finest precision whose cells are at least the radius across, then
+# checks the exact distance. save_events rebuilds the index; other workers
+# notice the change through the events.json version.
+
+EVENT_GEOHASH_PRECISION = 6  # Finest cells indexed (~1.2km x 0.6km)
+EVENT_NEAR_DEFAULT_RADIUS_KM = 25
+EVENT_NEAR_MAX_RADIUS_KM = 1000
+EVENT_PAGE_DEFAULT_LIMIT = 20
+EVENT_PAGE_MAX_LIMIT = 100
+EARTH_RADIUS_KM = 6371.0
+GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+_event_index = None
+_event_index_version = None
+
+def encode_geohash(latitude, longitude, precision=EVENT_GEOHASH_PRECISION):
+    """Encode a point as a geohash string"""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits, bit_count, even = 0, 0, True
+    while len(chars) < precision:
+        # Bits alternate longitude, latitude, starting with longitude
+        value, value_range = (longitude, lon_range) if even else (latitude, lat_range)
+        mid = (value_range[0] + value_range[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            value_range[0] = mid
+        else:
+            bits <<= 1
+            value_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_BASE32[bits])
+            bits, bit_count = 0, 0
+    return ''.join(chars)
+
+def get_geohash_cell_size(precision):
+    """(latitude degrees, longitude degrees) spanned by a geohash cell"""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+def get_distance_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def parse_event_coordinates(latitude, longitude):
+    """Validate a latitude/longitude pair. Returns (lat, lon), None if both are empty; raises ValueError."""
+    if latitude in (None, '') and longitude in (None, ''):
+        return None
+    latitude, longitude = float(latitude), float(longitude)
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError('Coordinates out of range')
+    return latitude, longitude
+
+def get_event_coordinates(event):
+    """An event's (lat, lon), or None if it has no valid coordinates"""
+    try:
+        return parse_event_coordinates(event.get('latitude'), event.get('longitude'))
+    except (TypeError, ValueError):
+        return None
+
+def get_event_sort_entry(event):
+    """Date index entry of an event: (date, time, id)"""
+    return (str(event.get('date') or ''), str(event.get('time') or ''), event.get('id'))
+
+def build_event_index(events):
+    """Build the event id map, per-category date lists and geohash buckets"""
+    by_id = {}
+    by_date = {}
+    by_cell = {}
+    
+    for event in events:
+        event_id = event.get('id')
+        if event_id is None:
+            continue
+        by_id[event_id] = event
+        entry = get_event_sort_entry(event)
+        by_date.setdefault(None, []).append(entry)
+        if event.get('category'):
+            by_date.setdefault(event['category'], []).append(entry)
+        
+        coordinates = get_event_coordinates(event)
+        if coordinates:
+            geohash = encode_geohash(*coordinates)
+            for precision in range(1, EVENT_GEOHASH_PRECISION + 1):
+                by_cell.setdefault(geohash[:precision], []).append(event_id)
+    
+    return {
+        'events': by_id,
+        'by_date': {category: sorted(entries) for category, entries in by_date.items()},
+        'by_cell': by_cell
+    }
+
+def set_event_index(events):
+    """Replace the in-memory event index after events were written"""
+    global _event_index, _event_index_version
+    _event_index = build_event_index(events)
+    _event_index_version = get_collection_version('events')
+
+def get_event_index():
+    """Get the event index, rebuilding it if events.json changed on disk"""
+    if _event_index is None or get_collection_version('events') != _event_index_version:
+        set_event_index(load_events())
+    return _event_index
+
+def find_events_near(index, latitude, longitude, radius_km):
+    """{event id: distance in km} for indexed events within radius_km of a point"""
+    lat_span = radius_km / 111.32
+    lon_span = radius_km / max(111.32 * math.cos(math.radians(latitude)), 1e-6)
+    
+    # Finest precision whose cells cover the radius in both directions
+    precision = next((p for p in range(EVENT_GEOHASH_PRECISION, 0, -1)
+                      if get_geohash_cell_size(p)[0] >= lat_span and get_geohash_cell_size(p)[1] >= lon_span), None)
+    if precision is None:
+        candidates = index['events']  # Radius wider than any cell - check every event
+    else:
+        cell_lat, cell_lon = get_geohash_cell_size(precision)
+        cells = set()
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                lat = min(90.0, max(-90.0, latitude + dy * cell_lat))
+                lon = (longitude + dx * cell_lon + 180.0) % 360.0 - 180.0
+                cells.add(encode_geohash(lat, lon, precision))
+        candidates = {event_id for cell in cells for event_id in index['by_cell'].get(cell, [])}
+    
+    found = {}
+    for event_id in candidates:
+        coordinates = get_event_coordinates(index['events'][event_id])
+        if coordinates:
+            distance = get_distance_km(latitude, longitude, *coordinates)
+            if distance <= radius_km:
+                found[event_id] = distance
+    return found
+
+def encode_event_cursor(entry):
+    """Encode a date index entry (date, time, id) as an opaque cursor"""
+    return base64.urlsafe_b64encode(json.dumps(list(entry)).encode('utf-8')).decode('ascii')
+
+def decode_event_cursor(cursor):
+    """Decode a cursor back into a date index entry, or None if invalid"""
+    try:
+        date, time_of_day, event_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        if isinstance(date, str) and isinstance(time_of_day, str) and isinstance(event_id, int):
+            return (date, time_of_day, event_id)
+    except (ValueError, TypeError, UnicodeError):
+        pass
+    return None
+
+def query_event_index(date_from=None, date_to=None, category=None, near=None, radius_km=EVENT_NEAR_DEFAULT_RADIUS_KM,
+                      cursor=None, limit=EVENT_PAGE_DEFAULT_LIMIT):
+    """
+    Read one page of events by date (earliest first), optionally within a
+    date range, a category and radius_km of near=(lat, lon).
+    Returns (events, distances by id, next_cursor).
+    """
+    index = get_event_index()
+    
+    def get_range(entries):
+        # Dates are ISO strings, so the range is a contiguous slice
+        start = bisect.bisect_left(entries, (date_from,)) if date_from else 0
+        end = bisect.bisect_left(entries, (date_to + '\uffff',)) if date_to else len(entries)
+        if cursor:
+            start = max(start, bisect.bisect_right(entries, cursor))
+        return start, end
+    
+    entries = index['by_date'].get(category or None, [])
+    start, end = get_range(entries)
+    
+    distances = {}
+    if near:
+        distances = find_events_near(index, near[0], near[1], radius_km)
+        # The nearby set is small - take its entries in date order instead of walking the range
+        if len(distances) < end - start:
+            entries = sorted(get_event_sort_entry(index['events'][event_id]) for event_id in distances
+                             if not category or index['events'][event_id].get('category') == category)
+            start, end = get_range(entries)
+    
+    page = []
+    position = start
+    while position < end and len(page) < limit:
+        entry = entries[position]
+        if not near or entry[2] in distances:
+            page.append(entry)
+        position += 1
+    has_more = position < end and (not near or any(entry[2] in distances for entry in entries[position:end]))
+    
+    events = [index['events'][entry[2]] for entry in page]
+    next_cursor = encode_event_cursor(page[-1]) if page and has_more else None
+    return events, distances, next_cursor
+
 def login_required(f):
     """Decorator to require login for routes"""
     @wraps(f)
@@ -342,6 +1754,60 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# Counter increments and write-behind changes reach a collection file only at
+# the next flush, so each one also bumps the collection's pending generation,
+# which conditional_get adds to the tag. The generation is tagged with this
+# process, since another worker holds different pending changes.
+_process_token = uuid.uuid4().hex[:8]
+_pending_generations = {}  # collection -> generation of the last change held in memory
+_pending_generation_counter = itertools.count(1)
+
+def bump_pending_generation(collection):
+    """Note a change to a collection that is held in memory until a flush"""
+    _pending_generations[collection] = next(_pending_generation_counter)
+
+def get_pending_generation(collection):
+    """Token for the in-memory changes made to a collection in this process ('0' if none)"""
+    generation = _pending_generations.get(collection)
+    return f'{_process_token}:{generation}' if generation else '0'
+
+def conditional_get(*collections, daily=False):
+    """
+    Decorator adding a weak ETag to a JSON GET endpoint.
+    The tag is built from the versions of the collections the response is
+    computed from (including changes still held in memory), the current user
+    and the query string, so a matching If-None-Match gets a 304 before any
+    collection is loaded or serialized.
+    'notifications' refers to the current user's inbox. Set daily=True for
+    responses that change with the date (e.g. is_new flags).
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            username = session.get('username')
+            versions = [get_inbox_version(username) if name == 'notifications' and username
+                        else get_collection_version(name) if name in COLLECTION_FILES else '0'
+                        for name in collections]
+            versions.extend(get_pending_generation(name) for name in collections)
+            if daily:
+                versions.append(datetime.now().strftime(CREATED_AT_FORMAT))
+            state = json.dumps([request.endpoint, request.query_string.decode('utf-8', 'replace'),
+                                username, versions])
+            etag = hashlib.sha1(state.encode('utf-8')).hexdigest()[:20]
+            
+            if request.if_none_match.contains_weak(etag):
+                response = app.response_class(status=304)
+            else:
+                response = app.make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated_function
+    return decorator
+
 @app.context_processor
 def inject_user_avatar():
     """Inject user avatar into all templates - ensures avatar is in session for existing sessions"""
@@ -367,6 +1833,304 @@ def avatar_filename_filter(avatar_path):
         return avatar_path.split('\\')[-1]
     return avatar_path.split('/')[-1]
 
+# ==================== Profile Indexes ====================
+# Posts are indexed in memory by id plus a per-author list of ids in feed
+# order, so a profile grid reads only that user's rows instead of filtering
+# posts.json. Each post has a feed position (a sort key, lower is newer), so
+# a grid cursor is found with a bisect. When save_posts is told which posts
+# it changed, new posts are put at the front of the feed and their author's
+# list in place; otherwise the index is rebuilt from the list it writes.
+# Other workers notice the change through the posts.json version. Saved
+# grids are read from the user's post_save edges, most recently saved first.
+
+PROFILE_GRID_PAGE_SIZE = 24
+PROFILE_GRID_MAX_LIMIT = 96
+
+_post_index = None
+_post_index_version = None
+_post_index_sequence = 0  # Last sequence number handed out
+_post_author_sequences = {}  # author -> sequence number, bumped whenever their list of post ids changes
+
+def get_post_authors(post):
+    """Usernames a post is filed under (posts carry the author both at the top level and under 'user')"""
+    return {post.get('username'), post.get('user', {}).get('username')} - {None, ''}
+
+def build_post_index(posts):
+    """Build the post id map, feed order and positions, and per-author id lists"""
+    by_id = {}
+    ids = []
+    position = {}
+    by_author = {}
+    
+    for post in posts:
+        post_id = post.get('id')
+        if post_id is None:
+            continue
+        by_id[post_id] = post
+        position[post_id] = len(ids)
+        ids.append(post_id)
+        for author in get_post_authors(post):
+            by_author.setdefault(author, []).append(post_id)
+    
+    return {'posts': by_id, 'ids': ids, 'position': position, 'by_author': by_author}
+
+def get_author_sequence(author):
+    """Sequence number of an author's current list of post ids"""
+    return _post_author_sequences.get(author, 0)
+
+def _bump_author_sequences(authors):
+    """Mark the post lists of authors as changed"""
+    global _post_index_sequence
+    for author in authors:
+        _post_index_sequence += 1
+        _post_author_sequences[author] = _post_index_sequence
+
+def _index_new_post(index, post):
+    """Put a post created since the index was built at the front of the feed"""
+    post_id = post['id']
+    index['posts'][post_id] = post
+    index['position'][post_id] = index['position'][index['ids'][0]] - 1 if index['ids'] else 0
+    index['ids'].insert(0, post_id)
+    for author in get_post_authors(post):
+        index['by_author'].setdefault(author, []).insert(0, post_id)
+
+def _update_post_index(posts, changed_ids):
+    """
+    Apply a write of posts that changed only changed_ids to the current index.
+    Returns the number of new posts, or None if the write can't be applied in
+    place (new posts must be at the front and nothing removed).
+    """
+    changed = [post for post in posts if post.get('id') in changed_ids]
+    if len(changed) != len(changed_ids):
+        return None
+    new_posts = [post for post in changed if post['id'] not in _post_index['posts']]
+    if not all(post is front for post, front in zip(new_posts, posts)):
+        return None
+    
+    for post in reversed(new_posts):
+        _index_new_post(_post_index, post)
+    for post in changed:
+        _post_index['posts'][post['id']] = post
+    return len(new_posts)
+
+def set_post_index(posts, changed_ids=None, previous_version=None):
+    """
+    Bring the in-memory post index up to date after posts were written.
+    changed_ids names the posts the writer changed; if the index matched the
+    file it replaced (previous_version), only those are updated in place.
+    """
+    global _post_index, _post_index_version
+    
+    added = None
+    if changed_ids is not None and _post_index is not None and _post_index_version == previous_version:
+        added = _update_post_index(posts, set(changed_ids))
+    
+    if added is None:
+        index = build_post_index(posts)
+        if _post_index is not None:
+            # Count/comment updates keep an author's sequence, so timelines stay valid
+            old_by_author = _post_index['by_author']
+            _bump_author_sequences(author for author in set(old_by_author) | set(index['by_author'])
+                                   if old_by_author.get(author) != index['by_author'].get(author))
+        _post_index = index
+    elif added:
+        _bump_author_sequences({author for post in posts[:added] for author in get_post_authors(post)})
+    _post_index_version = get_collection_version('posts')
+
+def get_post_index():
+    """Get the post index, rebuilding it if posts.json changed on disk"""
+    if _post_index is None or get_collection_version('posts') != _post_index_version:
+        set_post_index(load_posts())
+    return _post_index
+
+def get_profile_grid(username, grid='posts', cursor=None, limit=PROFILE_GRID_PAGE_SIZE):
+    """
+    Read one page of a profile grid ('posts' by the user or 'saved' by the user).
+    Returns (copies of the posts, next_cursor); the cursor is the last post id shown.
+    """
+    index = get_post_index()
+    if grid == 'saved':
+        post_ids = [post_id for post_id in get_user_relation_order('post_save', username) if post_id in index['posts']]
+    else:
+        post_ids = index['by_author'].get(username, [])
+    
+    start = 0
+    if cursor is not None:
+        if grid == 'saved':
+            try:
+                start = post_ids.index(cursor) + 1
+            except ValueError:
+                start = len(post_ids)
+        elif cursor in index['position']:
+            # Author lists are in feed order, so the cursor's position is a bisect away
+            position = index['position']
+            start = bisect.bisect_right(post_ids, position[cursor], key=position.get)
+        else:
+            start = len(post_ids)
+    page = post_ids[start:start + limit]
+    next_cursor = page[-1] if page and start + limit < len(post_ids) else None
+    
+    # Copies - callers fill in per-viewer fields
+    return [dict(index['posts'][post_id]) for post_id in page], next_cursor
+
+# ==================== Home Timelines ====================
+# The home feed shows posts by the accounts a user follows (and their own),
+# newest first. Each reader's timeline is a capped list of post ids kept in
+# an LRU: create_post pushes the new id onto the cached timelines of the
+# author's followers (fan-out-on-write). Accounts with more followers than
+# TIMELINE_FANOUT_MAX_FOLLOWERS are not fanned out; their recent posts are
+# merged in when the feed is read (fan-out-on-read). A timeline records the
+# sequence number of each author's post list it was built from, and is
+# rebuilt from the per-author index when the user's follows or one of those
+# lists changed underneath it - posts by anyone else leave it alone. Users
+# who follow nobody get the global feed.
+
+TIMELINE_LENGTH = 500
+TIMELINE_FANOUT_MAX_FOLLOWERS = 1000
+TIMELINE_CACHE_SIZE = 1000
+
+_timelines = OrderedDict()  # username -> {'authors': {author: sequence}, 'following', 'pulled', 'ids'}
+_timelines_lock = threading.RLock()
+
+def is_fanout_author(username):
+    """Whether an author's posts are pushed to followers' timelines on write"""
+    return count_relations('follow', username) <= TIMELINE_FANOUT_MAX_FOLLOWERS
+
+def merge_post_ids(index, *id_lists):
+    """Merge post id lists into one deduplicated list in feed order, capped"""
+    position = index['position']
+    merged = []
+    seen = set()
+    ids = [post_id for id_list in id_lists for post_id in id_list if post_id in position]
+    for post_id in sorted(ids, key=position.get):
+        if post_id not in seen:
+            seen.add(post_id)
+            merged.append(post_id)
+            if len(merged) >= TIMELINE_LENGTH:
+                break
+    return merged
+
+def _build_timeline(username, following, pulled, index):
+    """Materialize a user's timeline from the per-author index"""
+    authors = (set(following) | {username}) - pulled
+    return merge_post_ids(index, *(index['by_author'].get(author, [])[:TIMELINE_LENGTH] for author in authors))
+
+def get_home_timeline(username):
+    """Post ids for a user's home feed, newest first"""
+    following = frozenset(get_user_relations('follow', username))
+    index = get_post_index()
+    if not following:
+        return index['ids'][:TIMELINE_LENGTH]
+    
+    pulled = frozenset(author for author in following if not is_fanout_author(author))
+    authors = (following | {username}) - pulled
+    with _timelines_lock:
+        entry = _timelines.get(username)
+        if (entry is None or entry['following'] != following or entry['pulled'] != pulled
+                or any(entry['authors'].get(author) != get_author_sequence(author) for author in authors)):
+            entry = {
+                'authors': {author: get_author_sequence(author) for author in authors},
+                'following': following,
+                'pulled': pulled,
+                'ids': _build_timeline(username, following, pulled, index)
+            }
+            _timelines[username] = entry
+        _timelines.move_to_end(username)
+        while len(_timelines) > TIMELINE_CACHE_SIZE:
+            _timelines.popitem(last=False)
+        ids = entry['ids']
+    
+    if not pulled:
+        return list(ids)
+    return merge_post_ids(index, ids, *(index['by_author'].get(author, [])[:TIMELINE_LENGTH] for author in pulled))
+
+def fan_out_post(post, previous_sequence):
+    """
+    Push a new post onto the cached timelines of its author and their followers.
+    previous_sequence is the author's sequence before the post was saved; only
+    timelines built from that list are updated, the rest are rebuilt on their
+    next read.
+    """
+    author = post.get('username')
+    if not author or not is_fanout_author(author):
+        return
+    
+    sequence = get_author_sequence(author)
+    recipients = get_relation_subjects('follow', author) | {author}
+    with _timelines_lock:
+        for username in recipients:
+            entry = _timelines.get(username)
+            if entry is None or entry['authors'].get(author) != previous_sequence:
+                continue
+            entry['ids'] = [post['id']] + entry['ids'][:TIMELINE_LENGTH - 1]
+            entry['authors'][author] = sequence
+
+# ==================== Fragment Cache ====================
+# Listing pages render each card through render_fragment(), which caches the
+# HTML per (template, record id, record version, viewer flags) in an LRU.
+# A record's version is a digest of its stored fields, memoized until its
+# collection file changes, so unchanged cards are never re-rendered. Fields
+# filled in per request (viewer flags, live counts) are left out of the
+# digest and passed as flags instead.
+
+FRAGMENT_CACHE_SIZE = 2000
+FRAGMENT_VIEWER_FIELDS = {'is_liked', 'is_saved', 'is_new', 'is_attending', 'likes_count', 'shares_count', 'views',
+                          'attendees_count'}
+
+# template -> (collection the record comes from, variable name in the template)
+FRAGMENT_TEMPLATES = {
+    'posts/post_card.html': ('posts', 'post'),
+    'profile/post_tile.html': ('posts', 'post'),
+    'shop/product_card.html': ('shop', 'product'),
+    'events/event_card.html': ('events', 'event')
+}
+
+_fragment_cache = OrderedDict()  # (collection, template, id, version, flags) -> Markup
+_record_versions = {}  # (collection, id) -> (collection version, digest)
+_fragment_lock = threading.Lock()
+
+def get_record_version(collection, record):
+    """Digest of a record's stored fields (per-request fields excluded)"""
+    collection_version = get_collection_version(collection)
+    key = (collection, record.get('id'))
+    cached = _record_versions.get(key)
+    if cached and cached[0] == collection_version:
+        return cached[1]
+    
+    stored = {k: v for k, v in record.items() if k not in FRAGMENT_VIEWER_FIELDS}
+    digest = hashlib.sha1(json.dumps(stored, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+    _record_versions[key] = (collection_version, digest)
+    return digest
+
+@app.template_global()
+def render_fragment(template_name, record, **flags):
+    """Render a card template for a record, reusing cached HTML when nothing changed"""
+    collection, name = FRAGMENT_TEMPLATES[template_name]
+    key = (collection, template_name, record.get('id'),
+           get_record_version(collection, record), tuple(sorted(flags.items())))
+    
+    with _fragment_lock:
+        html = _fragment_cache.get(key)
+        if html is not None:
+            _fragment_cache.move_to_end(key)
+            return html
+    
+    html = Markup(render_template(template_name, **{name: record}, **flags))
+    
+    with _fragment_lock:
+        _fragment_cache[key] = html
+        while len(_fragment_cache) > FRAGMENT_CACHE_SIZE:
+            _fragment_cache.popitem(last=False)
+    return html
+
+def invalidate_fragments(collection):
+    """Drop cached cards and record versions for a collection after it is saved"""
+    with _fragment_lock:
+        for key in [k for k in _fragment_cache if k[0] == collection]:
+            del _fragment_cache[key]
+        for key in [k for k in _record_versions if k[0] == collection]:
+            del _record_versions[key]
+
 @app.before_request
 def require_login():
     """Require login for all routes except login, register, logout, and static files"""
@@ -381,20 +2145,230 @@ def require_login():
         request.path.startswith('/database/')):
         return None
     
-    # Require login for all other routes
-    if 'user_id' not in session:
-        # Store the requested URL to redirect after login
-        if request.endpoint and request.endpoint not in ['login', 'register', 'logout']:
-            return redirect(url_for('login', next=request.url))
-        return redirect(url_for('login'))
-    
+    # Require login for all other routes
+    if 'user_id' not in session:
+        # Store the requested URL to redirect after login
+        if request.endpoint and request.endpoint not in ['login', 'register', 'logout']:
+            return redirect(url_for('login', next=request.url))
+        return redirect(url_for('login'))
+    
+    
+    return None
+
+# ==================== Response Compression ====================
+# Dynamic text responses above COMPRESS_MIN_SIZE are compressed with brotli
+# (when installed) or gzip, depending on the client's Accept-Encoding.
+# Static files are served from precompressed .br/.gz siblings built by
+# `flask --app app precompress-static`; files without a fresh sibling are
+# served as-is.
+
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_GZIP_LEVEL = 6
+COMPRESS_BROTLI_QUALITY = 5
+COMPRESSIBLE_MIMETYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/javascript', 'text/xml',
+    'application/javascript', 'application/json', 'application/xml', 'image/svg+xml'
+}
+PRECOMPRESS_EXTENSIONS = {'.css', '.js', '.map', '.svg', '.txt', '.json', '.ttf', '.html'}
+
+def get_accepted_encodings(available=None):
+    """Available content encodings the client accepts, in its order of preference"""
+    if available is None:
+        available = ['br', 'gzip'] if brotli else ['gzip']
+    accepted = [e for e in available if request.accept_encodings[e]]
+    return sorted(accepted, key=lambda e: request.accept_encodings[e], reverse=True)
+
+@app.after_request
+def compress_response(response):
+    """Compress dynamic text responses according to Accept-Encoding"""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    
+    encodings = get_accepted_encodings()
+    if not encodings:
+        return response
+    
+    if encodings[0] == 'br':
+        response.set_data(brotli.compress(data, quality=COMPRESS_BROTLI_QUALITY))
+    else:
+        response.set_data(gzip.compress(data, compresslevel=COMPRESS_GZIP_LEVEL))
+    response.headers['Content-Encoding'] = encodings[0]
+    return response
+
+def _send_static_variant(filename):
+    """Send a static file, preferring a fresh precompressed .br/.gz sibling"""
+    path = os.path.join(app.static_folder, filename)
+    mimetype = mimetypes.guess_type(filename)[0]
+    
+    if mimetype in COMPRESSIBLE_MIMETYPES or os.path.splitext(filename)[1] in PRECOMPRESS_EXTENSIONS:
+        # Prebuilt .br siblings can be served even if brotli isn't installed here
+        for encoding in get_accepted_encodings(['br', 'gzip']):
+            suffix = '.br' if encoding == 'br' else '.gz'
+            try:
+                if os.path.getmtime(path + suffix) < os.path.getmtime(path):
+                    continue  # Stale sibling - original changed after precompressing
+            except OSError:
+                continue
+            response = send_from_directory(app.static_folder, filename + suffix, mimetype=mimetype,
+                                           max_age=app.get_send_file_max_age(filename))
+            response.headers['Content-Encoding'] = encoding
+            response.vary.add('Accept-Encoding')
+            return response
+    
+    response = app.send_static_file(filename)
+    response.vary.add('Accept-Encoding')
+    return response
+
+@app.cli.command('precompress-static')
+def precompress_static():
+    """Write .gz (and .br when brotli is installed) siblings for static text assets"""
+    written = 0
+    for root, _, files in os.walk(app.static_folder):
+        for name in files:
+            if os.path.splitext(name)[1] not in PRECOMPRESS_EXTENSIONS or STATIC_EXCLUDE_PATTERN.search(name):
+                continue
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                data = f.read()
+            
+            siblings = [('.gz', lambda d: gzip.compress(d, compresslevel=9, mtime=0))]
+            if brotli:
+                siblings.append(('.br', lambda d: brotli.compress(d, quality=11)))
+            for suffix, compress in siblings:
+                compressed = compress(data)
+                if len(compressed) >= len(data):
+                    continue  # Not worth serving
+                with open(path + suffix, 'wb') as f:
+                    f.write(compressed)
+                written += 1
+    print(f"Precompressed {written} static files")
+
+# ==================== Static Asset Fingerprinting ====================
+# Templates reference static files through asset_url(), which inserts a content
+# hash into the filename (css/custom-theme.css -> css/custom-theme.<hash>.css).
+# Hashes come from a manifest (static/asset-manifest.json when built with
+# `flask --app app build-assets`) and are recomputed when a file's mtime changes.
+# Fingerprinted URLs are served with immutable far-future caching. Bootstrap
+# variants the app never uses (RTL, ESM) are not served, nor are source maps
+# outside debug mode.
+
+ASSET_MANIFEST_FILE = 'asset-manifest.json'
+ASSET_HASH_LENGTH = 10
+ASSET_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+FINGERPRINTED_PATTERN = re.compile(r'^(.+)\.([0-9a-f]{%d})(\.[^./]+)$' % ASSET_HASH_LENGTH)
+STATIC_EXCLUDE_PATTERN = re.compile(r'\.(rtl|esm)(\.min)?\.(css|js)(\.map)?$')
+
+_asset_manifest = {}  # path -> {'hash': ..., 'mtime': ...}
+_asset_manifest_lock = threading.Lock()
+
+def is_static_excluded(filename):
+    """Check if a static file is deliberately not served"""
+    if STATIC_EXCLUDE_PATTERN.search(filename):
+        return True
+    return filename.endswith('.map') and not app.debug
+
+def hash_static_file(path):
+    """Content hash of a file for its fingerprinted name"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:ASSET_HASH_LENGTH]
+
+def load_asset_manifest():
+    """Load the prebuilt asset manifest, if any"""
+    try:
+        with open(os.path.join(app.static_folder, ASSET_MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f).get('assets', {})
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def get_asset_hash(filename):
+    """Get the current content hash of a static file (None if it doesn't exist)"""
+    path = os.path.join(app.static_folder, filename)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    
+    entry = _asset_manifest.get(filename)
+    if entry and entry['mtime'] == mtime:
+        return entry['hash']
+    
+    file_hash = hash_static_file(path)
+    with _asset_manifest_lock:
+        _asset_manifest[filename] = {'hash': file_hash, 'mtime': mtime}
+    return file_hash
+
+@app.template_global()
+def asset_url(filename):
+    """URL of a static file with its content hash in the name"""
+    file_hash = get_asset_hash(filename)
+    if not file_hash:
+        return url_for('static', filename=filename)
+    base, ext = os.path.splitext(filename)
+    return url_for('static', filename=f'{base}.{file_hash}{ext}')
+
+@app.cli.command('build-assets')
+def build_assets():
+    """Hash every servable static file into the asset manifest"""
+    assets = {}
+    for root, _, files in os.walk(app.static_folder):
+        for name in files:
+            path = os.path.join(root, name)
+            filename = os.path.relpath(path, app.static_folder).replace(os.sep, '/')
+            if (filename == ASSET_MANIFEST_FILE or is_static_excluded(filename)
+                    or os.path.splitext(name)[1] in ('.gz', '.br')):
+                continue
+            assets[filename] = {'hash': hash_static_file(path), 'mtime': os.stat(path).st_mtime_ns}
     
-    return None
+    with open(os.path.join(app.static_folder, ASSET_MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump({'assets': assets}, f, indent=2, sort_keys=True)
+    print(f"Wrote manifest for {len(assets)} static files")
+
+_asset_manifest.update(load_asset_manifest())
+
+def serve_static(filename):
+    """
+    Serve a static file. Fingerprinted names map back to the real file and get
+    immutable caching; a fresh precompressed .br/.gz sibling is preferred.
+    """
+    immutable = False
+    if not os.path.isfile(os.path.join(app.static_folder, filename)):
+        match = FINGERPRINTED_PATTERN.match(filename)
+        if match:
+            filename = match.group(1) + match.group(3)
+            # Only promise immutability if the hash still matches the content
+            immutable = get_asset_hash(filename) == match.group(2)
+    
+    if is_static_excluded(filename):
+        abort(404)
+    
+    response = _send_static_variant(filename)
+    if immutable:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = ASSET_IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    return response
+
+app.view_functions['static'] = serve_static
 
 @app.route('/')
 def home():
-    # Load posts from database
-    posts = load_posts()
+    # Read the user's home timeline (copies - viewer fields are filled in below)
+    current_username = session.get('username')
+    post_index = get_post_index()
+    posts = [dict(post_index['posts'][post_id]) for post_id in get_home_timeline(current_username)]
+    mark_relations(posts, 'posts', current_username)
+    apply_pending_counts(posts, 'posts')
     
     # Check if we need to highlight a specific post
     post_id = request.args.get('post')
@@ -410,6 +2384,10 @@ def home():
                     highlight_post_id = post_id
                     scroll_to_post = True
                     break
+            else:
+                # Not in this user's timeline - show it on its own page
+                if post_id in post_index['posts']:
+                    return redirect(url_for('view_post', post_id=post_id))
         except (ValueError, TypeError):
             pass
     
@@ -435,6 +2413,9 @@ def view_post(post_id):
         # Post not found, redirect to home
         return redirect(url_for('home'))
     
+    mark_relations([target_post], 'posts', session.get('username'))
+    apply_pending_counts([target_post], 'posts')
+    
     # Render single post view
     return render_template('post_view.html', post=target_post)
 
@@ -530,7 +2511,7 @@ def register():
         users = load_users()
         
         # Generate new user ID
-        new_id = max([u.get('id', 0) for u in users], default=0) + 1
+        new_id = allocate_id('users')
         
         # Hash password
         password_hash = generate_password_hash(password)
@@ -555,7 +2536,6 @@ def register():
             'posts_count': 0,
             'followers_count': 0,
             'following_count': 0,
-            'is_following': False,
             'is_verified': False,
             'joined_date': datetime.now().strftime('%Y-%m-%d')
         }
@@ -588,15 +2568,17 @@ def logout():
     return redirect(url_for('login'))
 
 @app.route('/api/posts')
+@conditional_get('posts', 'relations')
 def api_posts():
     """API endpoint to get all posts"""
-    posts = load_posts()
-    return jsonify(posts)
+    posts = mark_relations(load_posts(), 'posts', session.get('username'))
+    return jsonify(apply_pending_counts(posts, 'posts'))
 
 @app.route('/api/posts/create', methods=['POST'])
 @login_required
 def create_post():
     """Create a new post"""
+    filename = None
     try:
         # Check if user is logged in
         if 'user_id' not in session:
@@ -616,17 +2598,9 @@ def create_post():
         if not allowed_file(file.filename):
             return jsonify({'success': False, 'error': 'Invalid file type'}), 400
         
-        # Generate unique filename
+        # Store file in the content-addressed media store
         file_ext = file.filename.rsplit('.', 1)[1].lower()
-        filename = f"{uuid.uuid4()}.{file_ext}"
-        
-        # Ensure posts directory exists
-        posts_dir = os.path.join('static', 'images', 'posts')
-        os.makedirs(posts_dir, exist_ok=True)
-        
-        # Save file
-        filepath = os.path.join(posts_dir, filename)
-        file.save(filepath)
+        filename = store_media_file(file, file_ext)
         
         # Load existing posts
         posts = load_posts()
@@ -641,7 +2615,7 @@ def create_post():
         user_avatar = f"/database/avatars/{user['avatar']}" if user else '/database/avatars/avatar-1.jpg'
         
         # Generate new post ID
-        new_id = max([p['id'] for p in posts], default=0) + 1
+        new_id = allocate_id('posts')
         
         # Create new post object
         from datetime import datetime
@@ -654,21 +2628,21 @@ def create_post():
                 'avatar': user_avatar,
                 'username': current_username
             },
-            'image': f'/static/images/posts/{filename}',
+            'image': f'/database/posts/{filename}',
             'caption': caption,
             'likes_count': 0,
             'comments_count': 0,
             'shares_count': 0,
             'time': 'Just now',
             'timestamp': datetime.now().isoformat(),
-            'is_liked': False,
-            'is_saved': False,
             'allow_comments': request.form.get('allow_comments', 'on') == 'on',
             'show_like_count': request.form.get('show_like_count', 'on') == 'on'
         }
         
         # Add to beginning of posts list
         posts.insert(0, new_post)
+        get_post_index()  # Sync first, so the sequence describes posts.json as it is now
+        previous_sequence = get_author_sequence(current_username)
         
         # Update user's post count
         if user:
@@ -681,7 +2655,8 @@ def create_post():
             save_users(users)
         
         # Save posts
-        save_posts(posts)
+        save_posts(posts, [new_id])
+        fan_out_post(new_post, previous_sequence)
         
         return jsonify({
             'success': True,
@@ -690,29 +2665,25 @@ def create_post():
         })
         
     except Exception as e:
+        release_media_file(filename)
         print(f"Error creating post: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/posts/<int:post_id>/like', methods=['POST'])
 def toggle_like(post_id):
-    """Toggle like status for a post"""
+    """Toggle the current user's like on a post"""
     posts = load_posts()
     target_post = None
     
     for post in posts:
         if post['id'] == post_id:
             target_post = post
-            # Toggle like status
-            post['is_liked'] = not post.get('is_liked', False)
-            # Update like count
-            if post['is_liked']:
-                post['likes_count'] = post.get('likes_count', 0) + 1
-            else:
-                post['likes_count'] = max(0, post.get('likes_count', 0) - 1)
             break
     
     if target_post:
-        save_posts(posts)
+        current_username = session.get('username')
+        toggle_relation('post_like', current_username, post_id)
+        mark_relations([target_post], 'posts', current_username)
         return jsonify({
             'success': True, 
             'is_liked': target_post.get('is_liked', False),
@@ -723,19 +2694,18 @@ def toggle_like(post_id):
 
 @app.route('/api/posts/<int:post_id>/save', methods=['POST'])
 def toggle_save(post_id):
-    """Toggle save status for a post"""
+    """Toggle the current user's save of a post"""
     posts = load_posts()
     target_post = None
     
     for post in posts:
         if post['id'] == post_id:
             target_post = post
-            post['is_saved'] = not post.get('is_saved', False)
             break
     
     if target_post:
-        save_posts(posts)
-        return jsonify({'success': True, 'is_saved': target_post.get('is_saved', False)})
+        is_saved = toggle_relation('post_save', session.get('username'), post_id)
+        return jsonify({'success': True, 'is_saved': is_saved})
     else:
         return jsonify({'success': False, 'error': 'Post not found'}), 404
 
@@ -748,8 +2718,6 @@ def get_share_link(post_id):
     for post in posts:
         if post.get('id') == post_id:
             target_post = post
-            # Increment share count when share link is requested
-            post['shares_count'] = post.get('shares_count', 0) + 1
             break
     
     if not target_post:
@@ -758,8 +2726,9 @@ def get_share_link(post_id):
     # Generate the shareable link
     share_link = request.url_root.rstrip('/') + url_for('view_post', post_id=post_id)
     
-    # Save posts to persist the updated share count
-    save_posts(posts)
+    # Increment share count when share link is requested (flushed to posts.json in the background)
+    increment_counter('posts', post_id, 'shares_count')
+    apply_pending_counts([target_post], 'posts')
     
     return jsonify({
         'success': True,
@@ -770,7 +2739,7 @@ def get_share_link(post_id):
 
 @app.route('/api/posts/<int:post_id>/comments', methods=['GET'])
 def get_post_comments(post_id):
-    """Get comments for a post"""
+    """Get comments for a post (see comment_page_response for paging)"""
     posts = load_posts()
     target_post = None
     
@@ -780,8 +2749,7 @@ def get_post_comments(post_id):
             break
     
     if target_post:
-        comments = target_post.get('comments', [])
-        return jsonify({'success': True, 'comments': comments})
+        return comment_page_response('post', post_id)
     else:
         return jsonify({'success': False, 'error': 'Post not found'}), 404
 
@@ -808,83 +2776,35 @@ def post_comment(post_id):
     for post in posts:
         if post['id'] == post_id:
             target_post = post
-            # Initialize comments array if it doesn't exist
-            if 'comments' not in post:
-                post['comments'] = []
-            
-            # Generate new comment ID
-            all_comment_ids = []
-            def get_all_comment_ids(comments):
-                for comment in comments:
-                    all_comment_ids.append(comment.get('id', 0))
-                    if 'replies' in comment and comment['replies']:
-                        get_all_comment_ids(comment['replies'])
-            
-            get_all_comment_ids(post['comments'])
-            new_comment_id = max(all_comment_ids, default=0) + 1
-            
-            # Add new comment
-            new_comment = {
-                'id': new_comment_id,
-                'username': 'current_user',  # In production, get from session
-                'text': comment_text,
-                'time_ago': 'Just now',
-                'avatar': 'avatar-2.jpg',
-                'replies': []
-            }
-            
-            if parent_id is not None:
-                # This is a reply to an existing comment
-                # Only allow replies to top-level comments (not to replies)
-                def find_top_level_comment(comments, parent_id):
-                    for comment in comments:
-                        # Compare IDs as integers to handle type mismatches
-                        comment_id = comment.get('id')
-                        if comment_id is not None:
-                            # Convert to int for comparison
-                            try:
-                                comment_id = int(comment_id)
-                                if comment_id == parent_id:
-                                    # Found the parent comment at top level
-                                    return comment
-                            except (ValueError, TypeError):
-                                pass
-                    return None
-                
-                parent_comment = find_top_level_comment(post['comments'], parent_id)
-                if parent_comment:
-                    # Add reply to top-level comment
-                    if 'replies' not in parent_comment:
-                        parent_comment['replies'] = []
-                    parent_comment['replies'].append(new_comment)
-                else:
-                    return jsonify({'success': False, 'error': 'Parent comment not found or cannot reply to replies'}), 404
-            else:
-                # This is a top-level comment
-                post['comments'].append(new_comment)
-            
-            # Update comment count (only count top-level comments, not replies)
-            # Replies are visible but not counted
-            # Ensure count is accurate by recalculating from actual comments array
-            post['comments_count'] = len(post.get('comments', []))
             break
     
-    if target_post:
-        # Save posts to database
-        save_result = save_posts(posts)
-        if not save_result:
-            print(f"Warning: Failed to save posts after adding comment/reply to post {post_id}")
-            # Still return success since the comment was added to memory
-            # In production, you might want to return an error here
-        
-        return jsonify({
-            'success': True, 
-            'comment': new_comment, 
-            'comments_count': target_post.get('comments_count', 0),
-            'parent_id': parent_id if parent_id is not None else None
-        })
-    else:
+    if not target_post:
         return jsonify({'success': False, 'error': 'Post not found'}), 404
+    
+    # Only allow replies to top-level comments (not to replies)
+    added = add_comment('post', post_id, {
+        'username': 'current_user',  # In production, get from session
+        'text': comment_text,
+        'time_ago': 'Just now',
+        'avatar': 'avatar-2.jpg'
+    }, parent_id)
+    if added is None:
+        if parent_id is not None:
+            return jsonify({'success': False, 'error': 'Parent comment not found or cannot reply to replies'}), 404
+        return jsonify({'success': False, 'error': 'Failed to save comment'}), 500
+    new_comment, comments_count, _ = added
+    
+    # Comment count (top-level comments only - replies are visible but not counted)
+    # is a cached figure on the post, so it is written behind the request
+    queue_record_update('posts', post_id, lambda post: post.update(comments_count=comments_count),
+                        key='comments_count')
+    
+    return jsonify({
+        'success': True, 
+        'comment': {**new_comment, 'replies': []}, 
+        'comments_count': comments_count,
+        'parent_id': parent_id if parent_id is not None else None
+    })
 
 @app.route('/notifications')
 @login_required
@@ -894,19 +2814,14 @@ def notifications():
     if not current_username:
         return redirect(url_for('login'))
     
-    all_notifications = load_notifications()
-    # Filter notifications for current user
-    user_notifications = [
-        n for n in all_notifications 
-        if n.get('target_user') == current_username or (not n.get('target_user') and n.get('user') != current_username)
-    ]
-    return render_template('notifications.html', notifications=user_notifications)
+    return render_template('notifications.html', notifications=load_user_notifications(current_username))
 
 @app.route('/api/notifications')
+@login_required
+@conditional_get('notifications')
 def api_notifications():
-    """API endpoint to get all notifications"""
-    notifications = load_notifications()
-    return jsonify(notifications)
+    """API endpoint to get the current user's notifications"""
+    return jsonify(load_user_notifications(session.get('username')))
 
 @app.route('/api/notifications/<int:notification_id>/read', methods=['POST'])
 @login_required
@@ -916,33 +2831,34 @@ def mark_notification_read(notification_id):
     if not current_username:
         return jsonify({'success': False, 'error': 'Unauthorized'}), 401
     
-    notifications = load_notifications()
-    target_notification = None
-    
-    for notification in notifications:
-        if notification['id'] == notification_id:
-            # Verify this notification belongs to the current user
-            if (notification.get('target_user') == current_username or 
-                (not notification.get('target_user') and notification.get('user') != current_username)):
-                target_notification = notification
-                notification['is_read'] = True
-                break
+    with _file_locked(NOTIFICATIONS_LOCK):
+        # Only the current user's inbox is searched, so ownership is implied
+        notifications = load_user_notifications(current_username)
+        target_notification = next((n for n in notifications if n.get('id') == notification_id), None)
+        
+        if target_notification:
+            if not target_notification.get('is_read', False):
+                target_notification['is_read'] = True
+                save_user_notifications(current_username, notifications)
+            return jsonify({'success': True, 'is_read': True})
     
-    if target_notification:
-        save_notifications(notifications)
-        return jsonify({'success': True, 'is_read': True})
-    else:
-        return jsonify({'success': False, 'error': 'Notification not found'}), 404
+    return jsonify({'success': False, 'error': 'Notification not found'}), 404
 
 @app.route('/api/notifications/read-all', methods=['POST'])
+@login_required
 def mark_all_notifications_read():
-    """Mark all notifications as read"""
-    notifications = load_notifications()
-    
-    for notification in notifications:
-        notification['is_read'] = True
+    """Mark all of the current user's notifications as read"""
+    current_username = session.get('username')
+    if not current_username:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
     
-    save_notifications(notifications)
+    with _file_locked(NOTIFICATIONS_LOCK):
+        notifications = load_user_notifications(current_username)
+        
+        for notification in notifications:
+            notification['is_read'] = True
+        
+        save_user_notifications(current_username, notifications)
     return jsonify({'success': True, 'read_count': len(notifications)})
 
 @app.route('/api/notifications/unread-count')
@@ -953,18 +2869,7 @@ def get_unread_notifications_count():
     if not current_username:
         return jsonify({'unread_count': 0, 'reply_count': 0})
     
-    notifications = load_notifications()
-    # Filter notifications for current user
-    user_notifications = [
-        n for n in notifications 
-        if (n.get('target_user') == current_username or (not n.get('target_user') and n.get('user') != current_username))
-        and not n.get('is_read', False)
-    ]
-    unread_count = len(user_notifications)
-    
-    # Count reply notifications specifically
-    reply_count = sum(1 for n in user_notifications if n.get('type') == 'group_reply')
-    
+    unread_count, reply_count = count_unread_notifications(load_user_notifications(current_username))
     return jsonify({'unread_count': unread_count, 'reply_count': reply_count})
 
 @app.route('/api/messages/unread-count')
@@ -975,68 +2880,168 @@ def get_unread_messages_count():
     if not current_username or not validate_username(current_username):
         return jsonify({'unread_count': 0})
     
-    all_conversations = load_messages()
-    unread_chat_count = 0
+    return jsonify({'unread_count': count_unread_chats(current_username)})
+
+# ==================== Header Badges ====================
+# base.html fetches every header counter from /api/badges in one request.
+# Each counter is cached and tagged with the version of the collection it was
+# computed from. A counter is recomputed only when that collection's file
+# changes (which also catches writes from other workers). Results are cached
+# per user for BADGE_CACHE_TTL_SECONDS, so repeated navigation does no work.
+#
+# Unread counters are updated by the writes themselves: saving an inbox
+# counts the list it just wrote, and saving messages adjusts each cached
+# unread-chat count by the conversations that changed, so only another
+# worker's write makes a counter rescan. Both caches are LRUs of
+# BADGE_CACHE_SIZE entries.
+
+BADGE_CACHE_TTL_SECONDS = 5
+BADGE_CACHE_SIZE = 1000
+
+COLLECTION_FILES = {
+    'posts': 'database/posts.json',
+    'events': 'database/events.json',
+    'shop': 'database/shop.json',
+    'reels': 'database/reels.json',
+    'users': 'database/users.json',
+    'messages': 'database/messages.json',
+    'groups': 'database/groups.json',
+    'relations': 'database/relations.journal'
+}
+
+_badge_cache = OrderedDict()  # username -> {'expires': ts, 'badges': {...}}
+_badge_parts = OrderedDict()  # (part, username or None) -> (version, value)
+_badge_lock = threading.Lock()
+
+def get_file_version(path):
+    """Version token for a file - changes whenever it is rewritten"""
+    try:
+        st = os.stat(path)
+        return f"{st.st_mtime_ns:x}-{st.st_size:x}"
+    except OSError:
+        return '0'
+
+def get_collection_version(name):
+    """Version token for a JSON collection - changes whenever its file is rewritten"""
+    return get_file_version(COLLECTION_FILES[name])
+
+def count_unread_notifications(notifications):
+    """Count (unread, group reply) notifications in an inbox"""
+    unread = [n for n in notifications if not n.get('is_read', False)]
+    reply_count = sum(1 for n in unread if n.get('type') == 'group_reply')
+    return len(unread), reply_count
+
+def count_unread_chats(username):
+    """Count chats with unread messages for a user (1 per chat, not total messages)"""
+    return sum(1 for summary in load_conversation_summaries().values()
+               if summary_includes_user(summary, username) and get_summary_unread_count(summary, username) > 0)
+
+def count_new_today(records):
+    """Count records created today (created_at is normalized at write time)"""
+    _, today = get_new_item_window()
+    return sum(1 for record in records if record.get('created_at') == today)
+
+def _remember_badge_entry(cache, key, value):
+    """Store a badge cache entry as the most recently used, evicting the oldest"""
+    with _badge_lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > BADGE_CACHE_SIZE:
+            cache.popitem(last=False)
+
+def set_badge_part(part, username, source_version, value):
+    """Store a badge counter computed by a write from the data it wrote"""
+    _, today = get_new_item_window()
+    _remember_badge_entry(_badge_parts, (part, username), ((source_version, today), value))
+
+def _get_badge_part(part, username, source_version, compute):
+    """Return a cached badge counter, recomputing it only if its source changed"""
+    _, today = get_new_item_window()
+    version = (source_version, today)
+    with _badge_lock:
+        cached = _badge_parts.get((part, username))
+        if cached and cached[0] == version:
+            _badge_parts.move_to_end((part, username))
+            return cached[1]
+    value = compute()
+    _remember_badge_entry(_badge_parts, (part, username), (version, value))
+    return value
+
+def update_unread_chat_badges(previous_version, messages_version, previous, summaries, conv_ids):
+    """
+    Carry cached unread-chat counters from the messages version before a write
+    to the one after it, adjusting them only for the conversations in conv_ids.
+    """
+    _, today = get_new_item_window()
+    with _badge_lock:
+        held = [(username, value) for (part, username), (version, value) in _badge_parts.items()
+                if part == 'messages' and version == (previous_version, today)]
+    
+    def has_unread(summary, username):
+        return bool(summary) and summary_includes_user(summary, username) and \
+            get_summary_unread_count(summary, username) > 0
+    
+    for username, value in held:
+        for conv_id in conv_ids:
+            value += has_unread(summaries.get(conv_id), username) - has_unread(previous.get(conv_id), username)
+        set_badge_part('messages', username, messages_version, value)
+
+def get_user_badges(username):
+    """Get all header badge counters for a user"""
+    with _badge_lock:
+        cached = _badge_cache.get(username)
+        if cached and cached['expires'] > time.time():
+            _badge_cache.move_to_end(username)
+            return cached['badges']
+    
+    if username:
+        unread_count, reply_count = _get_badge_part('notifications', username, get_inbox_version(username),
+                                                    lambda: count_unread_notifications(load_user_notifications(username)))
+        unread_chats = _get_badge_part('messages', username, get_collection_version('messages'),
+                                       lambda: count_unread_chats(username))
+    else:
+        unread_count, reply_count, unread_chats = 0, 0, 0
+    
+    badges = {
+        'notifications': {'unread_count': unread_count, 'reply_count': reply_count},
+        'messages': {'unread_count': unread_chats},
+        'events': {'new_count': _get_badge_part('events', None, get_collection_version('events'),
+                                                lambda: count_new_today(load_events()))},
+        'shop': {'new_count': _get_badge_part('shop', None, get_collection_version('shop'),
+                                              lambda: count_new_today(get_shop_index()['products'].values()))}
+    }
     
-    for conv in all_conversations:
-        if not is_user_in_conversation(conv, current_username):
-            continue
-        
-        conv_messages = conv.get('messages', [])
-        if not conv_messages:
-            continue
-        
-        # Count unread messages from current user's perspective
-        unread_count = sum(1 for m in conv_messages 
-                          if m.get('sender') != current_username and not m.get('is_read', False))
-        
-        # Count this chat as 1 if it has any unread messages
-        if unread_count > 0:
-            unread_chat_count += 1
+    _remember_badge_entry(_badge_cache, username, {'expires': time.time() + BADGE_CACHE_TTL_SECONDS, 'badges': badges})
+    return badges
+
+def invalidate_badges(username=None):
+    """Drop cached badges for one user (or everyone) after a write"""
+    with _badge_lock:
+        if username is None:
+            _badge_cache.clear()
+        else:
+            _badge_cache.pop(username, None)
+
+@app.route('/api/badges')
+def api_badges():
+    """Get all header badge counters (notifications, messages, events, shop) in one request"""
+    current_username = session.get('username')
+    if not current_username or not validate_username(current_username):
+        current_username = None
     
-    return jsonify({'unread_count': unread_chat_count})
+    response = jsonify(get_user_badges(current_username))
+    response.headers['Cache-Control'] = f'private, max-age={BADGE_CACHE_TTL_SECONDS}'
+    return response
 
 @app.route('/events')
 def events():
     """Render events page"""
-    from datetime import datetime, timedelta
     events = load_events()
     categories = get_event_categories()
     
-    # Calculate if event is new (created within last 7 days, similar to products)
-    current_date = datetime.now().date()
-    today_str = datetime.now().strftime('%Y-%m-%d')
-    events_updated = False
-    
-    for event in events:
-        try:
-            # Ensure created_at exists, default to today if missing
-            if 'created_at' not in event or not event.get('created_at'):
-                event['created_at'] = today_str
-                events_updated = True  # Mark that we need to save
-            
-            created_date_str = event.get('created_at', '')
-            if created_date_str:
-                created_date = datetime.strptime(created_date_str, '%Y-%m-%d').date()
-                days_old = (current_date - created_date).days
-                # Mark as new if created within last 7 days (0-7 days old)
-                event['is_new'] = days_old <= 7 and days_old >= 0
-            else:
-                # If still empty, mark as new (just created)
-                event['is_new'] = True
-                event['created_at'] = today_str
-                events_updated = True
-        except Exception as e:
-            print(f"Error calculating is_new for event {event.get('id')}: {e}")
-            # Default to True if we can't parse, as it might be a new event
-            event['is_new'] = True
-            if 'created_at' not in event or not event.get('created_at'):
-                event['created_at'] = today_str
-                events_updated = True
-    
-    # Save events if we updated any created_at fields
-    if events_updated:
-        save_events(events)
+    # created_at is normalized at write time, so is_new is a string comparison
+    mark_new_items(events)
+    mark_relations(events, 'events', session.get('username'))
     
     return render_template('events.html', events=events, categories=categories, get_category_icon=get_category_icon)
 
@@ -1048,7 +3053,6 @@ def upload_event():
 @app.route('/events/<int:event_id>')
 def event_detail(event_id):
     """Render event detail page"""
-    from datetime import datetime
     events = load_events()
     event = None
     
@@ -1060,85 +3064,90 @@ def event_detail(event_id):
     if not event:
         return "Event not found", 404
     
-    # Calculate if event is new (created within last 7 days, similar to products)
-    current_date = datetime.now().date()
-    today_str = datetime.now().strftime('%Y-%m-%d')
-    event_updated = False
-    
-    try:
-        # Ensure created_at exists, default to today if missing
-        if 'created_at' not in event or not event.get('created_at'):
-            event['created_at'] = today_str
-            event_updated = True
-        
-        created_date_str = event.get('created_at', '')
-        if created_date_str:
-            created_date = datetime.strptime(created_date_str, '%Y-%m-%d').date()
-            days_old = (current_date - created_date).days
-            # Mark as new if created within last 7 days (0-7 days old)
-            event['is_new'] = days_old <= 7 and days_old >= 0
-        else:
-            # If still empty, mark as new (just created)
-            event['is_new'] = True
-            event['created_at'] = today_str
-            event_updated = True
-    except Exception as e:
-        print(f"Error calculating is_new for event {event.get('id')}: {e}")
-        # Default to True if we can't parse, as it might be a new event
-        event['is_new'] = True
-        if 'created_at' not in event or not event.get('created_at'):
-            event['created_at'] = today_str
-            event_updated = True
-    
-    # Save event if we updated created_at
-    if event_updated:
-        events = load_events()
-        for e in events:
-            if e['id'] == event_id:
-                e['created_at'] = event['created_at']
-                save_events(events)
-                break
+    event['is_new'] = is_new_item(event)
     
     # Check if current user is the host
     current_username = session.get('username', '')
+    mark_relations([event], 'events', current_username)
     is_host = event.get('host') == current_username or event.get('host_username') == current_username
     
-    # Check if current user is attending
-    is_attending = False
-    if current_username and 'attendees' in event:
-        is_attending = any(a.get('username') == current_username for a in event.get('attendees', []))
-    event['is_attending'] = is_attending
+    # Only the most recent attendees are rendered; the rest are paged from the API
+    attendees, attendees_cursor = get_event_attendees_page(event_id, limit=EVENT_ATTENDEE_PREVIEW)
     
-    return render_template('event_detail.html', event=event, is_host=is_host, get_category_icon=get_category_icon, current_user=session)
+    return render_template('event_detail.html', event=event, is_host=is_host, get_category_icon=get_category_icon, current_user=session,
+                         attendees=attendees, attendees_cursor=attendees_cursor)
 
 @app.route('/api/events')
+@conditional_get('events', 'relations')
 def api_events():
-    """API endpoint to get all events"""
-    events = load_events()
-    return jsonify(events)
+    """
+    API endpoint to get events.
+    Without parameters returns all events. With any of from, to, category,
+    near, radius, cursor or limit it returns one page, earliest date first,
+    read from the event indexes:
+    /api/events?from=2025-11-15&to=2025-11-16&category=music&near=40.78,-73.97&radius=10&limit=20&cursor=...
+    """
+    paginated = any(arg in request.args for arg in ('from', 'to', 'category', 'near', 'radius', 'cursor', 'limit'))
+    if not paginated:
+        events = mark_relations(load_events(), 'events', session.get('username'))
+        return jsonify(events)
+    
+    date_from = request.args.get('from', '').strip() or None
+    date_to = request.args.get('to', '').strip() or None
+    for value in (date_from, date_to):
+        if value:
+            try:
+                datetime.strptime(value, CREATED_AT_FORMAT)
+            except ValueError:
+                return jsonify({'success': False, 'error': 'Dates must be YYYY-MM-DD'}), 400
+    category = request.args.get('category', '').strip() or None
+    
+    near = None
+    radius_km = request.args.get('radius', type=float, default=EVENT_NEAR_DEFAULT_RADIUS_KM)
+    if request.args.get('near'):
+        try:
+            near = parse_event_coordinates(*request.args['near'].split(','))
+        except (TypeError, ValueError):
+            near = None
+        if not near:
+            return jsonify({'success': False, 'error': 'near must be "latitude,longitude"'}), 400
+        if not 0 < radius_km <= EVENT_NEAR_MAX_RADIUS_KM:
+            return jsonify({'success': False, 'error': f'radius must be between 0 and {EVENT_NEAR_MAX_RADIUS_KM} km'}), 400
+    
+    limit = request.args.get('limit', type=int, default=EVENT_PAGE_DEFAULT_LIMIT)
+    limit = max(1, min(limit, EVENT_PAGE_MAX_LIMIT))
+    
+    cursor = None
+    if request.args.get('cursor'):
+        cursor = decode_event_cursor(request.args['cursor'])
+        if cursor is None:
+            return jsonify({'success': False, 'error': 'Invalid cursor'}), 400
+    
+    events, distances, next_cursor = query_event_index(date_from, date_to, category, near, radius_km, cursor, limit)
+    events = [dict(event) for event in events]
+    for event in events:
+        if event['id'] in distances:
+            event['distance_km'] = round(distances[event['id']], 2)
+    mark_relations(events, 'events', session.get('username'))
+    
+    return jsonify({
+        'success': True,
+        'events': events,
+        'from': date_from,
+        'to': date_to,
+        'category': category,
+        'limit': limit,
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
+    })
 
 @app.route('/api/events', methods=['POST'])
 def create_event():
     """Create a new event"""
     try:
-        # Handle form data with file upload
-        if 'image' in request.files:
-            file = request.files['image']
-            if file and file.filename and allowed_file(file.filename):
-                # Generate unique filename
-                filename = secure_filename(file.filename)
-                file_extension = filename.rsplit('.', 1)[1].lower()
-                unique_filename = f"{uuid.uuid4().hex}.{file_extension}"
-                # Save to database/events folder
-                events_dir = os.path.join('database', 'events')
-                os.makedirs(events_dir, exist_ok=True)
-                file_path = os.path.join(events_dir, unique_filename)
-                file.save(file_path)
-                featured_image = unique_filename
-            else:
-                featured_image = None
-        else:
-            featured_image = None
+        # Handle form data with file upload (stored once the form is valid)
+        image_file = get_uploaded_image('image')
+        featured_image = None
         
         # Get form data
         data = {
@@ -1157,25 +3166,23 @@ def create_event():
             if not data[field]:
                 return jsonify({'success': False, 'error': f'Missing required field: {field}'}), 400
         
+        # Optional coordinates for the geo index
+        try:
+            coordinates = parse_event_coordinates(request.form.get('latitude'), request.form.get('longitude'))
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'Invalid latitude/longitude'}), 400
+        
+        # Store in the content-addressed media store
+        featured_image = store_uploaded_image(image_file)
+        
         # Load existing events
         events = load_events()
         
         # Generate new event ID
-        new_id = max([event.get('id', 0) for event in events], default=0) + 1
+        new_id = allocate_id('events')
         
-        # Set created_at to current date if not provided or empty
+        # Normalize created_at once at write time (defaults to today)
         created_at = request.form.get('created_at', '').strip()
-        if not created_at:
-            from datetime import datetime
-            created_at = datetime.now().strftime('%Y-%m-%d')
-        else:
-            try:
-                from datetime import datetime
-                # Validate date format
-                datetime.strptime(created_at, '%Y-%m-%d')
-            except ValueError:
-                from datetime import datetime
-                created_at = datetime.now().strftime('%Y-%m-%d')
         
         # Create new event
         new_event = {
@@ -1189,9 +3196,11 @@ def create_event():
             'category': data['category'],
             'featured_image': featured_image,
             'attendees_count': 0,
-            'created_at': created_at,
-            'is_attending': False
+            'created_at': created_at
         }
+        if coordinates:
+            new_event['latitude'], new_event['longitude'] = coordinates
+        normalize_created_at(new_event)
         
         # Add to events list
         events.append(new_event)
@@ -1200,9 +3209,11 @@ def create_event():
         if save_events(events):
             return jsonify({'success': True, 'event': new_event}), 201
         else:
+            release_media_file(featured_image)
             return jsonify({'success': False, 'error': 'Failed to save event'}), 500
             
     except Exception as e:
+        release_media_file(featured_image)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/events/<int:event_id>/attend', methods=['POST'])
@@ -1211,63 +3222,25 @@ def toggle_event_attendance(event_id):
     """Toggle attendance status for an event"""
     # Get current user from session
     current_username = session.get('username')
-    current_user_id = session.get('user_id')
-    current_full_name = session.get('full_name', current_username)
-    current_avatar = session.get('avatar', 'avatar-1.jpg')
     
     if not current_username:
         return jsonify({'success': False, 'error': 'Unauthorized'}), 401
     
-    # Get user from database to ensure we have latest info
-    user = get_user_by_username(current_username)
-    if user:
-        current_avatar = user.get('avatar', current_avatar)
-        current_full_name = user.get('full_name', current_full_name)
-    
-    current_user = {
-        'username': current_username,
-        'avatar': current_avatar,
-        'name': current_full_name,
-        'user_id': current_user_id
-    }
-    
     events = load_events()
     target_event = None
     
     for event in events:
         if event['id'] == event_id:
             target_event = event
-            # Initialize attendees list if it doesn't exist
-            if 'attendees' not in event:
-                event['attendees'] = []
-            
-            # Check if user is already attending
-            is_attending = any(a.get('username') == current_username for a in event.get('attendees', []))
-            
-            # Toggle attendance status
-            if not is_attending:
-            
-            # Update attendees list
-            if not 'attendees' in event:
-                event['attendees'] = []
-            
-            if event['is_attending']:
-                # Add user to attendees list
-                event['attendees_count'] = event.get('attendees_count', 0) + 1
-                # Check if user not already in list
-                if not any(a['username'] == current_user['username'] for a in event['attendees']):
-                    event['attendees'].append(current_user)
-            else:
-                # Remove user from attendees list
-                event['attendees_count'] = max(0, event.get('attendees_count', 0) - 1)
-                event['attendees'] = [a for a in event['attendees'] if a['username'] != current_user['username']]
             break
     
     if target_event:
-        save_events(events)
+        # Attendance is an edge - events.json is not rewritten
+        is_attending = toggle_relation('event_attend', current_username, event_id)
+        mark_relations([target_event], 'events', current_username)
         return jsonify({
             'success': True, 
-            'is_attending': target_event.get('is_attending', False),
+            'is_attending': is_attending,
             'attendees_count': target_event.get('attendees_count', 0)
         })
     else:
@@ -1279,6 +3252,7 @@ def get_event(event_id):
     events = load_events()
     for event in events:
         if event['id'] == event_id:
+            mark_relations([event], 'events', session.get('username'))
             return jsonify({'success': True, 'event': event})
     return jsonify({'success': False, 'error': 'Event not found'}), 404
 
@@ -1306,6 +3280,15 @@ def update_event(event_id):
                     event['time'] = data['time']
                 if 'category' in data:
                     event['category'] = data['category']
+                if 'latitude' in data or 'longitude' in data:
+                    try:
+                        coordinates = parse_event_coordinates(data.get('latitude'), data.get('longitude'))
+                    except (TypeError, ValueError):
+                        return jsonify({'success': False, 'error': 'Invalid latitude/longitude'}), 400
+                    event.pop('latitude', None)
+                    event.pop('longitude', None)
+                    if coordinates:
+                        event['latitude'], event['longitude'] = coordinates
                 break
         
         if target_event:
@@ -1321,11 +3304,13 @@ def delete_event(event_id):
     """Delete an event"""
     try:
         events = load_events()
-        original_count = len(events)
+        removed_events = [e for e in events if e['id'] == event_id]
         events = [e for e in events if e['id'] != event_id]
         
-        if len(events) < original_count:
-            save_events(events)
+        if removed_events:
+            if save_events(events):
+                for event in removed_events:
+                    release_media_file(event.get('featured_image'))
             return jsonify({'success': True})
         else:
             return jsonify({'success': False, 'error': 'Event not found'}), 404
@@ -1334,21 +3319,19 @@ def delete_event(event_id):
 
 @app.route('/api/events/<int:event_id>/bookmark', methods=['POST'])
 def toggle_event_bookmark(event_id):
-    """Toggle bookmark status for an event"""
+    """Toggle the current user's bookmark of an event"""
     events = load_events()
     target_event = None
     
     for event in events:
         if event['id'] == event_id:
             target_event = event
-            event['is_bookmarked'] = not event.get('is_bookmarked', False)
             break
     
     if target_event:
-        save_events(events)
         return jsonify({
             'success': True, 
-            'is_bookmarked': target_event.get('is_bookmarked', False)
+            'is_bookmarked': toggle_relation('event_bookmark', session.get('username'), event_id)
         })
     else:
         return jsonify({'success': False, 'error': 'Event not found'}), 404
@@ -1382,14 +3365,39 @@ def report_event(event_id):
 
 @app.route('/api/events/<int:event_id>/attendees', methods=['GET'])
 def get_event_attendees(event_id):
-    """Get list of attendees for an event"""
+    """Get attendees for an event, most recent first: ?limit=50&cursor=<next_cursor>"""
     events = load_events()
     for event in events:
         if event['id'] == event_id:
-            attendees = event.get('attendees', [])
-            return jsonify({'success': True, 'attendees': attendees})
+            limit = request.args.get('limit', type=int, default=EVENT_ATTENDEES_PAGE_SIZE)
+            limit = max(1, min(limit, EVENT_ATTENDEES_MAX_LIMIT))
+            cursor = None
+            if request.args.get('cursor'):
+                cursor = decode_relation_cursor(request.args['cursor'])
+                if cursor is None:
+                    return jsonify({'success': False, 'error': 'Invalid cursor'}), 400
+            
+            attendees, next_cursor = get_event_attendees_page(event_id, cursor, limit)
+            mark_relations([event], 'events', session.get('username'))
+            return jsonify({
+                'success': True,
+                'attendees': attendees,
+                'attendees_count': event.get('attendees_count', 0),
+                'next_cursor': next_cursor,
+                'has_more': next_cursor is not None
+            })
     return jsonify({'success': False, 'error': 'Event not found'}), 404
 
+@app.route('/api/events/attending', methods=['GET'])
+def get_attending_events():
+    """Events the current user is attending, most recently joined first"""
+    current_username = session.get('username')
+    event_ids = get_user_relation_order('event_attend', current_username)
+    events_by_id = {event['id']: event for event in load_events()}
+    events = [events_by_id[event_id] for event_id in event_ids if event_id in events_by_id]
+    mark_relations(events, 'events', current_username)
+    return jsonify({'success': True, 'events': events})
+
 @app.route('/api/events/<int:event_id>/comments', methods=['POST'])
 def add_event_comment(event_id):
     """Add a comment to an event"""
@@ -1413,7 +3421,8 @@ def add_event_comment(event_id):
                     return jsonify({'success': False, 'error': 'Comment text is required'}), 400
                 
                 # Generate new comment ID
-                new_comment_id = max([c.get('id', 0) for c in event['comments']], default=0) + 1
+                new_comment_id = allocate_id(f'event:{event_id}:comments',
+                                             seed=lambda: max([c.get('id', 0) for c in event['comments']], default=0))
                 
                 # Create new comment
                 new_comment = {
@@ -1514,20 +3523,8 @@ def delete_event_comment(event_id, comment_id):
 @app.route('/api/events/new-count')
 def get_new_events_count():
     """Get count of new events (created within last 24 hours)"""
-    from datetime import datetime
-    events = load_events()
-    current_date = datetime.now().date()
-    new_count = 0
-    
-    for event in events:
-        try:
-            created_date = datetime.strptime(event.get('created_at', ''), '%Y-%m-%d').date()
-            if (current_date - created_date).days == 0:
-                new_count += 1
-        except:
-            pass
-    
-    return jsonify({'new_count': new_count})
+    return jsonify({'new_count': _get_badge_part('events', None, get_collection_version('events'),
+                                                 lambda: count_new_today(load_events()))})
 
 @app.route('/api/events/categories')
 def api_event_categories():
@@ -1551,13 +3548,13 @@ def serve_event_image(filename):
 def serve_event_image_db(filename):
     """Serve event images from database/events folder"""
     events_dir = os.path.join('database', 'events')
-    return send_from_directory(events_dir, filename)
+    return send_media(events_dir, filename)
 
 @app.route('/database/groups/<filename>')
 def serve_group_image(filename):
     """Serve group images from database/groups folder"""
     groups_dir = os.path.join('database', 'groups')
-    return send_from_directory(groups_dir, filename)
+    return send_media(groups_dir, filename)
 
 # ==================== Helper Functions for New Pages ====================
 
@@ -1575,8 +3572,11 @@ def load_reels():
 def save_reels(reels):
     """Save reels to JSON database"""
     try:
-        with open('database/reels.json', 'w', encoding='utf-8') as f:
-            json.dump({'reels': reels}, f, indent=2, ensure_ascii=False)
+        with collection_locked('reels'):
+            keep_counter_values('reels', reels)
+            with open('database/reels.json', 'w', encoding='utf-8') as f:
+                json.dump({'reels': reels}, f, indent=2, ensure_ascii=False)
+            remember_counter_values('reels', reels)
     except Exception as e:
         print(f"Error saving reels: {e}")
         raise
@@ -1807,11 +3807,12 @@ def load_messages():
         print(f"Error loading messages: {e}")
         return []
 
-def save_messages(conversations):
+def save_messages(conversations, changed_ids=None):
     """
     Save messages to JSON database with security validation.
     Validates all data before saving to prevent injection attacks.
     Note: Message text should already be sanitized before calling this function.
+    changed_ids (optional) names the conversations that were modified.
     """
     try:
         # Validate conversations data
@@ -1884,8 +3885,14 @@ def save_messages(conversations):
             validated_conversations.append(conv)
         
         os.makedirs('database', exist_ok=True)
-        with open('database/messages.json', 'w', encoding='utf-8') as f:
-            json.dump({'conversations': validated_conversations}, f, indent=2, ensure_ascii=False)
+        with collection_locked('messages'), \
+                track_thread_changes('conversation', validated_conversations, changed_ids) as changed:
+            previous_summaries = get_cached_conversation_summaries()
+            with open('database/messages.json', 'w', encoding='utf-8') as f:
+                json.dump({'conversations': validated_conversations}, f, indent=2, ensure_ascii=False)
+            # Still under the writer's lock, so the summaries are tagged with this write's version
+            save_conversation_summaries(validated_conversations, changed, previous_summaries)
+        invalidate_badges()
         return True
     except Exception as e:
         print(f"Error saving messages: {e}")
@@ -1911,8 +3918,8 @@ def load_groups():
         print(f"Error loading groups: {e}")
         return []
 
-def save_groups(groups):
-    """Save groups to JSON database"""
+def save_groups(groups, changed_ids=None):
+    """Save groups to JSON database (changed_ids optionally names the groups that were modified)"""
     global _category_cache, _category_cache_groups_count
     
     try:
@@ -1922,8 +3929,9 @@ def save_groups(groups):
             return False
             
         os.makedirs('database', exist_ok=True)
-        with open('database/groups.json', 'w', encoding='utf-8') as f:
-            json.dump({'groups': groups}, f, indent=2, ensure_ascii=False)
+        with track_thread_changes('group', groups, changed_ids):
+            with open('database/groups.json', 'w', encoding='utf-8') as f:
+                json.dump({'groups': groups}, f, indent=2, ensure_ascii=False)
         
         # Invalidate category cache after saving
         _category_cache = None
@@ -1934,6 +3942,398 @@ def save_groups(groups):
         print(f"Error saving groups: {e}")
         return False
 
+# ==================== Thread Change Journal ====================
+# save_messages/save_groups diff each thread against the previous save and
+# append the ids that changed to an append-only journal, tagged with a global
+# sequence number. Clients poll /api/messages?since=<version> (or /api/groups)
+# and get back only the threads changed after their version - visibility for
+# the current user is applied to that tail at read time. Versions older than
+# the journal's retained window, or newer than it (journal reset), get a full
+# list instead.
+
+THREAD_JOURNAL = 'database/thread_changes.journal'
+THREAD_JOURNAL_LOCK = 'database/.thread_changes.lock'
+THREAD_JOURNAL_RETENTION = 5000
+THREAD_FILES = {'conversation': 'database/messages.json', 'group': 'database/groups.json'}
+
+_thread_changes = []  # [(seq, kind, id)] in seq order
+_thread_journal_floor = 0  # Changes at or below this seq have been compacted away
+_thread_journal_offset = 0
+_thread_journal_lock = threading.RLock()
+_thread_digests = {}  # kind -> (file version, {id: digest})
+
+def _digest_thread(record):
+    """Digest of a thread's stored fields"""
+    return hashlib.sha1(json.dumps(record, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def _digest_threads(records, previous=None, changed_ids=None):
+    """
+    Digest every thread so changes can be detected on the next save. With
+    changed_ids, only those threads (and threads missing from previous) are
+    re-digested; every other thread keeps its digest from previous.
+    """
+    if changed_ids is None or previous is None:
+        return {record.get('id'): _digest_thread(record) for record in records if isinstance(record, dict)}
+    
+    changed_ids = set(changed_ids)
+    digests = {}
+    for record in records:
+        if not isinstance(record, dict):
+            continue
+        thread_id = record.get('id')
+        if thread_id in changed_ids or thread_id not in previous:
+            digests[thread_id] = _digest_thread(record)
+        else:
+            digests[thread_id] = previous[thread_id]
+    return digests
+
+def _get_saved_thread_digests(kind):
+    """
+    Digests of the threads currently on disk, and whether they are the cached
+    digests of this process's last save (the file hasn't changed since)
+    """
+    file_version = get_file_version(THREAD_FILES[kind])
+    cached = _thread_digests.get(kind)
+    if cached and cached[0] == file_version:
+        return cached[1], True
+    records = load_messages() if kind == 'conversation' else load_groups()
+    return _digest_threads(records), False
+
+def _sync_thread_journal():
+    """Replay journal lines written since the last sync (by any process)"""
+    global _thread_journal_offset, _thread_journal_floor
+    
+    try:
+        size = os.path.getsize(THREAD_JOURNAL)
+    except OSError:
+        size = 0
+    
+    with _thread_journal_lock:
+        if size < _thread_journal_offset:
+            # Journal was compacted or reset - replay from the start
+            _thread_changes.clear()
+            _thread_journal_offset = 0
+            _thread_journal_floor = 0
+        if size == _thread_journal_offset:
+            return
+        
+        with open(THREAD_JOURNAL, 'r', encoding='utf-8') as f:
+            f.seek(_thread_journal_offset)
+            for line in f:
+                if not line.endswith('\n'):
+                    break  # Partial line still being written
+                _thread_journal_offset += len(line.encode('utf-8'))
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if 'floor' in entry:
+                    _thread_journal_floor = entry['floor']
+                else:
+                    _thread_changes.append((entry['seq'], entry['kind'], entry['id']))
+
+def get_thread_version():
+    """Latest thread change sequence number"""
+    _sync_thread_journal()
+    with _thread_journal_lock:
+        return _thread_changes[-1][0] if _thread_changes else _thread_journal_floor
+
+def _compact_thread_journal():
+    """Rewrite the journal keeping only the newest THREAD_JOURNAL_RETENTION entries (journal lock held)"""
+    global _thread_journal_offset, _thread_journal_floor
+    
+    with _thread_journal_lock:
+        kept = _thread_changes[-THREAD_JOURNAL_RETENTION:]
+        floor = _thread_changes[-len(kept) - 1][0] if len(kept) < len(_thread_changes) else _thread_journal_floor
+        temp_path = THREAD_JOURNAL + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'floor': floor}) + '\n')
+            for seq, kind, thread_id in kept:
+                f.write(json.dumps({'seq': seq, 'kind': kind, 'id': thread_id}) + '\n')
+        os.replace(temp_path, THREAD_JOURNAL)
+        _thread_changes[:] = kept
+        _thread_journal_floor = floor
+        _thread_journal_offset = os.path.getsize(THREAD_JOURNAL)
+
+@contextmanager
+def track_thread_changes(kind, records, changed_ids=None):
+    """
+    Journal the threads that differ between the file on disk and records while
+    it is written. changed_ids names the threads the caller modified; when the
+    file is the one this process last wrote, only those are re-digested.
+    Yields the ids of the threads that differ; the lock is held until exit.
+    """
+    with _file_locked(THREAD_JOURNAL_LOCK):
+        previous, cached = _get_saved_thread_digests(kind)
+        current = _digest_threads(records, previous, changed_ids if cached else None)
+        changed = sorted((thread_id for thread_id in set(previous) | set(current)
+                          if previous.get(thread_id) != current.get(thread_id)), key=str)
+        
+        yield changed
+        
+        _thread_digests[kind] = (get_file_version(THREAD_FILES[kind]), current)
+        if not changed:
+            return
+        
+        _sync_thread_journal()
+        with _thread_journal_lock:
+            seq = get_thread_version()
+            lines = []
+            for thread_id in changed:
+                seq += 1
+                lines.append(json.dumps({'seq': seq, 'kind': kind, 'id': thread_id}) + '\n')
+            with open(THREAD_JOURNAL, 'a', encoding='utf-8') as f:
+                f.write(''.join(lines))
+            _sync_thread_journal()
+            
+            if len(_thread_changes) > THREAD_JOURNAL_RETENTION * 2:
+                _compact_thread_journal()
+
+def get_thread_changes(kind, since):
+    """
+    Get (version, changed thread ids) for a thread kind after a client's version.
+    The id set is None when the client must reload the full list.
+    """
+    version = get_thread_version()
+    with _thread_journal_lock:
+        # since is None when the client has nothing yet (?since=)
+        if since is None or since < _thread_journal_floor or since > version:
+            return version, None
+        start = bisect.bisect_left(_thread_changes, (since + 1,))
+        return version, {thread_id for _, entry_kind, thread_id in _thread_changes[start:] if entry_kind == kind}
+
+# ==================== Conversation Summaries ====================
+# List endpoints work from a per-conversation summary (participants, last
+# message preview, unread counts by sender) instead of the full message
+# history. save_messages re-summarizes only the conversations that changed and
+# stores the summaries alongside messages.json, tagged with the messages
+# version they were built from, so list reads never parse message histories.
+
+CONVERSATION_SUMMARIES_FILE = 'database/conversation_summaries.json'
+
+_conversation_summaries = None  # (messages version, {id: summary})
+
+def summarize_conversation(conv):
+    """Build the list summary of a conversation"""
+    messages = conv.get('messages', [])
+    senders = []  # Distinct senders in order of first message
+    unread_from = {}  # sender -> unread messages
+    has_real_messages = False
+    
+    for msg in messages:
+        sender = msg.get('sender')
+        if sender not in senders:
+            senders.append(sender)
+        if not msg.get('is_read', False):
+            unread_from[sender] = unread_from.get(sender, 0) + 1
+        if not has_real_messages:
+            msg_text = msg.get('text', '').strip()
+            has_real_messages = bool(msg_text) and msg_text.lower() != 'no messages yet'
+    
+    if messages:
+        last_msg = messages[-1]
+        last_message = {
+            'text': last_msg.get('text', ''),
+            'timestamp': last_msg.get('timestamp', ''),
+            'sender': last_msg.get('sender', '')
+        }
+    else:
+        last_message = conv.get('last_message') or {'text': '', 'timestamp': '', 'sender': ''}
+    
+    return {
+        'id': conv.get('id'),
+        'user': conv.get('user', {}),
+        'senders': senders,
+        'unread_from': unread_from,
+        'has_messages': bool(messages),
+        'has_real_messages': has_real_messages,
+        'last_message': last_message,
+        'last_message_id': messages[-1].get('id', 0) if messages else 0
+    }
+
+def summary_includes_user(summary, username):
+    """Same participation rules as is_user_in_conversation, evaluated on a summary"""
+    if not summary or not username or not validate_username(username):
+        return False
+    
+    conv_username = summary['user'].get('username')
+    if conv_username == username or username in summary['senders']:
+        return True
+    if not summary['has_messages'] and summary['last_message'].get('sender') == username:
+        return True
+    # Conversation partner (or anyone else) has messaged in it
+    return bool(conv_username) and any(sender and sender != username and validate_username(sender)
+                                       for sender in summary['senders'])
+
+def get_summary_unread_count(summary, username):
+    """Unread messages in a conversation that the user received"""
+    return sum(count for sender, count in summary['unread_from'].items() if sender != username)
+
+def get_cached_conversation_summaries():
+    """In-memory summaries if they describe messages.json as it is on disk, else None"""
+    if _conversation_summaries and _conversation_summaries[0] == get_collection_version('messages'):
+        return _conversation_summaries[1]
+    return None
+
+def save_conversation_summaries(conversations, changed_ids=None, previous=None):
+    """
+    Build and store summaries for the conversations just written to messages.json.
+    Given the summaries of the file before the write (previous) and the ids
+    that changed, only those conversations are re-summarized.
+    Call with the messages.json writer's lock held, so the version matches.
+    """
+    global _conversation_summaries
+    
+    if changed_ids is None or previous is None:
+        summaries = {conv.get('id'): summarize_conversation(conv) for conv in conversations}
+    else:
+        changed_ids = set(changed_ids)
+        summaries = {}
+        for conv in conversations:
+            conv_id = conv.get('id')
+            if conv_id in changed_ids or conv_id not in previous:
+                summaries[conv_id] = summarize_conversation(conv)
+                changed_ids.add(conv_id)
+            else:
+                summaries[conv_id] = previous[conv_id]
+        changed_ids.update(previous.keys() - summaries.keys())  # Deleted conversations
+    messages_version = get_collection_version('messages')
+    if changed_ids is not None and previous is not None and _conversation_summaries \
+            and _conversation_summaries[1] is previous:
+        update_unread_chat_badges(_conversation_summaries[0], messages_version, previous, summaries, changed_ids)
+    try:
+        with open(CONVERSATION_SUMMARIES_FILE, 'w', encoding='utf-8') as f:
+            json.dump({'messages_version': messages_version, 'summaries': list(summaries.values())},
+                      f, indent=2, ensure_ascii=False)
+    except Exception as e:
+        print(f"Error saving conversation summaries: {e}")
+    _conversation_summaries = (messages_version, summaries)
+    return summaries
+
+def load_conversation_summaries():
+    """Get {conversation id: summary}, rebuilding them if messages.json changed underneath"""
+    global _conversation_summaries
+    
+    messages_version = get_collection_version('messages')
+    if _conversation_summaries and _conversation_summaries[0] == messages_version:
+        return _conversation_summaries[1]
+    
+    try:
+        with open(CONVERSATION_SUMMARIES_FILE, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('messages_version') == messages_version:
+            summaries = {summary['id']: summary for summary in data.get('summaries', [])}
+            _conversation_summaries = (messages_version, summaries)
+            return summaries
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+    
+    # Rebuild under the messages.json writers' lock so the version matches what was read
+    with _file_locked(THREAD_JOURNAL_LOCK):
+        return save_conversation_summaries(load_messages())
+
+# ==================== Thread Inboxes ====================
+# Each user's conversations and groups are kept in recency order as a sorted
+# list of (-last message id, thread id), so list pages read them in order
+# instead of filtering and sorting every thread per request. An inbox records
+# the thread journal version it reflects; senders reposition their thread in
+# every held inbox with a bisect, and reads replay any other journaled
+# changes the same way. Inboxes are rebuilt when the journal can't cover the
+# gap or the file changed without journaling.
+
+THREAD_INBOX_CACHE_SIZE = 1000  # Inboxes held per process, least recently read evicted
+
+_thread_inboxes = OrderedDict()  # (kind, username) -> {'version', 'file_version', 'order', 'keys'}
+_thread_inboxes_lock = threading.RLock()
+
+def is_group_member(group, username):
+    """Check whether a user is the admin or a member of a group"""
+    if group.get('admin') == username:
+        return True
+    return any(member.get('username') == username for member in group.get('members') or [])
+
+def load_thread_records(kind):
+    """Get {thread id: record} used to place threads in inboxes"""
+    if kind == 'conversation':
+        return load_conversation_summaries()
+    return {group.get('id'): group for group in load_groups()}
+
+def get_thread_inbox_key(kind, record, username):
+    """Sort key of a thread in a user's inbox, or None if it doesn't belong there"""
+    if not record:
+        return None
+    if kind == 'conversation':
+        if not record['has_real_messages'] or not summary_includes_user(record, username):
+            return None
+        return (-record['last_message_id'], record['id'])
+    if not is_group_member(record, username):
+        return None
+    group_messages = record.get('messages') or []
+    return (-(group_messages[-1].get('id', 0) if group_messages else 0), record.get('id'))
+
+def _place_in_thread_inbox(inbox, thread_id, key):
+    """Move (or add/remove) a thread to its position in an inbox"""
+    order = inbox['order']
+    old_key = inbox['keys'].pop(thread_id, None)
+    if old_key is not None:
+        del order[bisect.bisect_left(order, old_key)]
+    if key is not None:
+        bisect.insort(order, key)
+        inbox['keys'][thread_id] = key
+
+def _build_thread_inbox(kind, username, records, version, file_version):
+    """Build a user's inbox from every thread"""
+    keys = {}
+    for thread_id, record in records.items():
+        key = get_thread_inbox_key(kind, record, username)
+        if key is not None:
+            keys[thread_id] = key
+    return {'version': version, 'file_version': file_version, 'order': sorted(keys.values()), 'keys': keys}
+
+def get_thread_inbox(kind, username, limit=None):
+    """Ids of a user's conversations or groups, most recent first (only the newest `limit` if given)"""
+    cache_key = (kind, username)
+    with _thread_inboxes_lock:
+        inbox = _thread_inboxes.get(cache_key)
+        file_version = get_file_version(THREAD_FILES[kind])
+        version, changed = get_thread_changes(kind, inbox['version'] if inbox else None)
+        
+        if inbox is None or changed is None or (not changed and inbox['file_version'] != file_version):
+            inbox = _build_thread_inbox(kind, username, load_thread_records(kind), version, file_version)
+            _thread_inboxes[cache_key] = inbox
+        elif changed or inbox['version'] != version:
+            records = load_thread_records(kind) if changed else {}
+            for thread_id in changed:
+                _place_in_thread_inbox(inbox, thread_id, get_thread_inbox_key(kind, records.get(thread_id), username))
+            inbox['version'] = version
+            inbox['file_version'] = file_version
+        
+        _thread_inboxes.move_to_end(cache_key)
+        while len(_thread_inboxes) > THREAD_INBOX_CACHE_SIZE:
+            _thread_inboxes.popitem(last=False)
+        
+        return [thread_id for _, thread_id in inbox['order'][:limit]]
+
+def touch_thread_inboxes(kind, record):
+    """Reposition a thread that just got a new message in every held inbox"""
+    if kind == 'conversation':
+        record = load_conversation_summaries().get(record.get('id'))
+        if not record:
+            return
+    thread_id = record.get('id')
+    
+    with _thread_inboxes_lock:
+        file_version = get_file_version(THREAD_FILES[kind])
+        for (inbox_kind, username), inbox in _thread_inboxes.items():
+            if inbox_kind != kind:
+                continue
+            version, changed = get_thread_changes(kind, inbox['version'])
+            # Only the sender's own write is pending - apply it and mark the inbox current
+            if changed is not None and changed <= {thread_id}:
+                _place_in_thread_inbox(inbox, thread_id, get_thread_inbox_key(kind, record, username))
+                inbox['version'] = version
+                inbox['file_version'] = file_version
+
 # Cache for categories to avoid reloading groups
 _category_cache = None
 _category_cache_groups_count = 0
@@ -1986,6 +4386,534 @@ def format_number_filter(num):
     """Template filter to format numbers"""
     return format_number(num)
 
+# ==================== Sharded Counters ====================
+# Hot counters (post shares, product views, reel views) are incremented in
+# memory instead of rewriting the collection file on every request. Each
+# thread adds into its own shard, so concurrent increments of one hot record
+# don't queue on a single lock. A background thread folds the shards into the
+# collection files every COUNTER_FLUSH_SECONDS - one load/save per collection
+# however many increments arrived - and once more at exit. Reads add the
+# increments not flushed yet to the stored values.
+#
+# The flush loads and saves under the collection's write lock, which every
+# save_posts/save_shop/save_reels also takes. Counters only ever grow, so a
+# request saving records it loaded before a flush keeps the larger, flushed
+# value from the file instead of writing its stale count back.
+
+COUNTER_SHARDS = 16
+COUNTER_FLUSH_SECONDS = 10
+
+# collection -> (loader, saver, counted fields)
+COUNTER_COLLECTIONS = {
+    'posts': (load_posts, save_posts, ('shares_count',)),
+    'shop': (load_shop, save_shop, ('views',)),
+    'reels': (load_reels, save_reels, ('views_count',))
+}
+
+_counter_shards = [({}, threading.Lock()) for _ in range(COUNTER_SHARDS)]  # (collection, id, field) -> delta
+_counter_flushing = {}  # Deltas drained from the shards but not saved yet
+_counter_flush_lock = threading.Lock()
+_counter_flusher_started = False
+_counter_thread = threading.local()  # .shard - this thread's shard index
+_counter_next_shard = itertools.count()
+_counter_values = {}  # collection -> (file version, {id: {field: value}}) as last written
+
+_collection_locks = {}  # collection -> RLock
+_collection_locks_guard = threading.Lock()
+_collection_lock_depth = threading.local()
+
+@contextmanager
+def collection_locked(collection):
+    """Hold a collection's cross-process write lock (re-entrant within a thread)"""
+    with _collection_locks_guard:
+        lock = _collection_locks.setdefault(collection, threading.RLock())
+    with lock:
+        depths = _collection_lock_depth.__dict__.setdefault('depths', {})
+        depth = depths.get(collection, 0)
+        depths[collection] = depth + 1
+        try:
+            if depth:
+                yield
+            else:
+                with _file_locked(f'database/.{collection}.lock'):
+                    yield
+        finally:
+            depths[collection] = depth
+
+# Collections whose save_* function takes the ids of the records a write changed
+CHANGED_ID_SAVERS = {'posts', 'messages'}
+
+def save_changed_records(collection, save, records, changed_ids):
+    """Save a collection from a background flush, naming the changed records where the saver takes them"""
+    if collection in CHANGED_ID_SAVERS:
+        return save(records, list(changed_ids)) is not False
+    return save(records) is not False
+
+def keep_counter_values(collection, records):
+    """
+    Raise counted fields in records to the values in the collection file
+    (collection lock held), so saving records loaded before a counter flush
+    doesn't write the flushed increments away.
+    """
+    fields = COUNTER_COLLECTIONS[collection][2]
+    file_version = get_collection_version(collection)
+    cached = _counter_values.get(collection)
+    if cached and cached[0] == file_version:
+        stored = cached[1]
+    else:
+        stored = {record.get('id'): {field: record.get(field) or 0 for field in fields}
+                  for record in COUNTER_COLLECTIONS[collection][0]()}
+    
+    for record in records:
+        values = stored.get(record.get('id'))
+        if values:
+            for field in fields:
+                if values[field] > (record.get(field) or 0):
+                    record[field] = values[field]
+
+def remember_counter_values(collection, records):
+    """Note the counted fields just written, so the next save needn't re-read the file"""
+    fields = COUNTER_COLLECTIONS[collection][2]
+    _counter_values[collection] = (get_collection_version(collection),
+                                   {record.get('id'): {field: record.get(field) or 0 for field in fields}
+                                    for record in records})
+
+def increment_counter(collection, record_id, field, amount=1):
+    """Add to a record's counter without touching the collection file"""
+    shard = getattr(_counter_thread, 'shard', None)
+    if shard is None:
+        # Thread idents are aligned addresses, so hand out shards round-robin instead
+        shard = _counter_thread.shard = next(_counter_next_shard) % COUNTER_SHARDS
+    deltas, lock = _counter_shards[shard]
+    key = (collection, record_id, field)
+    with lock:
+        deltas[key] = deltas.get(key, 0) + amount
+    bump_pending_generation(collection)
+
+def get_pending_counts(collection):
+    """Increments not in the collection file yet: {(id, field): delta}"""
+    pending = {}
+    for (key_collection, record_id, field), amount in list(_counter_flushing.items()):
+        if key_collection == collection:
+            pending[(record_id, field)] = pending.get((record_id, field), 0) + amount
+    for deltas, lock in _counter_shards:
+        with lock:
+            items = [(key, amount) for key, amount in deltas.items() if key[0] == collection]
+        for (_, record_id, field), amount in items:
+            pending[(record_id, field)] = pending.get((record_id, field), 0) + amount
+    return pending
+
+def apply_pending_counts(records, collection):
+    """Add unflushed counter increments to records' stored counts"""
+    pending = get_pending_counts(collection)
+    if pending:
+        for record in records:
+            for field in COUNTER_COLLECTIONS[collection][2]:
+                delta = pending.get((record.get('id'), field))
+                if delta:
+                    record[field] = record.get(field, 0) + delta
+    return records
+
+def flush_counters():
+    """Fold every shard's increments into the collection files"""
+    with _counter_flush_lock:
+        for deltas, lock in _counter_shards:
+            with lock:
+                for key, amount in deltas.items():
+                    _counter_flushing[key] = _counter_flushing.get(key, 0) + amount
+                deltas.clear()
+        
+        for collection, (load, save, fields) in COUNTER_COLLECTIONS.items():
+            updates = {(record_id, field): amount for (key_collection, record_id, field), amount
+                       in _counter_flushing.items() if key_collection == collection}
+            if not updates:
+                continue
+            
+            try:
+                # Load and save under the write lock so no request save lands in between
+                with collection_locked(collection):
+                    records = load()
+                    changed_ids = set()
+                    for record in records:
+                        for field in fields:
+                            delta = updates.get((record.get('id'), field))
+                            if delta:
+                                record[field] = record.get(field, 0) + delta
+                                changed_ids.add(record.get('id'))
+                    saved = save_changed_records(collection, save, records, changed_ids)
+            except Exception as e:
+                print(f"Error flushing {collection} counters: {e}")
+                saved = False
+            
+            if saved:
+                for record_id, field in updates:
+                    _counter_flushing.pop((collection, record_id, field), None)
+
+def run_counter_flusher():
+    """Background task that flushes counters every COUNTER_FLUSH_SECONDS"""
+    while True:
+        time.sleep(COUNTER_FLUSH_SECONDS)
+        try:
+            flush_counters()
+        except Exception as e:
+            print(f"Error in counter flush: {e}")
+
+def start_counter_flusher():
+    """Start the counter flusher thread (once per process) and flush again at exit"""
+    global _counter_flusher_started
+    if _counter_flusher_started:
+        return
+    _counter_flusher_started = True
+    threading.Thread(target=run_counter_flusher, daemon=True).start()
+    atexit.register(flush_counters)
+
+start_counter_flusher()
+
+# ==================== Write-Behind Queue ====================
+# Non-critical changes made while serving reads (e.g. read receipts from
+# message polling) are queued per record instead of rewriting the collection
+# file inside the request. A background thread applies everything queued for
+# a collection in one load/save, at most WRITE_BEHIND_FLUSH_SECONDS after the
+# first change was queued, or sooner once WRITE_BEHIND_MAX_PENDING records
+# are waiting. Queued changes are also flushed at exit.
+#
+# Changes queued with a key replace the queued change with the same key for
+# that record, so a record polled many times between flushes carries one
+# change, not one per poll. The flush loads and saves each collection under
+# its write lock (collection_locked), like the collection's save_* function.
+
+WRITE_BEHIND_FLUSH_SECONDS = 2
+WRITE_BEHIND_MAX_PENDING = 500
+
+# collection -> (loader, saver)
+WRITE_BEHIND_COLLECTIONS = {
+    'messages': (load_messages, save_messages),
+    'posts': (load_posts, save_posts),
+    'events': (load_events, save_events),
+    'shop': (load_shop, save_shop),
+    'reels': (load_reels, save_reels)
+}
+
+_write_behind = OrderedDict()  # (collection, record id) -> OrderedDict(key -> mutate(record)) in queue order
+_write_behind_condition = threading.Condition()
+_write_behind_flush_lock = threading.Lock()
+_write_behind_started = False
+_write_behind_keys = itertools.count()  # Keys for changes queued without one
+
+def queue_record_update(collection, record_id, mutate, key=None):
+    """
+    Queue mutate(record) to be applied to a stored record at the next flush.
+    A change queued with a key replaces the change queued for the record with
+    the same key, so mutate must include everything the replaced one did.
+    """
+    if key is None:
+        key = next(_write_behind_keys)
+    with _write_behind_condition:
+        mutations = _write_behind.setdefault((collection, record_id), OrderedDict())
+        mutations.pop(key, None)
+        mutations[key] = mutate
+        bump_pending_generation(collection)
+        # Wake the flusher for the first change (starts the staleness window) and when the queue is full
+        if len(_write_behind) == 1 or len(_write_behind) >= WRITE_BEHIND_MAX_PENDING:
+            _write_behind_condition.notify()
+
+def flush_record_updates():
+    """Apply every queued change, one load/save per collection"""
+    with _write_behind_flush_lock:
+        with _write_behind_condition:
+            pending = list(_write_behind.items())
+            _write_behind.clear()
+        
+        for collection, (load, save) in WRITE_BEHIND_COLLECTIONS.items():
+            updates = [(record_id, mutations) for (key_collection, record_id), mutations in pending
+                       if key_collection == collection]
+            if not updates:
+                continue
+            
+            try:
+                # Load and save under the write lock so no request save lands in between
+                with collection_locked(collection):
+                    records = load()
+                    records_by_id = {record.get('id'): record for record in records}
+                    for record_id, mutations in updates:
+                        record = records_by_id.get(record_id)
+                        if record is None:
+                            continue  # Deleted since the change was queued
+                        for mutate in mutations.values():
+                            mutate(record)
+                    saved = save_changed_records(collection, save, records,
+                                                 [record_id for record_id, _ in updates if record_id in records_by_id])
+            except Exception as e:
+                print(f"Error flushing queued {collection} updates: {e}")
+                saved = False
+            
+            if not saved:
+                # Requeue ahead of anything queued since (newer changes win on the same key)
+                with _write_behind_condition:
+                    for record_id, mutations in reversed(updates):
+                        queue_key = (collection, record_id)
+                        for key, mutate in _write_behind.get(queue_key, {}).items():
+                            mutations.pop(key, None)
+                            mutations[key] = mutate
+                        _write_behind[queue_key] = mutations
+                        _write_behind.move_to_end(queue_key, last=False)
+
+def run_write_behind():
+    """Background task that flushes queued changes"""
+    while True:
+        with _write_behind_condition:
+            while not _write_behind:
+                _write_behind_condition.wait()
+            # Give changes queued right after this one a chance to coalesce
+            if len(_write_behind) < WRITE_BEHIND_MAX_PENDING:
+                _write_behind_condition.wait(WRITE_BEHIND_FLUSH_SECONDS)
+        try:
+            flush_record_updates()
+        except Exception as e:
+            print(f"Error in write-behind flush: {e}")
+            time.sleep(1)
+
+def start_write_behind():
+    """Start the write-behind thread (once per process) and flush again at exit"""
+    global _write_behind_started
+    if _write_behind_started:
+        return
+    _write_behind_started = True
+    threading.Thread(target=run_write_behind, daemon=True).start()
+    atexit.register(flush_record_updates)
+
+start_write_behind()
+
+# ==================== Trending ====================
+# The explore page's default view ranks posts, reels, events and products by
+# time-decayed engagement. A background thread recomputes the top
+# TRENDING_TOP_K of each type (and of everything together) every
+# TRENDING_REFRESH_SECONDS; requests only slice the precomputed lists. A
+# record's score is log2(1 + weighted engagement) minus one point per
+# TRENDING_HALF_LIFE_HOURS of age, i.e. engagement halves in value every
+# half-life. Records without a date are scored as TRENDING_UNDATED_AGE_HOURS old.
+
+TRENDING_REFRESH_SECONDS = 300
+TRENDING_TOP_K = 200
+TRENDING_HALF_LIFE_HOURS = 48
+TRENDING_UNDATED_AGE_HOURS = 7 * 24
+TRENDING_PAGE_SIZE = 24
+TRENDING_MAX_LIMIT = 96
+
+# Engagement fields and their weights (fields a record lacks count as 0)
+TRENDING_WEIGHTS = {
+    'likes_count': 1,
+    'comments_count': 2,
+    'shares_count': 3,
+    'attendees_count': 1,
+    'views_count': 0.05,
+    'views': 0.05
+}
+
+TRENDING_SOURCES = {
+    'posts': load_posts,
+    'reels': load_reels,
+    'events': load_events,
+    'shop': load_shop
+}
+
+_trending = {'computed_at': None, 'items': None}  # items: type (or 'all') -> ranked list
+_trending_started = False
+
+def get_record_age_hours(record, now):
+    """Hours since a record was created, from its timestamp or created_at"""
+    for field in ('timestamp', 'created_at'):
+        value = record.get(field)
+        if isinstance(value, str) and value.strip():
+            try:
+                created = datetime.fromisoformat(value.strip()[:19])
+            except ValueError:
+                continue
+            return max(0.0, (now - created).total_seconds() / 3600)
+    return TRENDING_UNDATED_AGE_HOURS
+
+def score_trending(record, now):
+    """Time-decayed engagement score for a record"""
+    engagement = 0
+    for field, weight in TRENDING_WEIGHTS.items():
+        value = record.get(field)
+        if isinstance(value, (int, float)) and value > 0:
+            engagement += value * weight
+    return math.log2(1 + engagement) - get_record_age_hours(record, now) / TRENDING_HALF_LIFE_HOURS
+
+def compute_trending():
+    """Rank every trending source and keep the top TRENDING_TOP_K of each"""
+    now = datetime.now()
+    items = {}
+    
+    for collection, load in TRENDING_SOURCES.items():
+        records = [record for record in load() if record.get('id') is not None]
+        # Current counts: relation edges and unflushed counter increments
+        mark_relations(records, collection, None)
+        if collection in COUNTER_COLLECTIONS:
+            apply_pending_counts(records, collection)
+        
+        ranked = []
+        for record in records:
+            for flag in RELATION_FLAGS.get(collection, {}):
+                record.pop(flag, None)  # Viewer-specific, filled in per request
+            ranked.append({'type': collection, 'id': record['id'],
+                           'score': round(score_trending(record, now), 4), 'record': record})
+        items[collection] = heapq.nlargest(TRENDING_TOP_K, ranked, key=lambda item: item['score'])
+    
+    items['all'] = heapq.nlargest(TRENDING_TOP_K, (item for collection in TRENDING_SOURCES for item in items[collection]),
+                                  key=lambda item: item['score'])
+    return items
+
+def refresh_trending():
+    """Recompute the trending lists and swap them in"""
+    items = compute_trending()
+    _trending['items'] = items
+    _trending['computed_at'] = datetime.now().isoformat(timespec='seconds')
+
+def get_trending_page(kind='all', cursor=0, limit=TRENDING_PAGE_SIZE):
+    """
+    One page of a trending list ('all' or a source collection).
+    Returns (items, next_cursor); the cursor is the rank to continue from.
+    """
+    if _trending['items'] is None:
+        refresh_trending()  # First request before the background thread finished
+    ranked = _trending['items'].get(kind, [])
+    page = ranked[cursor:cursor + limit]
+    next_cursor = cursor + limit if cursor + limit < len(ranked) else None
+    return page, next_cursor
+
+def run_trending():
+    """Background task that recomputes trending every TRENDING_REFRESH_SECONDS"""
+    while True:
+        try:
+            refresh_trending()
+        except Exception as e:
+            print(f"Error computing trending: {e}")
+        time.sleep(TRENDING_REFRESH_SECONDS)
+
+def start_trending():
+    """Start the trending thread (once per process)"""
+    global _trending_started
+    if _trending_started:
+        return
+    _trending_started = True
+    threading.Thread(target=run_trending, daemon=True).start()
+
+start_trending()
+
+# ==================== Reels Feed ====================
+# The reels page and /api/reels?cursor= serve reels a page at a time from an
+# in-memory index checked against the reels.json version. Thumbnails have
+# downscaled derivatives for each of REEL_THUMBNAIL_WIDTHS, written once
+# under database/reels/derived when Pillow is installed (the original is
+# served otherwise), and each page carries Link rel=preload hints for the
+# thumbnails of the reels after it. Clients report views in batches, which
+# go into the sharded views_count counter.
+
+REELS_PAGE_SIZE = 5
+REELS_MAX_LIMIT = 20
+REELS_PRELOAD_AHEAD = 3  # Reels past the page whose thumbnails are preloaded
+REEL_THUMBNAIL_WIDTHS = (360, 720)
+REEL_PRELOAD_WIDTH = 720
+REEL_DERIVATIVES_FOLDER = os.path.join('database', 'reels', 'derived')
+REEL_VIEW_BATCH_MAX = 50  # Reels per view batch
+REEL_VIEW_MAX_PER_REEL = 10  # Views of one reel counted per batch
+
+_reel_index = None
+_reel_index_version = None
+
+def get_reel_index():
+    """Reels by id plus the id order, rebuilt when reels.json changed"""
+    global _reel_index, _reel_index_version
+    version = get_collection_version('reels')
+    if _reel_index is None or version != _reel_index_version:
+        reels = [reel for reel in load_reels() if reel.get('id') is not None]
+        _reel_index = {'reels': {reel['id']: reel for reel in reels}, 'ids': [reel['id'] for reel in reels]}
+        _reel_index_version = version
+    return _reel_index
+
+def get_reels_page(cursor=None, limit=REELS_PAGE_SIZE):
+    """
+    One page of reels after the cursor (the last reel id shown).
+    Returns (copies of the page, next_cursor, copies of the reels to preload).
+    """
+    index = get_reel_index()
+    ids = index['ids']
+    
+    start = 0
+    if cursor is not None:
+        try:
+            start = ids.index(cursor) + 1
+        except ValueError:
+            start = len(ids)
+    page = ids[start:start + limit]
+    upcoming = ids[start + limit:start + limit + REELS_PRELOAD_AHEAD]
+    next_cursor = page[-1] if page and upcoming else None
+    
+    # Copies - callers fill in per-viewer fields
+    return ([dict(index['reels'][reel_id]) for reel_id in page], next_cursor,
+            [dict(index['reels'][reel_id]) for reel_id in upcoming])
+
+def get_reel_thumbnail(filename, width):
+    """
+    Name of a reel thumbnail downscaled to width, creating it on first use.
+    Returns None when the original should be served instead.
+    """
+    if Image is None or width not in REEL_THUMBNAIL_WIDTHS or os.path.basename(filename) != filename:
+        return None
+    
+    source_path = os.path.join('database', 'reels', filename)
+    stem, ext = os.path.splitext(filename)
+    derived_name = f"{stem}-w{width}{ext}"
+    derived_path = os.path.join(REEL_DERIVATIVES_FOLDER, derived_name)
+    try:
+        source_mtime = os.path.getmtime(source_path)
+        if os.path.getmtime(derived_path) >= source_mtime:
+            return derived_name
+    except OSError:
+        pass
+    
+    try:
+        with Image.open(source_path) as image:
+            if image.width <= width:
+                return None  # Already small enough
+            image_format = image.format
+            image.thumbnail((width, max(1, image.height * width // image.width)))
+            os.makedirs(REEL_DERIVATIVES_FOLDER, exist_ok=True)
+            temp_path = os.path.join(REEL_DERIVATIVES_FOLDER, f".{uuid.uuid4().hex}{ext}")
+            image.save(temp_path, format=image_format)
+        os.replace(temp_path, derived_path)
+        return derived_name
+    except Exception as e:
+        print(f"Error creating thumbnail for reel media {filename}: {e}")
+        return None
+
+def add_reel_thumbnails(reels):
+    """Set thumbnail derivative URLs and a srcset on reels"""
+    for reel in reels:
+        thumbnail = reel.get('video_thumbnail')
+        if not thumbnail:
+            continue
+        reel['thumbnails'] = {str(width): url_for('serve_reel_thumbnail', width=width, filename=thumbnail)
+                              for width in REEL_THUMBNAIL_WIDTHS}
+        reel['thumbnail_srcset'] = ', '.join(f"{url} {width}w" for width, url in reel['thumbnails'].items())
+    return reels
+
+def prepare_reels(reels, username):
+    """Fill in viewer flags, current counts and thumbnail URLs"""
+    mark_relations(reels, 'reels', username)
+    apply_pending_counts(reels, 'reels')
+    return add_reel_thumbnails(reels)
+
+def set_reel_preload_links(response, upcoming):
+    """Add Link rel=preload hints for the thumbnails of the reels coming next"""
+    links = [f"<{reel['thumbnails'][str(REEL_PRELOAD_WIDTH)]}>; rel=preload; as=image"
+             for reel in upcoming if reel.get('thumbnails')]
+    if links:
+        response.headers['Link'] = ', '.join(links)
+    return response
+
 # ==================== New Page Routes ====================
 
 @app.route('/explore')
@@ -1994,13 +4922,18 @@ def explore():
     query = request.args.get('q', '').strip()
     filter_type = request.args.get('filter', 'all')
     
-    # If no query, show empty results
+    # If no query, show the precomputed trending feed
     if not query:
+        trending_type = filter_type if filter_type in TRENDING_SOURCES else 'all'
+        trending, trending_cursor = get_trending_page(trending_type)
         return render_template('explore.html', 
                              query='', 
                              filter_type=filter_type,
                              results={'users': [], 'posts': [], 'events': [], 'groups': []},
-                             total_results=0)
+                             total_results=0,
+                             trending=trending,
+                             trending_type=trending_type,
+                             trending_cursor=trending_cursor)
     
     # Perform search from database
     results = {
@@ -2056,11 +4989,41 @@ def explore():
                          results=results,
                          total_results=total_results)
 
+@app.route('/api/explore/trending')
+def api_trending():
+    """
+    Ranked trending items: /api/explore/trending?type=all|posts|reels|events|shop&cursor=0&limit=24
+    Includes the rendered tiles for the explore grid.
+    """
+    kind = request.args.get('type', 'all')
+    if kind != 'all' and kind not in TRENDING_SOURCES:
+        return jsonify({'success': False, 'error': 'Invalid type'}), 400
+    
+    limit = request.args.get('limit', type=int, default=TRENDING_PAGE_SIZE)
+    limit = max(1, min(limit, TRENDING_MAX_LIMIT))
+    cursor = request.args.get('cursor', type=int, default=0)
+    if cursor < 0:
+        return jsonify({'success': False, 'error': 'Invalid cursor'}), 400
+    
+    items, next_cursor = get_trending_page(kind, cursor, limit)
+    html = ''.join(render_template('explore/trending_tile.html', item=item) for item in items)
+    
+    return jsonify({
+        'success': True,
+        'items': items,
+        'html': html,
+        'computed_at': _trending['computed_at'],
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
+    })
+
 @app.route('/reels')
 def reels():
-    """Render reels page"""
-    reels = load_reels()
-    return render_template('reels.html', reels=reels)
+    """Render reels page (first page - the rest is loaded from /api/reels)"""
+    reels, next_cursor, upcoming = get_reels_page()
+    prepare_reels(reels + upcoming, session.get('username'))
+    response = make_response(render_template('reels.html', reels=reels, next_cursor=next_cursor))
+    return set_reel_preload_links(response, upcoming)
 
 @app.route('/create')
 def create():
@@ -2075,33 +5038,14 @@ def preview_post():
 @app.route('/shop')
 def shop():
     """Render shop page"""
-    from datetime import datetime, timedelta
-    products = load_shop()
+    # Products come pre-sorted from the recency index (new products first)
+    products = [dict(p) for p in get_featured_shop_products()]
     categories = get_shop_categories()
     search_query = request.args.get('q', '').strip().lower()
     
-    # Calculate if product is new (created within last 7 days)
-    current_date = datetime.now().date()
-    today_str = datetime.now().strftime('%Y-%m-%d')
-    
-    for product in products:
-        try:
-            # Ensure created_at exists, default to today if missing
-            if 'created_at' not in product or not product.get('created_at'):
-                product['created_at'] = today_str
-            
-            created_date_str = product.get('created_at', '')
-            if created_date_str:
-                created_date = datetime.strptime(created_date_str, '%Y-%m-%d').date()
-                days_old = (current_date - created_date).days
-                # Mark as new if created within last 7 days
-                product['is_new'] = days_old <= 7 and days_old >= 0
-            else:
-                # If still empty, mark as new (just created)
-                product['is_new'] = True
-        except Exception as e:
-            print(f"Error calculating is_new for product {product.get('id')}: {e}")
-            product['is_new'] = False
+    # created_at is normalized at write time, so is_new is a string comparison
+    mark_new_items(products)
+    apply_pending_counts(products, 'shop')
     
     # Filter products by search query if provided
     if search_query:
@@ -2120,23 +5064,6 @@ def shop():
                 filtered_products.append(product)
         products = filtered_products
     
-    # Sort products: new products first, then by created date (newest first)
-    def sort_key(product):
-        # Return tuple: (not is_new, -days_old)
-        # This ensures is_new=True products come first (False < True)
-        # Within each group, sort by newest first
-        is_new = product.get('is_new', False)
-        try:
-            created_date_str = product.get('created_at', today_str)
-            created_date = datetime.strptime(created_date_str, '%Y-%m-%d').date()
-            days_old = (current_date - created_date).days
-        except:
-            days_old = 0
-        # Return (0 for new, 1 for old), (-days_old for reverse date sort)
-        return (0 if is_new else 1, -days_old)
-    
-    products = sorted(products, key=sort_key)
-    
     return render_template('shop.html', products=products, categories=categories, 
                          get_shop_category_icon=get_shop_category_icon, search_query=search_query)
 
@@ -2148,7 +5075,6 @@ def upload_product():
 @app.route('/shop/<int:product_id>')
 def product_detail(product_id):
     """Render product detail page"""
-    from datetime import datetime
     products = load_shop()
     product = None
     
@@ -2160,102 +5086,79 @@ def product_detail(product_id):
     if not product:
         return "Product not found", 404
     
-    # Calculate if product is new (created within last 7 days)
-    try:
-        # Ensure created_at exists, default to today if missing
-        current_date = datetime.now().date()
-        today_str = datetime.now().strftime('%Y-%m-%d')
-        
-        if 'created_at' not in product or not product.get('created_at'):
-            product['created_at'] = today_str
-        
-        created_date_str = product.get('created_at', '')
-        if created_date_str:
-            created_date = datetime.strptime(created_date_str, '%Y-%m-%d').date()
-            days_old = (current_date - created_date).days
-            # Mark as new if created within last 7 days
-            product['is_new'] = days_old <= 7 and days_old >= 0
-        else:
-            # If still empty, mark as new (just created)
-            product['is_new'] = True
-    except Exception as e:
-        print(f"Error calculating is_new for product {product.get('id')}: {e}")
-        product['is_new'] = False
+    product['is_new'] = is_new_item(product)
     
     # Check if current user is the seller
     current_username = session.get('username', 'john_doe')
     is_seller = product.get('seller_username') == current_username
     
-    # Increment views counter
-    product['views'] = product.get('views', 0) + 1
-    # Save updated views to database
-    products = load_shop()
-    for p in products:
-        if p['id'] == product_id:
-            p['views'] = product['views']
-            break
-    save_shop(products)
+    # Increment views counter (flushed to shop.json in the background)
+    increment_counter('shop', product_id, 'views')
+    apply_pending_counts([product], 'shop')
     
     return render_template('shop_detail.html', product=product, is_seller=is_seller, get_shop_category_icon=get_shop_category_icon)
 
 @app.route('/api/shop')
+@conditional_get('shop', 'relations', daily=True)
 def api_shop():
-    """API endpoint to get all products"""
-    from datetime import datetime
-    products = load_shop()
+    """
+    API endpoint to get products.
+    Without parameters returns all products. With any of category, sort,
+    cursor or limit it returns one page read from the sorted shop indexes:
+    /api/shop?category=electronics&sort=price_asc&limit=20&cursor=...
+    """
+    paginated = any(arg in request.args for arg in ('category', 'sort', 'cursor', 'limit'))
+    if not paginated:
+        products = load_shop()
+        
+        # created_at is normalized at write time, so is_new is a string comparison
+        mark_new_items(products)
+        mark_relations(products, 'shop', session.get('username'))
+        apply_pending_counts(products, 'shop')
+        
+        return jsonify(products)
     
-    # Calculate if product is new (created within last 7 days)
-    current_date = datetime.now().date()
-    today_str = datetime.now().strftime('%Y-%m-%d')
+    category = request.args.get('category', '').strip() or None
+    sort = request.args.get('sort', 'newest')
+    if sort not in SHOP_SORTS:
+        return jsonify({'success': False, 'error': f'Invalid sort. Allowed: {", ".join(SHOP_SORTS)}'}), 400
     
-    for product in products:
-        try:
-            # Ensure created_at exists, default to today if missing
-            if 'created_at' not in product or not product.get('created_at'):
-                product['created_at'] = today_str
-            
-            created_date_str = product.get('created_at', '')
-            if created_date_str:
-                created_date = datetime.strptime(created_date_str, '%Y-%m-%d').date()
-                days_old = (current_date - created_date).days
-                # Mark as new if created within last 7 days
-                product['is_new'] = days_old <= 7 and days_old >= 0
-            else:
-                # If still empty, mark as new (just created)
-                product['is_new'] = True
-        except Exception as e:
-            print(f"Error calculating is_new for product {product.get('id')}: {e}")
-            product['is_new'] = False
+    limit = request.args.get('limit', type=int, default=SHOP_PAGE_DEFAULT_LIMIT)
+    limit = max(1, min(limit, SHOP_PAGE_MAX_LIMIT))
+    
+    cursor = None
+    if request.args.get('cursor'):
+        cursor = decode_shop_cursor(request.args['cursor'], sort)
+        if cursor is None:
+            return jsonify({'success': False, 'error': 'Invalid cursor'}), 400
+    
+    products, next_cursor = query_shop_index(category, sort, cursor, limit)
+    products = mark_new_items([dict(p) for p in products])
+    mark_relations(products, 'shop', session.get('username'))
+    apply_pending_counts(products, 'shop')
     
-    return jsonify(products)
+    return jsonify({
+        'success': True,
+        'products': products,
+        'category': category,
+        'sort': sort,
+        'limit': limit,
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
+    })
 
 @app.route('/api/shop', methods=['POST'])
 def create_product():
     """Create a new product"""
     try:
-        # Handle form data with file upload
+        # Handle form data with file upload (stored once the form is valid)
         featured_image = None
-        if 'image' in request.files:
-            file = request.files['image']
-            if file and file.filename and allowed_file(file.filename):
-                # Generate unique filename
-                filename = secure_filename(file.filename)
-                file_extension = filename.rsplit('.', 1)[1].lower()
-                unique_filename = f"{uuid.uuid4().hex}.{file_extension}"
-                
-                # Create shop directory if it doesn't exist - use database folder
-                shop_dir = os.path.join('database', 'shop')
-                os.makedirs(shop_dir, exist_ok=True)
-                
-                file_path = os.path.join(shop_dir, unique_filename)
-                file.save(file_path)
-                featured_image = unique_filename
+        image_file = get_uploaded_image('image')
         
-        if not featured_image:
+        if not image_file:
             return jsonify({'success': False, 'error': 'Product image is required'}), 400
         
         # Get form data
-        from datetime import datetime
         name = request.form.get('name', '').strip()
         description = request.form.get('description', '').strip()
         price_str = request.form.get('price', '').strip()
@@ -2292,20 +5195,14 @@ def create_product():
         except ValueError:
             return jsonify({'success': False, 'error': 'Invalid stock format'}), 400
         
-        # Set created_at to current date if not provided
-        if not created_at:
-            created_at = datetime.now().strftime('%Y-%m-%d')
-        else:
-            try:
-                datetime.strptime(created_at, '%Y-%m-%d')
-            except ValueError:
-                created_at = datetime.now().strftime('%Y-%m-%d')
+        # Store in the content-addressed media store
+        featured_image = store_uploaded_image(image_file)
         
         # Load existing products
         products = load_shop()
         
         # Generate new product ID
-        new_id = max([product.get('id', 0) for product in products], default=0) + 1
+        new_id = allocate_id('products')
         
         # Get current user from session
         seller_username = session.get('username', 'john_doe')
@@ -2324,11 +5221,11 @@ def create_product():
             'stock': stock,
             'views': 0,
             'created_at': created_at,
-            'is_favorite': False,
-            'is_bookmarked': False,
             'reviews': [],
             'reported_by': []
         }
+        # Normalize created_at once at write time (defaults to today)
+        normalize_created_at(new_product)
         
         # Add to products list
         products.append(new_product)
@@ -2337,9 +5234,11 @@ def create_product():
         if save_shop(products):
             return jsonify({'success': True, 'product': new_product}), 201
         else:
+            release_media_file(featured_image)
             return jsonify({'success': False, 'error': 'Failed to save product to database'}), 500
             
     except Exception as e:
+        release_media_file(featured_image)
         import traceback
         print(f"Error creating product: {e}")
         print(traceback.format_exc())
@@ -2347,21 +5246,19 @@ def create_product():
 
 @app.route('/api/shop/<int:product_id>/favorite', methods=['POST'])
 def toggle_product_favorite(product_id):
-    """Toggle favorite status for a product"""
+    """Toggle the current user's favorite of a product"""
     products = load_shop()
     target_product = None
     
     for product in products:
         if product['id'] == product_id:
             target_product = product
-            product['is_favorite'] = not product.get('is_favorite', False)
             break
     
     if target_product:
-        save_shop(products)
         return jsonify({
             'success': True, 
-            'is_favorite': target_product.get('is_favorite', False)
+            'is_favorite': toggle_relation('product_favorite', session.get('username'), product_id)
         })
     else:
         return jsonify({'success': False, 'error': 'Product not found'}), 404
@@ -2369,31 +5266,12 @@ def toggle_product_favorite(product_id):
 @app.route('/api/shop/<int:product_id>', methods=['GET'])
 def get_product(product_id):
     """Get a single product by ID"""
-    from datetime import datetime
     products = load_shop()
     for product in products:
         if product['id'] == product_id:
-            # Calculate if product is new (created within last 7 days)
-            try:
-                # Ensure created_at exists, default to today if missing
-                current_date = datetime.now().date()
-                today_str = datetime.now().strftime('%Y-%m-%d')
-                
-                if 'created_at' not in product or not product.get('created_at'):
-                    product['created_at'] = today_str
-                
-                created_date_str = product.get('created_at', '')
-                if created_date_str:
-                    created_date = datetime.strptime(created_date_str, '%Y-%m-%d').date()
-                    days_old = (current_date - created_date).days
-                    # Mark as new if created within last 7 days
-                    product['is_new'] = days_old <= 7 and days_old >= 0
-                else:
-                    # If still empty, mark as new (just created)
-                    product['is_new'] = True
-            except Exception as e:
-                print(f"Error calculating is_new for product {product.get('id')}: {e}")
-                product['is_new'] = False
+            product['is_new'] = is_new_item(product)
+            mark_relations([product], 'shop', session.get('username'))
+            apply_pending_counts([product], 'shop')
             return jsonify({'success': True, 'product': product})
     return jsonify({'success': False, 'error': 'Product not found'}), 404
 
@@ -2434,11 +5312,13 @@ def delete_product(product_id):
     """Delete a product"""
     try:
         products = load_shop()
-        original_count = len(products)
+        removed_products = [p for p in products if p['id'] == product_id]
         products = [p for p in products if p['id'] != product_id]
         
-        if len(products) < original_count:
-            save_shop(products)
+        if removed_products:
+            if save_shop(products):
+                for product in removed_products:
+                    release_media_file(product.get('featured_image'))
             return jsonify({'success': True})
         else:
             return jsonify({'success': False, 'error': 'Product not found'}), 404
@@ -2447,21 +5327,19 @@ def delete_product(product_id):
 
 @app.route('/api/shop/<int:product_id>/bookmark', methods=['POST'])
 def toggle_product_bookmark(product_id):
-    """Toggle bookmark status for a product"""
+    """Toggle the current user's bookmark of a product"""
     products = load_shop()
     target_product = None
     
     for product in products:
         if product['id'] == product_id:
             target_product = product
-            product['is_bookmarked'] = not product.get('is_bookmarked', False)
             break
     
     if target_product:
-        save_shop(products)
         return jsonify({
             'success': True, 
-            'is_bookmarked': target_product.get('is_bookmarked', False)
+            'is_bookmarked': toggle_relation('product_bookmark', session.get('username'), product_id)
         })
     else:
         return jsonify({'success': False, 'error': 'Product not found'}), 404
@@ -2517,7 +5395,8 @@ def add_product_review(product_id):
                     return jsonify({'success': False, 'error': 'Review text is required'}), 400
                 
                 # Generate new review ID
-                new_review_id = max([r.get('id', 0) for r in product['reviews']], default=0) + 1
+                new_review_id = allocate_id(f'product:{product_id}:reviews',
+                                            seed=lambda: max([r.get('id', 0) for r in product['reviews']], default=0))
                 
                 # Create new review
                 new_review = {
@@ -2616,20 +5495,8 @@ def delete_product_review(product_id, review_id):
 @app.route('/api/shop/new-count')
 def get_new_products_count():
     """Get count of new products (created within last 24 hours)"""
-    from datetime import datetime
-    products = load_shop()
-    current_date = datetime.now().date()
-    new_count = 0
-    
-    for product in products:
-        try:
-            created_date = datetime.strptime(product.get('created_at', ''), '%Y-%m-%d').date()
-            if (current_date - created_date).days == 0:
-                new_count += 1
-        except:
-            pass
-    
-    return jsonify({'new_count': new_count})
+    return jsonify({'new_count': _get_badge_part('shop', None, get_collection_version('shop'),
+                                                 lambda: count_new_today(get_shop_index()['products'].values()))})
 
 @app.route('/api/shop/categories')
 def api_shop_categories():
@@ -2648,26 +5515,32 @@ def api_shop_categories():
 def serve_shop_image_db(filename):
     """Serve shop images from database/shop folder"""
     shop_dir = os.path.join('database', 'shop')
-    return send_from_directory(shop_dir, filename)
+    return send_media(shop_dir, filename)
 
 # Legacy route - kept for backward compatibility but redirects to database folder
 @app.route('/static/images/shop/<filename>')
 def serve_shop_image(filename):
     """Legacy route - redirects to database folder"""
     shop_dir = os.path.join('database', 'shop')
-    return send_from_directory(shop_dir, filename)
+    return send_media(shop_dir, filename)
 
 @app.route('/database/avatars/<filename>')
 def serve_avatar(filename):
     """Serve user avatars from database/avatars folder"""
     avatars_dir = os.path.join('database', 'avatars')
-    return send_from_directory(avatars_dir, filename)
+    return send_media(avatars_dir, filename)
 
 @app.route('/database/posts/<filename>')
 def serve_post_image(filename):
     """Serve post images from database/posts folder"""
     posts_dir = os.path.join('database', 'posts')
-    return send_from_directory(posts_dir, filename)
+    return send_media(posts_dir, filename)
+
+@app.route('/database/media/<filename>')
+def serve_media_blob(filename):
+    """Serve content-addressed media blobs from database/media folder"""
+    media_folder = app.config.get('MEDIA_STORE_FOLDER', MEDIA_STORE_FOLDER)
+    return send_media(media_folder, filename)
 
 @app.route('/database/reels/<filename>')
 def serve_reel_media(filename):
@@ -2675,6 +5548,16 @@ def serve_reel_media(filename):
     reels_dir = os.path.join('database', 'reels')
     return send_from_directory(reels_dir, filename)
 
+@app.route('/database/reels/w<int:width>/<filename>')
+def serve_reel_thumbnail(width, filename):
+    """Serve a reel thumbnail downscaled to width, or the original if none can be made"""
+    if width not in REEL_THUMBNAIL_WIDTHS:
+        abort(404)
+    derived_name = get_reel_thumbnail(filename, width)
+    if derived_name:
+        return send_from_directory(REEL_DERIVATIVES_FOLDER, derived_name)
+    return serve_reel_media(filename)
+
 @app.route('/profile')
 @app.route('/profile/<username>')
 def profile(username=None):
@@ -2697,14 +5580,17 @@ def profile(username=None):
         # Return 404 if user not found
         return "User not found", 404
     
-    # Get user's posts - filter by user_id or username
-    all_posts = load_posts()
-    user_posts = [p for p in all_posts if p.get('user', {}).get('username') == username or p.get('username') == username]
+    mark_relations([user], 'users', current_username)
+    
+    # First page of the user's posts, read from their profile index
+    user_posts, posts_next_cursor = get_profile_grid(username, 'posts')
+    mark_relations(user_posts, 'posts', current_username)
     
     # Get saved posts - only show if viewing own profile
-    saved_posts = []
+    saved_posts, saved_next_cursor = [], None
     if username == current_username:
-        saved_posts = [p for p in all_posts if p.get('is_saved', False)]
+        saved_posts, saved_next_cursor = get_profile_grid(username, 'saved')
+        mark_relations(saved_posts, 'posts', current_username)
     
     # Check if viewing own profile
     is_own_profile = (username == current_username)
@@ -2713,6 +5599,8 @@ def profile(username=None):
                          user=user, 
                          user_posts=user_posts,
                          saved_posts=saved_posts,
+                         posts_next_cursor=posts_next_cursor,
+                         saved_next_cursor=saved_next_cursor,
                          is_own_profile=is_own_profile)
 
 @app.route('/messages')
@@ -2723,103 +5611,8 @@ def messages():
     if not current_username:
         return redirect(url_for('login'))
     
-    all_conversations = load_messages()
-    # Filter conversations where current user is a participant
-    # A user is a participant if:
-    # 1. The conversation was created from their perspective (conv_username == current_username)
-    # 2. OR they have sent messages in the conversation
-    # 3. OR the other user has sent messages to them (even if they haven't replied yet)
-    user_conversations = []
-    for conv in all_conversations:
-        is_participant = False
-        conv_username = conv.get('user', {}).get('username')
-        conv_messages = conv.get('messages', [])
-        
-        # Always ensure receiver info shows the OTHER user (not current user)
-        other_user_username = None
-        
-        # Case 1: Current user is the "other" user in the conversation
-        # This means someone started a conversation with current user
-        if conv_username == current_username:
-            is_participant = True
-            # Need to find who the actual other user is (the one who created the conversation)
-            # Look for the first message sender who is not the current user
-            for message in conv_messages:
-                sender = message.get('sender')
-                if sender and sender != current_username:
-                    other_user_username = sender
-                    break
-        else:
-            # Case 2: Check if current user has sent any messages
-            has_current_user_message = any(m.get('sender') == current_username for m in conv_messages)
-            # Case 3: Check if the other user (conv_username) has sent any messages
-            # This covers cases where someone messaged the current user but they haven't replied
-            has_other_user_message = any(m.get('sender') == conv_username for m in conv_messages)
-            # Case 4: Check if current user has received messages (any message not from current user)
-            has_received_messages = any(m.get('sender') != current_username for m in conv_messages)
-            
-            # If current user sent messages OR other user sent messages OR there are any messages, include it
-            if has_current_user_message or has_other_user_message or has_received_messages:
-                is_participant = True
-            
-            # Set other_user_username for updating user info
-            if conv_username and conv_username != current_username:
-                other_user_username = conv_username
-            else:
-                # Find the other user from messages
-                for message in conv_messages:
-                    sender = message.get('sender')
-                    if sender and sender != current_username:
-                        other_user_username = sender
-                        break
-        
-        # Update user info with the correct other user
-        if other_user_username:
-            other_user = get_user_by_username(other_user_username)
-            if other_user:
-                conv['user'] = {
-                    'username': other_user.get('username'),
-                    'full_name': other_user.get('full_name', other_user.get('username')),
-                    'avatar': other_user.get('avatar', 'avatar-1.jpg'),
-                }
-        
-        # Only include conversations that have actual messages from real users
-        # Check that there are actual messages and they're not just placeholder messages
-        has_real_messages = False
-        if len(conv_messages) > 0:
-            # Check if messages have actual content (not just "No messages yet" placeholder)
-            for msg in conv_messages:
-                msg_text = msg.get('text', '').strip()
-                if msg_text and msg_text.lower() != 'no messages yet':
-                    has_real_messages = True
-                    break
-        
-        if is_participant and has_real_messages:
-            # Set last_message from the actual last message in messages array
-            if conv_messages and len(conv_messages) > 0:
-                last_msg = conv_messages[-1]
-                conv['last_message'] = {
-                    'text': last_msg.get('text', ''),
-                    'timestamp': last_msg.get('timestamp', ''),
-                    'sender': last_msg.get('sender', '')
-                }
-            elif not conv.get('last_message'):
-                conv['last_message'] = {'text': '', 'timestamp': '', 'sender': ''}
-            
-            user_conversations.append(conv)
-    
-    # Sort conversations by last message timestamp (most recent first)
-    def get_last_message_time(conv):
-        messages = conv.get('messages', [])
-        if not messages:
-            return 0
-        # Try to parse timestamp or use a default
-        last_msg = messages[-1]
-        timestamp = last_msg.get('timestamp', '')
-        # For now, just return message ID as proxy for time (higher ID = more recent)
-        return last_msg.get('id', 0)
-    
-    user_conversations.sort(key=get_last_message_time, reverse=True)
+    # Same entries as /api/messages, read in recency order from the user's inbox
+    user_conversations = get_conversation_views(current_username)
     
     return render_template('messages.html', conversations=user_conversations, current_username=current_username)
 
@@ -2834,22 +5627,12 @@ def get_user_groups_optimized(all_groups, current_username, include_messages=Fal
         include_messages: If True, includes full messages array (default: False for list view)
     """
     user_groups = []
+    groups_by_id = {group.get('id'): group for group in all_groups}
     
-    for group in all_groups:
-        # Fast membership check - check admin first (most common case)
-        is_member = False
-        if group.get('admin') == current_username:
-            is_member = True
-        elif group.get('members'):
-            # Optimized membership check with early exit
-            members = group['members']
-            # Check if username exists in members (faster than any() with generator)
-            for member in members:
-                if member.get('username') == current_username:
-                    is_member = True
-                    break
-        
-        if not is_member:
+    # Walk the user's inbox (already in recency order) rather than every group
+    for group_id in get_thread_inbox('group', current_username):
+        group = groups_by_id.get(group_id)
+        if not group or not is_group_member(group, current_username):
             continue
         
         # Create a lightweight copy for processing (don't include messages array by default)
@@ -2907,20 +5690,13 @@ def get_user_groups_optimized(all_groups, current_username, include_messages=Fal
                         unread_count += 1
                 processed_group['unread_count'] = unread_count
             
-            # Store last message ID for sorting (don't need full messages array)
-            processed_group['_sort_key'] = last_msg.get('id', 0)
+            # Last message ID is the sort key (clients merging deltas sort by it too)
+            processed_group['last_message_id'] = last_msg.get('id', 0)
         else:
-            processed_group['_sort_key'] = 0
+            processed_group['last_message_id'] = 0
         
         user_groups.append(processed_group)
     
-    # Sort by last message ID (most recent first) - using pre-calculated sort key
-    user_groups.sort(key=lambda g: g.get('_sort_key', 0), reverse=True)
-    
-    # Remove internal sort key before returning
-    for group in user_groups:
-        group.pop('_sort_key', None)
-    
     return user_groups
 
 def get_group_by_id_optimized(group_id, current_username=None):
@@ -3029,14 +5805,62 @@ def settings():
 
 @app.route('/api/reels')
 def api_reels():
-    """API endpoint to get all reels"""
-    reels = load_reels()
-    return jsonify(reels)
+    """
+    API endpoint to get reels. Without parameters returns every reel; with
+    cursor and/or limit returns one page: ?limit=5&cursor=<last reel id>
+    """
+    if 'cursor' not in request.args and 'limit' not in request.args:
+        reels = apply_pending_counts(mark_relations(load_reels(), 'reels', session.get('username')), 'reels')
+        return jsonify(reels)
+    
+    limit = request.args.get('limit', type=int, default=REELS_PAGE_SIZE)
+    limit = max(1, min(limit, REELS_MAX_LIMIT))
+    cursor = request.args.get('cursor', type=int)
+    if request.args.get('cursor') and cursor is None:
+        return jsonify({'success': False, 'error': 'Invalid cursor'}), 400
+    
+    reels, next_cursor, upcoming = get_reels_page(cursor, limit)
+    prepare_reels(reels + upcoming, session.get('username'))
+    html = ''.join(render_template('reels/reel_item.html', reel=reel) for reel in reels)
+    response = jsonify({
+        'success': True,
+        'reels': reels,
+        'html': html,
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
+    })
+    return set_reel_preload_links(response, upcoming)
+
+@app.route('/api/reels/views', methods=['POST'])
+def record_reel_views():
+    """
+    Count a batch of reel views reported by the client:
+    {"views": {"<reel id>": <views>, ...}}
+    """
+    data = request.get_json(silent=True) or {}
+    views = data.get('views')
+    if not isinstance(views, dict) or len(views) > REEL_VIEW_BATCH_MAX:
+        return jsonify({'success': False, 'error': 'Invalid view batch'}), 400
+    
+    reels_by_id = get_reel_index()['reels']
+    counted = 0
+    for reel_id, count in views.items():
+        try:
+            reel_id, count = int(reel_id), int(count)
+        except (TypeError, ValueError):
+            continue
+        if reel_id not in reels_by_id or count < 1:
+            continue
+        count = min(count, REEL_VIEW_MAX_PER_REEL)
+        increment_counter('reels', reel_id, 'views_count', count)
+        counted += count
+    
+    return jsonify({'success': True, 'counted': counted})
 
 @app.route('/api/users')
 def api_users():
     """API endpoint to get all users"""
-    users = load_users()
+    users = mark_relations(load_users(), 'users', session.get('username'))
     return jsonify(users)
 
 @app.route('/api/users/<username>')
@@ -3051,6 +5875,7 @@ def api_user(username):
                 break
         
         if user:
+            mark_relations([user], 'users', session.get('username'))
             return jsonify(user)
         else:
             return jsonify({'error': 'User not found'}), 404
@@ -3058,27 +5883,66 @@ def api_user(username):
         print(f"Error in api_user: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/api/users/<username>/follow', methods=['POST'])
+def toggle_user_follow(username):
+    """Toggle whether the current user follows another user"""
+    current_username = session.get('username')
+    user = get_user_by_username(username)
+    if not user:
+        return jsonify({'success': False, 'error': 'User not found'}), 404
+    if username == current_username:
+        return jsonify({'success': False, 'error': 'You cannot follow yourself'}), 400
+    
+    is_following = toggle_relation('follow', current_username, username)
+    mark_relations([user], 'users', current_username)
+    return jsonify({'success': True, 'is_following': is_following, 'followers_count': user['followers_count']})
+
+@app.route('/api/users/<username>/posts')
+@app.route('/api/users/<username>/saved', endpoint='api_user_saved', defaults={'grid': 'saved'})
+def api_user_posts(username, grid='posts'):
+    """
+    One page of a profile grid: /api/users/<username>/posts?cursor=<last post id>&limit=24
+    (/saved for the current user's saved posts). Includes the rendered tiles.
+    """
+    current_username = session.get('username')
+    if grid == 'saved' and username != current_username:
+        return jsonify({'success': False, 'error': 'Saved posts are private'}), 403
+    
+    limit = request.args.get('limit', type=int, default=PROFILE_GRID_PAGE_SIZE)
+    limit = max(1, min(limit, PROFILE_GRID_MAX_LIMIT))
+    cursor = request.args.get('cursor', type=int)
+    if request.args.get('cursor') and cursor is None:
+        return jsonify({'success': False, 'error': 'Invalid cursor'}), 400
+    
+    posts, next_cursor = get_profile_grid(username, grid, cursor, limit)
+    mark_relations(posts, 'posts', current_username)
+    html = ''.join(render_fragment('profile/post_tile.html', post, saved=grid == 'saved', likes_count=post['likes_count'])
+                   for post in posts)
+    
+    return jsonify({
+        'success': True,
+        'posts': posts,
+        'html': html,
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
+    })
+
 
 @app.route('/api/reels/<int:reel_id>/like', methods=['POST'])
 def toggle_reel_like(reel_id):
-    """Toggle like status for a reel"""
+    """Toggle the current user's like on a reel"""
     reels = load_reels()
     target_reel = None
     
     for reel in reels:
         if reel['id'] == reel_id:
             target_reel = reel
-            # Toggle like status
-            reel['is_liked'] = not reel.get('is_liked', False)
-            # Update like count
-            if reel['is_liked']:
-                reel['likes_count'] = reel.get('likes_count', 0) + 1
-            else:
-                reel['likes_count'] = max(0, reel.get('likes_count', 0) - 1)
             break
     
     if target_reel:
-        save_reels(reels)
+        current_username = session.get('username')
+        toggle_relation('reel_like', current_username, reel_id)
+        mark_relations([target_reel], 'reels', current_username)
         return jsonify({
             'success': True, 
             'is_liked': target_reel.get('is_liked', False),
@@ -3089,44 +5953,44 @@ def toggle_reel_like(reel_id):
 
 @app.route('/api/reels/<int:reel_id>/save', methods=['POST'])
 def toggle_reel_save(reel_id):
-    """Toggle save status for a reel"""
+    """Toggle the current user's save of a reel"""
     reels = load_reels()
     target_reel = None
     
     for reel in reels:
         if reel['id'] == reel_id:
             target_reel = reel
-            reel['is_saved'] = not reel.get('is_saved', False)
             break
     
     if target_reel:
-        save_reels(reels)
-        return jsonify({'success': True, 'is_saved': target_reel.get('is_saved', False)})
+        is_saved = toggle_relation('reel_save', session.get('username'), reel_id)
+        return jsonify({'success': True, 'is_saved': is_saved})
     else:
         return jsonify({'success': False, 'error': 'Reel not found'}), 404
 
 @app.route('/api/reels/<int:reel_id>/follow', methods=['POST'])
 def toggle_reel_follow(reel_id):
-    """Toggle follow status for a reel creator"""
+    """Toggle whether the current user follows a reel's creator"""
     reels = load_reels()
     target_reel = None
     
     for reel in reels:
         if reel['id'] == reel_id:
             target_reel = reel
-            # Toggle follow status (stored per reel for now)
-            reel['is_following'] = not reel.get('is_following', False)
             break
     
     if target_reel:
-        save_reels(reels)
-        return jsonify({'success': True, 'is_following': target_reel.get('is_following', False)})
+        current_username = session.get('username')
+        if target_reel.get('username') == current_username:
+            return jsonify({'success': False, 'error': 'You cannot follow yourself'}), 400
+        is_following = toggle_relation('follow', current_username, target_reel.get('username'))
+        return jsonify({'success': True, 'is_following': is_following})
     else:
         return jsonify({'success': False, 'error': 'Reel not found'}), 404
 
 @app.route('/api/reels/<int:reel_id>/comments', methods=['GET'])
 def get_reel_comments(reel_id):
-    """Get comments for a reel"""
+    """Get comments for a reel (see comment_page_response for paging)"""
     reels = load_reels()
     target_reel = None
     
@@ -3136,8 +6000,7 @@ def get_reel_comments(reel_id):
             break
     
     if target_reel:
-        comments = target_reel.get('comments', [])
-        return jsonify({'success': True, 'comments': comments})
+        return comment_page_response('reel', reel_id)
     else:
         return jsonify({'success': False, 'error': 'Reel not found'}), 404
 
@@ -3156,32 +6019,29 @@ def post_reel_comment(reel_id):
     for reel in reels:
         if reel['id'] == reel_id:
             target_reel = reel
-            # Initialize comments array if it doesn't exist
-            if 'comments' not in reel:
-                reel['comments'] = []
-            
-            # Add new comment
-            new_comment = {
-                'id': len(reel['comments']) + 1,
-                'username': 'current_user',  # In production, get from session
-                'text': comment_text,
-                'time_ago': 'Just now',
-                'avatar': 'avatar-2.jpg'
-            }
-            reel['comments'].append(new_comment)
-            
-            # Update comment count
-            reel['comments_count'] = len(reel['comments'])
             break
     
     if target_reel:
-        save_reels(reels)
+        added = add_comment('reel', reel_id, {
+            'username': 'current_user',  # In production, get from session
+            'text': comment_text,
+            'time_ago': 'Just now',
+            'avatar': 'avatar-2.jpg'
+        })
+        if added is None:
+            return jsonify({'success': False, 'error': 'Failed to save comment'}), 500
+        new_comment, _, comments_count = added
+        
+        # Update comment count (written behind the request)
+        queue_record_update('reels', reel_id, lambda reel: reel.update(comments_count=comments_count),
+                            key='comments_count')
         return jsonify({'success': True, 'comment': new_comment})
     else:
         return jsonify({'success': False, 'error': 'Reel not found'}), 404
 
 @app.route('/api/messages')
 @login_required
+@conditional_get('messages', 'users')
 def api_messages():
     """
     SECURE API endpoint to get all conversations for current user.
@@ -3191,90 +6051,85 @@ def api_messages():
     if not current_username or not validate_username(current_username):
         return jsonify({'error': 'Unauthorized'}), 401
     
-    all_conversations = load_messages()
-    user_conversations = []
+    if 'since' not in request.args:
+        return jsonify(get_conversation_views(current_username))
     
-    for conv in all_conversations:
-        # Use secure function to check if user is in conversation
-        if not is_user_in_conversation(conv, current_username):
-            continue
-        
-        # Only include conversations with real messages
-        conv_messages = conv.get('messages', [])
-        has_real_messages = False
-        if len(conv_messages) > 0:
-            for msg in conv_messages:
-                msg_text = msg.get('text', '').strip()
-                # Remove HTML tags to check actual content
-                if msg_text and msg_text.lower() not in ['no messages yet', '']:
-                    has_real_messages = True
-                    break
-        
-        if not has_real_messages:
-            continue
-        
-        # Always ensure receiver info shows the OTHER user (not current user)
-        conv_username = conv.get('user', {}).get('username')
-        other_user_username = None
-        
-        # If the conversation user is current user, find the actual other user from messages
-        if conv_username == current_username:
-            for message in conv_messages:
-                sender = message.get('sender')
-                if sender and sender != current_username and validate_username(sender):
-                    other_user_username = sender
-                    break
-        # Otherwise, verify the conversation user is not current user and find from messages if needed
-        else:
-            if conv_username and conv_username != current_username:
-                # Verify this user actually exists and has sent/received messages
-                other_user_username = conv_username
-            else:
-                # Find the other user from messages
-                for message in conv_messages:
-                    sender = message.get('sender')
-                    if sender and sender != current_username and validate_username(sender):
-                        other_user_username = sender
-                        break
-        
-        # Update user info with the correct other user
-        if other_user_username:
+    # Delta protocol: only threads changed after the client's version
+    version, changed = get_thread_changes('conversation', request.args.get('since', type=int))
+    if changed is None:
+        return jsonify({'version': version, 'full': True,
+                        'conversations': get_conversation_views(current_username)})
+    
+    # ids lists every conversation the user still has, so the client can drop the
+    # ones it holds that aren't there. Changed threads of other users are never named.
+    return jsonify({
+        'version': version,
+        'full': False,
+        'conversations': get_conversation_views(current_username, changed) if changed else [],
+        'ids': get_thread_inbox('conversation', current_username)
+    })
+
+def build_conversation_view(summary, current_username, users_by_name=None):
+    """
+    Build the conversation list entry for a user from its summary, or None if
+    the user can't see it. The other participant is shown as 'user';
+    last_message and unread_count are from the current user's perspective.
+    """
+    if not summary_includes_user(summary, current_username):
+        return None
+    
+    # Always ensure receiver info shows the OTHER user (not current user)
+    conv_username = summary['user'].get('username')
+    if conv_username and conv_username != current_username:
+        other_user_username = conv_username
+    else:
+        # First sender who isn't the current user
+        other_user_username = next((sender for sender in summary['senders'] if sender != current_username), None)
+    
+    display_user = summary['user']
+    if other_user_username:
+        if users_by_name is None:
             other_user = get_user_by_username(other_user_username)
-            if other_user:
-                conv['user'] = {
-                    'username': other_user.get('username'),
-                    'full_name': other_user.get('full_name', other_user.get('username')),
-                    'avatar': other_user.get('avatar', 'avatar-1.jpg')
-                }
-        
-        # Set last_message from the actual last message in messages array
-        if conv_messages and len(conv_messages) > 0:
-            last_msg = conv_messages[-1]
-            conv['last_message'] = {
-                'text': last_msg.get('text', ''),
-                'timestamp': last_msg.get('timestamp', ''),
-                'sender': last_msg.get('sender', '')
+        else:
+            other_user = users_by_name.get(other_user_username)
+        if other_user:
+            display_user = {
+                'username': other_user.get('username'),
+                'full_name': other_user.get('full_name', other_user.get('username')),
+                'avatar': other_user.get('avatar', 'avatar-1.jpg')
             }
-        elif not conv.get('last_message'):
-            conv['last_message'] = {'text': '', 'timestamp': '', 'sender': ''}
-        
-        # Calculate unread_count from current user's perspective (only messages received, not sent)
-        unread_count = sum(1 for m in conv_messages 
-                          if m.get('sender') != current_username and not m.get('is_read', False))
-        conv['unread_count'] = unread_count
-        
-        user_conversations.append(conv)
     
-    # Sort by last message ID (most recent first)
-    def get_last_message_id(conv):
-        messages = conv.get('messages', [])
-        if not messages:
-            return 0
-        return messages[-1].get('id', 0) if messages else 0
+    return {
+        'id': summary['id'],
+        'user': display_user,
+        'last_message': summary['last_message'],
+        'last_message_id': summary['last_message_id'],
+        # Only messages received count as unread, not messages sent
+        'unread_count': get_summary_unread_count(summary, current_username)
+    }
+
+def get_conversation_views(current_username, conversation_ids=None):
+    """Get a user's conversation list entries (optionally only some ids), most recent first"""
+    users_by_name = {u.get('username'): u for u in load_users()}
+    summaries = load_conversation_summaries()
+    if conversation_ids is None:
+        # Inbox is already in recency order
+        conversation_ids = get_thread_inbox('conversation', current_username)
+    else:
+        conversation_ids = sorted((cid for cid in conversation_ids if cid in summaries),
+                                  key=lambda cid: summaries[cid]['last_message_id'], reverse=True)
     
-    user_conversations.sort(key=get_last_message_id, reverse=True)
+    user_conversations = []
+    for conversation_id in conversation_ids:
+        summary = summaries.get(conversation_id)
+        # Only include conversations with real messages
+        if not summary or not summary['has_real_messages']:
+            continue
+        view = build_conversation_view(summary, current_username, users_by_name)
+        if view:
+            user_conversations.append(view)
     
-    return jsonify(user_conversations)
+    return user_conversations
 
 @app.route('/api/messages/search', methods=['GET'])
 @login_required
@@ -3291,88 +6146,36 @@ def search_messages():
     if not query:
         return jsonify({'conversations': [], 'messages': []})
     
-    all_conversations = load_messages()
+    users_by_name = {u.get('username'): u for u in load_users()}
+    summaries = load_conversation_summaries()
     matched_conversations = []
     matched_messages = {}
     
-    for conv in all_conversations:
-        # Check if user has access to this conversation
-        if not is_user_in_conversation(conv, current_username):
-            continue
-        
-        conv_username = conv.get('user', {}).get('username')
-        conv_messages = conv.get('messages', [])
-        
-        # Always ensure receiver info shows the OTHER user (not current user)
-        other_user_username = None
-        if conv_username == current_username:
-            for message in conv_messages:
-                sender = message.get('sender')
-                if sender and sender != current_username and validate_username(sender):
-                    other_user_username = sender
-                    break
-        else:
-            if conv_username and conv_username != current_username:
-                other_user_username = conv_username
-            else:
-                for message in conv_messages:
-                    sender = message.get('sender')
-                    if sender and sender != current_username and validate_username(sender):
-                        other_user_username = sender
-                        break
+    for conv in load_messages():
+        summary = summaries.get(conv.get('id'))
         
-        # Set display user to the correct other user
-        display_user = conv.get('user', {})
-        if other_user_username:
-            other_user = get_user_by_username(other_user_username)
-            if other_user:
-                display_user = {
-                    'username': other_user.get('username'),
-                    'full_name': other_user.get('full_name', other_user.get('username')),
-                    'avatar': other_user.get('avatar', 'avatar-1.jpg')
-                }
+        # Check if user has access to this conversation (builds the display entry too)
+        view = build_conversation_view(summary, current_username, users_by_name) if summary else None
+        if not view:
+            continue
         
         # Search in user name
-        user_name = display_user.get('full_name', '').lower()
-        username = display_user.get('username', '').lower()
+        user_name = view['user'].get('full_name', '').lower()
+        username = view['user'].get('username', '').lower()
         matches_name = query in user_name or query in username
         
         # Search in messages
-        matching_messages = []
-        for msg in conv_messages:
-            msg_text = msg.get('text', '').lower()
-            if query in msg_text:
-                matching_messages.append(msg)
+        matching_messages = [msg for msg in conv.get('messages', []) if query in msg.get('text', '').lower()]
         
-        # If matches name or has matching messages, include conversation
+        # If matches name or has matching messages, include conversation (summary only)
         if matches_name or matching_messages:
-            conv_copy = conv.copy()
-            conv_copy['user'] = display_user
-            
-            # Set last_message from the actual last message in messages array
-            if conv_messages and len(conv_messages) > 0:
-                last_msg = conv_messages[-1]
-                conv_copy['last_message'] = {
-                    'text': last_msg.get('text', ''),
-                    'timestamp': last_msg.get('timestamp', ''),
-                    'sender': last_msg.get('sender', '')
-                }
-            elif not conv_copy.get('last_message'):
-                conv_copy['last_message'] = {'text': '', 'timestamp': '', 'sender': ''}
-            
-            matched_conversations.append(conv_copy)
+            matched_conversations.append(view)
             
             if matching_messages:
                 matched_messages[conv.get('id')] = matching_messages
     
     # Sort by last message ID
-    def get_last_message_id(conv):
-        messages = conv.get('messages', [])
-        if not messages:
-            return 0
-        return messages[-1].get('id', 0) if messages else 0
-    
-    matched_conversations.sort(key=get_last_message_id, reverse=True)
+    matched_conversations.sort(key=lambda conv: conv.get('last_message_id', 0), reverse=True)
     
     return jsonify({
         'conversations': matched_conversations,
@@ -3437,8 +6240,7 @@ def start_conversation(username):
         })
     
     # Create new conversation
-    max_id = max([c.get('id', 0) for c in conversations], default=0)
-    new_conversation_id = max_id + 1
+    new_conversation_id = allocate_id('conversations')
     
     new_conversation = {
         'id': new_conversation_id,
@@ -3459,7 +6261,7 @@ def start_conversation(username):
     
     conversations.append(new_conversation)
     
-    if save_messages(conversations):
+    if save_messages(conversations, [new_conversation_id]):
         conversation_token = generate_conversation_token(new_conversation_id, current_username)
         username_token = generate_username_token(target_user.get('username'))
         
@@ -3663,8 +6465,7 @@ def get_conversation_by_username_token(token):
         })
     else:
         # Create new conversation
-        max_id = max([c.get('id', 0) for c in conversations], default=0)
-        new_conversation_id = max_id + 1
+        new_conversation_id = allocate_id('conversations')
         
         new_conversation = {
             'id': new_conversation_id,
@@ -3685,7 +6486,7 @@ def get_conversation_by_username_token(token):
         
         conversations.append(new_conversation)
         
-        if save_messages(conversations):
+        if save_messages(conversations, [new_conversation_id]):
             conversation_token = generate_conversation_token(new_conversation_id, current_username)
             return jsonify({
                 'success': True,
@@ -3793,7 +6594,8 @@ def send_message(conversation_id):
     
     # Generate new message ID
     existing_messages = conversation.get('messages', [])
-    new_message_id = max([m.get('id', 0) for m in existing_messages], default=0) + 1
+    new_message_id = allocate_id(f'conversation:{conversation_id}:messages',
+                                 seed=lambda: max([m.get('id', 0) for m in existing_messages], default=0))
     
     # Get current user's info
     current_user = get_user_by_username(current_username)
@@ -3836,16 +6638,12 @@ def send_message(conversation_id):
         # Create notification for the user whose message was replied to
         replied_to_username = reply_to.get('sender', '')
         if replied_to_username and replied_to_username != current_username:
-            # Create reply notification
-            notifications = load_notifications()
-            notification_id = max([n.get('id', 0) for n in notifications], default=0) + 1
-            
             # Get sender info for notification
             sender_user = get_user_by_username(current_username)
             sender_avatar_notif = sender_user.get('avatar', 'avatar-1.jpg') if sender_user else 'avatar-1.jpg'
             
+            # Create reply notification (id is assigned by add_notification)
             reply_notification = {
-                'id': notification_id,
                 'type': 'message_reply',
                 'user': current_username,
                 'target_user': replied_to_username,  # User who should receive this notification
@@ -3857,8 +6655,7 @@ def send_message(conversation_id):
                 'is_read': False,
                 'action_text': f'replied to your message'
             }
-            notifications.insert(0, reply_notification)
-            save_notifications(notifications)
+            add_notification(reply_notification)
     
     # Add message to conversation
     conversation['messages'].append(new_message)
@@ -3878,7 +6675,8 @@ def send_message(conversation_id):
         conversation['unread_count'] = conversation.get('unread_count', 0) + 1
     
     # Save to database (save_messages will validate and sanitize again)
-    if save_messages(conversations):
+    if save_messages(conversations, [conversation_id]):
+        touch_thread_inboxes('conversation', conversation)
         return jsonify({
             'success': True,
             'message': new_message
@@ -3940,23 +6738,33 @@ def poll_messages(conversation_id):
         enriched_new_messages.append(enriched_message)
     
     # Mark messages as read if they're from the other user
-    updated = False
+    read_up_to = 0
     for message in enriched_new_messages:
         if message.get('sender') != current_username and not message.get('is_read', False):
             message['is_read'] = True
-            updated = True
+            read_up_to = max(read_up_to, message.get('id', 0))
+    
+    # Everything the other user sent up to the newest delivered message has been seen
+    def is_unread(m):
+        return (m.get('sender') != current_username and not m.get('is_read', False)
+                and m.get('id', 0) > read_up_to)
     
     # Update unread count
-    if updated:
-        unread_count = sum(1 for m in all_messages 
-                          if m.get('sender') != current_username and not m.get('is_read', False))
-        conversation['unread_count'] = unread_count
-        save_messages(conversations)  # Save updated read status
+    unread_count = sum(1 for m in all_messages if is_unread(m))
+    if read_up_to:
+        # Read receipts are written behind the request (polling is a read). Each
+        # poll's receipt covers the earlier ones, so it replaces them in the queue.
+        def mark_read(conv):
+            for m in conv.get('messages', []):
+                if m.get('sender') != current_username and m.get('id', 0) <= read_up_to:
+                    m['is_read'] = True
+            conv['unread_count'] = sum(1 for m in conv.get('messages', []) if is_unread(m))
+        queue_record_update('messages', conversation_id, mark_read, key=('read', current_username))
     
     return jsonify({
         'new_messages': enriched_new_messages,
         'last_message_id': max([m.get('id', 0) for m in all_messages], default=0),
-        'unread_count': conversation.get('unread_count', 0)
+        'unread_count': unread_count
     })
 
 @app.route('/api/messages/<int:conversation_id>/mark-read', methods=['POST'])
@@ -3997,7 +6805,7 @@ def mark_conversation_read(conversation_id):
                           if m.get('sender') != current_username and not m.get('is_read', False))
         conversation['unread_count'] = unread_count
         
-        if save_messages(conversations):
+        if save_messages(conversations, [conversation_id]):
             return jsonify({
                 'success': True,
                 'unread_count': unread_count
@@ -4012,6 +6820,7 @@ def mark_conversation_read(conversation_id):
 
 @app.route('/api/groups')
 @login_required
+@conditional_get('groups')
 def api_groups():
     """
     SECURE API endpoint to get all groups for current user.
@@ -4022,13 +6831,27 @@ def api_groups():
     if not current_username or not validate_username(current_username):
         return jsonify({'error': 'Unauthorized'}), 401
     
-    # Load groups once
-    all_groups = load_groups()
+    if 'since' not in request.args:
+        # Use optimized processing function (don't include full messages for list view)
+        return jsonify(get_user_groups_optimized(load_groups(), current_username, include_messages=False))
     
-    # Use optimized processing function (don't include full messages for list view)
-    user_groups = get_user_groups_optimized(all_groups, current_username, include_messages=False)
+    # Delta protocol: only groups changed after the client's version
+    version, changed = get_thread_changes('group', request.args.get('since', type=int))
+    if changed is None:
+        return jsonify({'version': version, 'full': True,
+                        'groups': get_user_groups_optimized(load_groups(), current_username, include_messages=False)})
     
-    return jsonify(user_groups)
+    updated = []
+    if changed:
+        updated = get_user_groups_optimized([g for g in load_groups() if g.get('id') in changed], current_username)
+    
+    # ids lists every group the user is still in (see api_messages)
+    return jsonify({
+        'version': version,
+        'full': False,
+        'groups': updated,
+        'ids': get_thread_inbox('group', current_username)
+    })
 
 @app.route('/api/search')
 def api_search():
@@ -4120,34 +6943,15 @@ def api_search():
 @app.route('/api/shop/search')
 def api_shop_search():
     """Shop products search endpoint"""
-    from datetime import datetime
     query = request.args.get('q', '').strip().lower()
     
-    products = load_shop()
+    # Products come pre-sorted from the recency index (new products first)
+    products = [dict(p) for p in get_featured_shop_products()]
     categories = get_shop_categories()
     
-    # Calculate if product is new (created within last 7 days)
-    current_date = datetime.now().date()
-    today_str = datetime.now().strftime('%Y-%m-%d')
-    
-    for product in products:
-        try:
-            # Ensure created_at exists, default to today if missing
-            if 'created_at' not in product or not product.get('created_at'):
-                product['created_at'] = today_str
-            
-            created_date_str = product.get('created_at', '')
-            if created_date_str:
-                created_date = datetime.strptime(created_date_str, '%Y-%m-%d').date()
-                days_old = (current_date - created_date).days
-                # Mark as new if created within last 7 days
-                product['is_new'] = days_old <= 7 and days_old >= 0
-            else:
-                # If still empty, mark as new (just created)
-                product['is_new'] = True
-        except Exception as e:
-            print(f"Error calculating is_new for product {product.get('id')}: {e}")
-            product['is_new'] = False
+    # created_at is normalized at write time, so is_new is a string comparison
+    mark_new_items(products)
+    apply_pending_counts(products, 'shop')
     
     # Filter products by search query if provided
     if query:
@@ -4166,23 +6970,6 @@ def api_shop_search():
                 filtered_products.append(product)
         products = filtered_products
     
-    # Sort products: new products first, then by created date (newest first)
-    def sort_key(product):
-        # Return tuple: (not is_new, -days_old)
-        # This ensures is_new=True products come first (False < True)
-        # Within each group, sort by newest first
-        is_new = product.get('is_new', False)
-        try:
-            created_date_str = product.get('created_at', today_str)
-            created_date = datetime.strptime(created_date_str, '%Y-%m-%d').date()
-            days_old = (current_date - created_date).days
-        except:
-            days_old = 0
-        # Return (0 for new, 1 for old), (-days_old for reverse date sort)
-        return (0 if is_new else 1, -days_old)
-    
-    products = sorted(products, key=sort_key)
-    
     return jsonify({
         'products': products,
         'categories': categories,
@@ -4194,40 +6981,12 @@ def api_shop_search():
 def create_group():
     """Create a new group"""
     try:
-        # Handle form data with file uploads
+        # Handle form data with file uploads (stored once the form is valid)
+        avatar_file = get_uploaded_image('avatar')
+        cover_file = get_uploaded_image('cover')
         avatar_filename = None
         cover_filename = None
         
-        if 'avatar' in request.files:
-            file = request.files['avatar']
-            if file and file.filename and allowed_file(file.filename):
-                # Generate unique filename
-                filename = secure_filename(file.filename)
-                file_extension = filename.rsplit('.', 1)[1].lower()
-                unique_filename = f"group-{uuid.uuid4().hex}.{file_extension}"
-                
-                # Save to database/groups folder
-                groups_folder = os.path.join('database', 'groups')
-                os.makedirs(groups_folder, exist_ok=True)
-                file_path = os.path.join(groups_folder, unique_filename)
-                file.save(file_path)
-                avatar_filename = unique_filename
-        
-        if 'cover' in request.files:
-            file = request.files['cover']
-            if file and file.filename and allowed_file(file.filename):
-                # Generate unique filename
-                filename = secure_filename(file.filename)
-                file_extension = filename.rsplit('.', 1)[1].lower()
-                unique_filename = f"group-cover-{uuid.uuid4().hex}.{file_extension}"
-                
-                # Save to database/groups folder
-                groups_folder = os.path.join('database', 'groups')
-                os.makedirs(groups_folder, exist_ok=True)
-                file_path = os.path.join(groups_folder, unique_filename)
-                file.save(file_path)
-                cover_filename = unique_filename
-        
         # Get form data
         data = {
             'name': request.form.get('name'),
@@ -4242,11 +7001,15 @@ def create_group():
             if not data[field]:
                 return jsonify({'success': False, 'error': f'Missing required field: {field}'}), 400
         
+        # Store in the content-addressed media store
+        avatar_filename = store_uploaded_image(avatar_file)
+        cover_filename = store_uploaded_image(cover_file)
+        
         # Load existing groups
         groups = load_groups()
         
         # Generate new group ID
-        new_id = max([group.get('id', 0) for group in groups], default=0) + 1
+        new_id = allocate_id('groups')
         
         # Create new group
         new_group = {
@@ -4270,12 +7033,16 @@ def create_group():
         groups.append(new_group)
         
         # Save to database
-        if save_groups(groups):
+        if save_groups(groups, [new_id]):
             return jsonify({'success': True, 'group': new_group}), 201
         else:
+            release_media_file(avatar_filename)
+            release_media_file(cover_filename)
             return jsonify({'success': False, 'error': 'Failed to save group'}), 500
             
     except Exception as e:
+        release_media_file(avatar_filename)
+        release_media_file(cover_filename)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/groups/<int:group_id>')
@@ -4415,9 +7182,10 @@ def send_group_message(group_id):
     if not group:
         return jsonify({'error': 'Group not found'}), 404
     
-    # Get existing messages efficiently (don't process all, just get max ID)
+    # Message ids come from the group's own sequence (seeded from its messages once)
     existing_messages = group.get('messages', [])
-    new_message_id = max([m.get('id', 0) for m in existing_messages], default=0) + 1
+    new_message_id = allocate_id(f'group:{group_id}:messages',
+                                 seed=lambda: max([m.get('id', 0) for m in existing_messages], default=0))
     
     # Get user info once
     current_user = get_user_by_username(current_username)
@@ -4462,16 +7230,12 @@ def send_group_message(group_id):
         # Create notification for the user whose message was replied to
         replied_to_username = reply_to.get('sender', '')
         if replied_to_username and replied_to_username != current_username:
-            # Create reply notification
-            notifications = load_notifications()
-            notification_id = max([n.get('id', 0) for n in notifications], default=0) + 1
-            
             # Get sender info for notification
             sender_user = get_user_by_username(current_username)
             sender_avatar = sender_user.get('avatar', 'avatar-1.jpg') if sender_user else 'avatar-1.jpg'
             
+            # Create reply notification (id is assigned by add_notification)
             reply_notification = {
-                'id': notification_id,
                 'type': 'group_reply',
                 'user': current_username,
                 'target_user': replied_to_username,  # User who should receive this notification
@@ -4484,8 +7248,7 @@ def send_group_message(group_id):
                 'is_read': False,
                 'action_text': f'replied to your message in {group.get("name", "group")}'
             }
-            notifications.insert(0, reply_notification)
-            save_notifications(notifications)
+            add_notification(reply_notification)
     
     # Add message to group
     if 'messages' not in group:
@@ -4507,7 +7270,8 @@ def send_group_message(group_id):
     # We don't store a global unread_count on the group since it's user-specific
     
     # Save groups
-    if save_groups(groups):
+    if save_groups(groups, [group_id]):
+        touch_thread_inboxes('group', group)
         return jsonify({'success': True, 'message': new_message})
     else:
         return jsonify({'error': 'Failed to save message'}), 500
@@ -4637,7 +7401,7 @@ def mark_group_read(group_id):
     group['unread_count'] = unread_count
     
     if updated:
-        if save_groups(groups):
+        if save_groups(groups, [group_id]):
             return jsonify({'success': True, 'unread_count': unread_count})
         else:
             return jsonify({'error': 'Failed to save read status'}), 500
@@ -4767,7 +7531,7 @@ def toggle_group_membership(group_id):
             break
     
     if target_group:
-        save_groups(groups)
+        save_groups(groups, [group_id])
         return jsonify({
             'success': True, 
             'is_member': target_group.get('is_member', False),
@@ -4800,17 +7564,12 @@ def update_group(group_id):
     if not is_admin:
         return jsonify({'error': 'Only admins can update group settings'}), 403
     
-    # Handle file upload (avatar)
-    if 'avatar' in request.files:
-        file = request.files['avatar']
-        if file and file.filename:
-            filename = secure_filename(file.filename)
-            unique_filename = f"{group_id}_{int(time.time())}_{filename}"
-            groups_folder = os.path.join('database', 'groups')
-            os.makedirs(groups_folder, exist_ok=True)
-            file_path = os.path.join(groups_folder, unique_filename)
-            file.save(file_path)
-            group['avatar'] = unique_filename
+    # Handle file upload (avatar); the old blob is released once the save lands
+    old_avatar = None
+    new_avatar = store_uploaded_image(get_uploaded_image('avatar'))
+    if new_avatar:
+        old_avatar = group.get('avatar')
+        group['avatar'] = new_avatar
     
     # Handle JSON updates
     if request.is_json:
@@ -4823,8 +7582,10 @@ def update_group(group_id):
             if data['privacy'] in ['Public', 'Private']:
                 group['privacy'] = data['privacy']
     
-    if save_groups(groups):
+    if save_groups(groups, [group_id]):
+        release_media_file(old_avatar)
         return jsonify({'success': True})
+    release_media_file(new_avatar)
     return jsonify({'error': 'Failed to save'}), 500
 
 @app.route('/api/groups/<int:group_id>/add-member', methods=['POST'])
@@ -4879,7 +7640,7 @@ def add_group_member(group_id):
     })
     group['members_count'] = len(group['members'])
     
-    if save_groups(groups):
+    if save_groups(groups, [group_id]):
         return jsonify({'success': True})
     return jsonify({'error': 'Failed to save'}), 500
 
@@ -4921,7 +7682,7 @@ def remove_group_member(group_id):
         group['members'] = [m for m in group['members'] if m.get('username') != username]
         group['members_count'] = len(group['members'])
     
-    if save_groups(groups):
+    if save_groups(groups, [group_id]):
         return jsonify({'success': True})
     return jsonify({'error': 'Failed to save'}), 500
 
@@ -4947,7 +7708,7 @@ def leave_group(group_id):
         group['members'] = [m for m in group['members'] if m.get('username') != current_username]
         group['members_count'] = len(group['members'])
     
-    if save_groups(groups):
+    if save_groups(groups, [group_id]):
         return jsonify({'success': True})
     return jsonify({'error': 'Failed to save'}), 500
 
@@ -4978,7 +7739,9 @@ def delete_group(group_id):
     # Remove group
     groups = [g for g in groups if g.get('id') != group_id]
     
-    if save_groups(groups):
+    if save_groups(groups, [group_id]):
+        release_media_file(group.get('avatar'))
+        release_media_file(group.get('cover_image'))
         return jsonify({'success': True})
     return jsonify({'error': 'Failed to save'}), 500
 
@@ -5025,19 +7788,18 @@ def temp_upload():
         print(f"File saved to: {filepath}")
         
         # Track the file with timestamp
-        temp_files = load_temp_media()
-        
         file_info = {
             'filename': filename,
             'file_path': filepath,
+            'owner': session.get('username'),
             'upload_time': datetime.now().isoformat(),
-            'expiry_time': (datetime.now() + timedelta(minutes=20)).isoformat(),
+            'expiry_time': (datetime.now() + timedelta(minutes=TEMP_MEDIA_TTL_MINUTES)).isoformat(),
             'file_type': 'video' if file_ext in ['mp4', 'mov', 'avi', 'webm'] else 'image'
         }
         
-        temp_files.append(file_info)
-        save_temp_media(temp_files)
-        print(f"File info saved. Total temp files: {len(temp_files)}")
+        register_temp_media(file_info)
+        schedule_temp_media_expiry(file_info)
+        print(f"File info saved: {filename}")
         
         return jsonify({
             'success': True,
@@ -5058,12 +7820,10 @@ def temp_upload():
 def serve_temp_media(filename):
     """Serve temporary media files"""
     temp_folder = app.config.get('TEMP_UPLOAD_FOLDER', 'database/create')
-    print(f"Serving temp media: {filename} from {temp_folder}")
     
-    # Check if file exists
-    file_path = os.path.join(temp_folder, filename)
-    if not os.path.exists(file_path):
-        print(f"File not found: {file_path}")
+    # Look the file up in the registry instead of hitting the filesystem
+    file_info = get_temp_media(filename)
+    if not file_info or get_temp_media_expiry(file_info) <= time.time():
         return jsonify({'error': 'File not found'}), 404
     
     # Serve the file
@@ -5079,23 +7839,147 @@ def serve_temp_media(filename):
 
 @app.route('/api/temp-media-info')
 def temp_media_info():
-    """Get information about temporary media files"""
-    temp_files = load_temp_media()
-    current_time = datetime.now()
+    """Get information about the current user's temporary media files"""
+    current_username = session.get('username')
+    filename = request.args.get('filename', '').strip()
+    
+    if filename:
+        # Single file lookup by filename (only if owned by the caller)
+        file_info = get_temp_media(filename)
+        temp_files = [file_info] if file_info and file_info.get('owner') == current_username else []
+    else:
+        temp_files = get_user_temp_media(current_username) if current_username else []
+    now = time.time()
     
     # Add remaining time to each file
+    result = []
     for file_info in temp_files:
-        upload_time = datetime.fromisoformat(file_info['upload_time'])
-        expiry_time = datetime.fromisoformat(file_info['expiry_time'])
-        remaining_seconds = (expiry_time - current_time).total_seconds()
-        file_info['remaining_seconds'] = max(0, int(remaining_seconds))
-        file_info['remaining_minutes'] = max(0, int(remaining_seconds / 60))
+        remaining_seconds = get_temp_media_expiry(file_info) - now
+        if remaining_seconds <= 0:
+            continue
+        file_info = dict(file_info)
+        file_info['remaining_seconds'] = int(remaining_seconds)
+        file_info['remaining_minutes'] = int(remaining_seconds / 60)
+        result.append(file_info)
     
     return jsonify({
         'success': True,
-        'temp_files': temp_files,
-        'total_files': len(temp_files)
+        'temp_files': result,
+        'total_files': len(result)
     })
 
+# ==================== Startup Migrations ====================
+# Run once every helper they rely on has been defined
+
+def migrate_sequences():
+    """Make sure every collection sequence is ahead of the ids already stored"""
+    collections = {
+        'users': load_users(),
+        'posts': load_posts(),
+        'events': load_events(),
+        'products': load_shop(),
+        'groups': load_groups(),
+        'conversations': load_messages()
+    }
+    for collection, records in collections.items():
+        ensure_sequence(collection, max((r.get('id', 0) for r in records), default=0))
+
+def migrate_relations():
+    """
+    Move the old global relation flags off the records into edges. The seed
+    data was written from the settings account's point of view, so its flags
+    become that user's edges, and stored counts drop by the edges now added.
+    """
+    owner = load_settings().get('account', {}).get('username')
+    # Users first: their is_following flags are the ones already in followers_count
+    collections = [
+        ('users', load_users, save_users),
+        ('posts', load_posts, save_posts),
+        ('reels', load_reels, save_reels),
+        ('events', load_events, save_events),
+        ('shop', load_shop, save_shop)
+    ]
+    
+    for collection, load, save in collections:
+        records = load()
+        flags = RELATION_FLAGS[collection]
+        if not any(flag in record for record in records for flag in flags):
+            continue
+        
+        for record in records:
+            for flag, (kind, key_field) in flags.items():
+                object_id = record.get(key_field)
+                if not record.pop(flag, False) or not owner or object_id is None:
+                    continue
+                if has_relation(kind, owner, object_id) or (kind == 'follow' and object_id == owner):
+                    continue
+                set_relation(kind, owner, object_id, True)
+                for field, (count_kind, _) in RELATION_COUNTS.get(collection, {}).items():
+                    if count_kind == kind:
+                        record[field] = max(0, record.get(field, 0) - 1)
+        save(records)
+
+def migrate_event_attendees():
+    """Move the attendees lists stored on events into event_attend edges"""
+    events = load_events()
+    if not any('attendees' in event for event in events):
+        return
+    
+    for event in events:
+        for attendee in event.pop('attendees', None) or []:
+            username = attendee.get('username') if isinstance(attendee, dict) else None
+            if not username or has_relation('event_attend', username, event.get('id')):
+                continue
+            set_relation('event_attend', username, event.get('id'), True)
+            event['attendees_count'] = max(0, event.get('attendees_count', 0) - 1)
+    save_events(events)
+
+def migrate_comments():
+    """Move comments embedded in posts and reels into their own thread files"""
+    for kind, load, save in (('post', load_posts, save_posts), ('reel', load_reels, save_reels)):
+        records = load()
+        if not any('comments' in record for record in records):
+            continue
+        
+        for record in records:
+            embedded = record.pop('comments', None)
+            if not embedded or os.path.exists(get_comment_thread_path(kind, record.get('id'))):
+                continue
+            
+            # Flatten the tree, keeping each comment's parent. Ids must be
+            # unique within the thread - renumber any that aren't.
+            def max_comment_id(comments):
+                return max((max(c.get('id') if isinstance(c.get('id'), int) else 0,
+                                max_comment_id(c.get('replies') or [])) for c in comments), default=0)
+            
+            next_id = max_comment_id(embedded)
+            used_ids = set()
+            comments = []
+            
+            def flatten(tree, parent_id):
+                nonlocal next_id
+                for comment in tree:
+                    stored = {k: v for k, v in comment.items() if k != 'replies'}
+                    if not isinstance(stored.get('id'), int) or stored['id'] in used_ids:
+                        next_id += 1
+                        stored['id'] = next_id
+                    used_ids.add(stored['id'])
+                    comments.append({**stored, 'parent_id': parent_id})
+                    flatten(comment.get('replies') or [], stored['id'])
+            
+            flatten(embedded, None)
+            comments.sort(key=lambda c: c['id'])
+            
+            save_comment_thread(kind, record.get('id'), comments)
+            ensure_sequence(f"{kind}:{record.get('id')}:comments", next_id)
+        save(records)
+
+migrate_created_at()
+migrate_notifications()
+migrate_comments()
+migrate_sequences()
+migrate_relations()
+migrate_event_attendees()
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
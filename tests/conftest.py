@@ -0,0 +1,23 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """Import app.py against a private copy of database/ (paths in app.py are relative to the cwd)"""
+    workdir = tmp_path_factory.mktemp('hallo')
+    shutil.copytree(os.path.join(REPO_ROOT, 'database'), workdir / 'database',
+                    ignore=shutil.ignore_patterns('*.jpg', '*.jpeg', '*.png', '*.mp4', '.*.lock'))
+    os.chdir(workdir)
+    import app
+    yield app
+    # Flush while still in the copy, so the exit-time flushes have nothing left to write
+    os.chdir(workdir)
+    app.flush_counters()
+    app.flush_record_updates()
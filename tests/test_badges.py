@@ -0,0 +1,37 @@
+def test_badge_caches_are_bounded(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'BADGE_CACHE_SIZE', 3)
+    for i in range(6):
+        app_module.get_user_badges(f'badge_user{i}')
+    assert len(app_module._badge_cache) <= 3
+    assert len(app_module._badge_parts) <= 3
+    assert 'badge_user5' in app_module._badge_cache
+
+
+def test_inbox_writes_update_the_notification_counter(app_module, monkeypatch):
+    before = app_module.get_user_badges('badge_reader')['notifications']['unread_count']
+    app_module.add_notification({'target_user': 'badge_reader', 'type': 'like', 'is_read': False})
+
+    def no_rescan(username):
+        raise AssertionError('inbox was rescanned')
+
+    monkeypatch.setattr(app_module, 'load_user_notifications', no_rescan)
+    assert app_module.get_user_badges('badge_reader')['notifications']['unread_count'] == before + 1
+
+
+def test_message_writes_update_the_unread_chat_counter(app_module, monkeypatch):
+    assert app_module.get_user_badges('davidmkindi')['messages']['unread_count'] == \
+        app_module.count_unread_chats('davidmkindi')
+
+    conversations = app_module.load_messages()
+    conversation = next(c for c in conversations if c['id'] == 1)
+    conversation['messages'].append({'id': 9000, 'sender': 'shottadee', 'text': 'unread', 'is_read': False,
+                                     'timestamp': '2025-11-01T10:00:00'})
+    assert app_module.save_messages(conversations, [1])
+    expected = app_module.count_unread_chats('davidmkindi')
+    assert expected >= 1
+
+    def no_rescan(username):
+        raise AssertionError('summaries were rescanned')
+
+    monkeypatch.setattr(app_module, 'count_unread_chats', no_rescan)
+    assert app_module.get_user_badges('davidmkindi')['messages']['unread_count'] == expected
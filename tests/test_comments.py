@@ -0,0 +1,29 @@
+import threading
+
+
+def test_concurrent_comments_all_land(app_module):
+    def worker(thread_id):
+        for i in range(5):
+            assert app_module.add_comment('post', thread_id, {'text': f'comment {i}'}) is not None
+
+    threads = [threading.Thread(target=worker, args=(9100 + n % 2,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for thread_id in (9100, 9101):
+        comments = app_module.load_comment_thread('post', thread_id)
+        assert sorted(c['id'] for c in comments) == list(range(1, 21))
+
+
+def test_replies_attach_to_top_level_comments_only(app_module):
+    top, _, _ = app_module.add_comment('reel', 9102, {'text': 'top'})
+    reply, top_count, total = app_module.add_comment('reel', 9102, {'text': 'reply'}, parent_id=top['id'])
+    assert (top_count, total) == (1, 2)
+    assert app_module.add_comment('reel', 9102, {'text': 'nested'}, parent_id=reply['id']) is None
+
+    page, next_cursor = app_module.get_comment_page('reel', 9102)
+    assert [c['id'] for c in page] == [top['id']]
+    assert [r['id'] for r in page[0]['replies']] == [reply['id']]
+    assert next_cursor is None
@@ -0,0 +1,60 @@
+import threading
+
+
+def get_product(app_module, product_id):
+    return next(product for product in app_module.load_shop() if product['id'] == product_id)
+
+
+def test_increments_from_many_threads_flush_once(app_module):
+    product_id = app_module.load_shop()[0]['id']
+    stored = get_product(app_module, product_id).get('views', 0)
+
+    # Keep the background flusher out until the pending counts are checked
+    with app_module._counter_flush_lock:
+        threads = [threading.Thread(target=lambda: [app_module.increment_counter('shop', product_id, 'views')
+                                                    for _ in range(25)])
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert app_module.get_pending_counts('shop')[(product_id, 'views')] == 200
+        shown = app_module.apply_pending_counts([get_product(app_module, product_id)], 'shop')[0]
+        assert shown['views'] == stored + 200
+
+    app_module.flush_counters()
+    assert get_product(app_module, product_id)['views'] == stored + 200
+    assert (product_id, 'views') not in app_module.get_pending_counts('shop')
+
+
+def test_stale_save_keeps_flushed_counts(app_module):
+    products = app_module.load_shop()
+    product_id = products[0]['id']
+    stored = products[0].get('views', 0)
+
+    app_module.increment_counter('shop', product_id, 'views', 5)
+    app_module.flush_counters()
+    products[0]['title'] = 'Renamed while the counter flushed'
+    assert app_module.save_shop(products)
+
+    product = get_product(app_module, product_id)
+    assert product['title'] == 'Renamed while the counter flushed'
+    assert product['views'] == stored + 5
+
+
+def test_failed_flush_keeps_the_increments(app_module, monkeypatch):
+    product_id = app_module.load_shop()[0]['id']
+    stored = get_product(app_module, product_id).get('views', 0)
+
+    monkeypatch.setitem(app_module.COUNTER_COLLECTIONS, 'shop',
+                        (app_module.load_shop, lambda products: False, ('views',)))
+    app_module.increment_counter('shop', product_id, 'views', 3)
+    app_module.flush_counters()
+    assert app_module.get_pending_counts('shop')[(product_id, 'views')] == 3
+    assert get_product(app_module, product_id).get('views', 0) == stored
+
+    monkeypatch.undo()
+    app_module.flush_counters()
+    assert get_product(app_module, product_id)['views'] == stored + 3
+    assert not app_module.get_pending_counts('shop')
@@ -0,0 +1,32 @@
+def login(client):
+    with client.session_transaction() as session:
+        session['user_id'] = 6
+        session['username'] = 'john_doe'
+
+
+def test_pending_counter_changes_the_etag(app_module):
+    client = app_module.app.test_client()
+    login(client)
+    product_id = app_module.load_shop()[0]['id']
+
+    with app_module._counter_flush_lock:
+        etag = client.get('/api/shop').headers['ETag']
+        assert client.get('/api/shop', headers={'If-None-Match': etag}).status_code == 304
+
+        app_module.increment_counter('shop', product_id, 'views')
+        response = client.get('/api/shop', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etag
+    app_module.flush_counters()
+
+
+def test_queued_update_changes_the_etag(app_module):
+    client = app_module.app.test_client()
+    login(client)
+    event_id = app_module.load_events()[0]['id']
+
+    with app_module._write_behind_flush_lock:
+        etag = client.get('/api/events').headers['ETag']
+        app_module.queue_record_update('events', event_id, lambda event: event.update(test_touched=True))
+        assert client.get('/api/events', headers={'If-None-Match': etag}).status_code == 200
+    app_module.flush_record_updates()
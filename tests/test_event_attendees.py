@@ -0,0 +1,79 @@
+import pytest
+
+
+def page_all(app_module, object_id, limit):
+    usernames, cursor = app_module.get_relation_subjects_page('test_attend', object_id, limit=limit)
+    while cursor:
+        page, cursor = app_module.get_relation_subjects_page(
+            'test_attend', object_id, app_module.decode_relation_cursor(cursor), limit)
+        usernames.extend(page)
+    return usernames
+
+
+def test_relation_cursor_round_trip(app_module):
+    cursor = app_module.encode_relation_cursor((42, 'alice'))
+    assert app_module.decode_relation_cursor(cursor) == (42, 'alice')
+
+
+@pytest.mark.parametrize('edge', [(True, 'alice'), ('42', 'alice'), (42, 7), (42,)])
+def test_relation_cursor_rejects_wrong_types(app_module, edge):
+    assert app_module.decode_relation_cursor(app_module.encode_relation_cursor(edge)) is None
+
+
+def test_relation_cursor_rejects_garbage(app_module):
+    assert app_module.decode_relation_cursor('not-a-cursor') is None
+
+
+def test_pages_match_newest_first_order(app_module):
+    joined = []
+    for i in range(23):
+        app_module.set_relation('test_attend', f'user{i}', 1, True)
+        joined.append(f'user{i}')
+    for username in ('user4', 'user11'):
+        app_module.set_relation('test_attend', username, 1, False)
+        joined.remove(username)
+    app_module.set_relation('test_attend', 'user4', 1, True)
+    joined.append('user4')
+
+    expected = joined[::-1]
+    for limit in (1, 5, 7, 50):
+        assert page_all(app_module, 1, limit) == expected
+
+
+def test_cursor_survives_compaction(app_module):
+    for i in range(10):
+        app_module.set_relation('test_attend', f'user{i}', 2, True)
+    first, cursor = app_module.get_relation_subjects_page('test_attend', 2, limit=4)
+
+    with app_module._relations_lock, app_module._file_locked(app_module.RELATIONS_LOCK):
+        app_module._compact_relations()
+
+    rest, _ = app_module.get_relation_subjects_page('test_attend', 2, app_module.decode_relation_cursor(cursor), 50)
+    assert first + rest == [f'user{i}' for i in range(9, -1, -1)]
+
+
+def test_attendees_api_rejects_bad_cursor(app_module):
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 6
+        session['username'] = 'john_doe'
+    event_id = app_module.load_events()[0]['id']
+    response = client.get(f'/api/events/{event_id}/attendees?cursor=bogus')
+    assert response.status_code == 400
+
+
+def test_event_views_count_attendance_edges(app_module):
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 6
+        session['username'] = 'john_doe'
+    event = app_module.load_events()[0]
+    expected = app_module.mark_relations([dict(event)], 'events', 'john_doe')[0]['attendees_count']
+
+    assert client.get(f'/api/events/{event["id"]}').get_json()['event']['attendees_count'] == expected
+    assert f'id="attendees-count-{event["id"]}">{expected}<' in client.get('/events').get_data(as_text=True)
+
+    # The cached card follows attendance changes
+    app_module.set_relation('event_attend', 'test_attendee', event['id'], True)
+    assert f'id="attendees-count-{event["id"]}">{expected + 1}<' in client.get('/events').get_data(as_text=True)
+    app_module.set_relation('event_attend', 'test_attendee', event['id'], False)
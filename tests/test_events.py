@@ -0,0 +1,83 @@
+import random
+
+import pytest
+
+
+def make_events(count, seed):
+    rng = random.Random(seed)
+    events = []
+    for event_id in range(1, count + 1):
+        events.append({
+            'id': event_id,
+            'date': f'2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+            'time': f'{rng.randint(0, 23):02d}:00',
+            'category': rng.choice(['music', 'sports', 'tech']),
+            'latitude': rng.uniform(-89.9, 89.9),
+            'longitude': rng.uniform(-180.0, 180.0)
+        })
+    return events
+
+
+def brute_force_near(app_module, events, latitude, longitude, radius_km):
+    return {event['id'] for event in events
+            if app_module.get_distance_km(latitude, longitude, event['latitude'], event['longitude']) <= radius_km}
+
+
+def test_encode_geohash_matches_known_values(app_module):
+    assert app_module.encode_geohash(57.64911, 10.40744, 11) == 'u4pruydqqvj'
+    assert app_module.encode_geohash(-25.382708, -49.265506, 6) == '6gkzwg'
+
+
+@pytest.mark.parametrize('radius_km', [1, 10, 50, 300, 2000])
+def test_find_events_near_matches_brute_force(app_module, radius_km):
+    rng = random.Random(radius_km)
+    centres = [(rng.uniform(-80, 80), rng.uniform(-180, 180)) for _ in range(20)]
+    # Cluster events around the query points so small radii find something
+    events = make_events(200, radius_km)
+    for event in events[:100]:
+        latitude, longitude = rng.choice(centres)
+        event['latitude'] = latitude + rng.uniform(-1, 1) * radius_km / 111.0
+        event['longitude'] = (longitude + rng.uniform(-1, 1) * radius_km / 111.0 + 180.0) % 360.0 - 180.0
+        event['latitude'] = max(-90.0, min(90.0, event['latitude']))
+    index = app_module.build_event_index(events)
+
+    for latitude, longitude in centres:
+        found = app_module.find_events_near(index, latitude, longitude, radius_km)
+        assert set(found) == brute_force_near(app_module, events, latitude, longitude, radius_km)
+
+
+def test_find_events_near_across_the_antimeridian(app_module):
+    events = [
+        {'id': 1, 'latitude': 0.0, 'longitude': 179.99},
+        {'id': 2, 'latitude': 0.0, 'longitude': -179.99},
+        {'id': 3, 'latitude': 0.0, 'longitude': 170.0}
+    ]
+    index = app_module.build_event_index(events)
+    assert set(app_module.find_events_near(index, 0.0, -179.995, 5)) == {1, 2}
+
+
+def test_event_cursor_round_trip_and_rejects_bad_input(app_module):
+    entry = ('2025-11-15', '18:00', 1)
+    assert app_module.decode_event_cursor(app_module.encode_event_cursor(entry)) == entry
+    assert app_module.decode_event_cursor('not-a-cursor') is None
+    assert app_module.decode_event_cursor(app_module.encode_event_cursor(('2025-11-15', '18:00', '1'))) is None
+    assert app_module.decode_event_cursor(app_module.encode_event_cursor(('2025-11-15', 18, 1))) is None
+
+
+def test_date_pages_cover_every_event_in_order(app_module):
+    original = app_module.load_events()
+    events = make_events(57, 7)
+    app_module.save_events(events)
+    try:
+        expected = sorted(app_module.get_event_sort_entry(event) for event in events)
+        seen = []
+        cursor = None
+        while True:
+            page, _, next_cursor = app_module.query_event_index(cursor=cursor, limit=10)
+            seen.extend(app_module.get_event_sort_entry(event) for event in page)
+            if next_cursor is None:
+                break
+            cursor = app_module.decode_event_cursor(next_cursor)
+        assert seen == expected
+    finally:
+        app_module.save_events(original)
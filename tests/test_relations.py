@@ -0,0 +1,82 @@
+def replay_from_scratch(app_module):
+    """Drop the in-memory maps and replay the whole journal, as a freshly started worker would"""
+    with app_module._relations_lock:
+        app_module._relations_inode = None
+        app_module._sync_relations()
+
+
+def snapshot(app_module, kind, object_ids):
+    return {object_id: dict(app_module._relation_objects.get((kind, object_id), {})) for object_id in object_ids}
+
+
+def test_toggle_and_set_relation(app_module):
+    assert app_module.toggle_relation('test_like', 'alice', 1) is True
+    assert app_module.has_relation('test_like', 'alice', 1)
+    assert app_module.toggle_relation('test_like', 'alice', 1) is False
+    assert not app_module.has_relation('test_like', 'alice', 1)
+
+    app_module.set_relation('test_like', 'alice', 2, True)
+    app_module.set_relation('test_like', 'alice', 2, True)  # No-op, nothing appended
+    app_module.set_relation('test_like', 'bob', 2, True)
+    assert app_module.count_relations('test_like', 2) == 2
+    assert app_module.get_relation_subjects('test_like', 2) == {'alice', 'bob'}
+    assert app_module.get_user_relations('test_like', 'alice') == {2}
+
+
+def test_replay_rebuilds_the_same_state(app_module):
+    for i in range(20):
+        app_module.set_relation('test_replay', f'user{i % 5}', i % 3, True)
+    app_module.set_relation('test_replay', 'user1', 1, False)
+    app_module.set_relation('test_replay', 'user1', 1, True)  # Re-added, so now the newest edge
+
+    before = snapshot(app_module, 'test_replay', range(3))
+    order = app_module.get_user_relation_order('test_replay', 'user1')
+    replay_from_scratch(app_module)
+
+    assert snapshot(app_module, 'test_replay', range(3)) == before
+    assert app_module.get_user_relation_order('test_replay', 'user1') == order
+    assert order[0] == 1
+
+
+def test_partial_line_is_left_for_the_next_sync(app_module):
+    app_module._sync_relations()
+    with open(app_module.RELATIONS_JOURNAL, 'a', encoding='utf-8') as f:
+        f.write('{"kind": "test_partial", "user": "alice", "object": 1, ')
+    assert not app_module.has_relation('test_partial', 'alice', 1)
+    with open(app_module.RELATIONS_JOURNAL, 'a', encoding='utf-8') as f:
+        f.write('"on": true}\n')
+    assert app_module.has_relation('test_partial', 'alice', 1)
+
+
+def test_compaction_keeps_live_edges_in_order(app_module):
+    for round_number in range(3):
+        for i in range(10):
+            app_module.set_relation('test_compact', f'user{i}', 7, round_number != 1)
+    app_module.set_relation('test_compact', 'user3', 7, False)
+    app_module.set_relation('test_compact', 'user3', 7, True)
+
+    subjects, _ = app_module.get_relation_subjects_page('test_compact', 7, limit=100)
+    with app_module._relations_lock, app_module._file_locked(app_module.RELATIONS_LOCK):
+        app_module._compact_relations()
+
+    with open(app_module.RELATIONS_JOURNAL, 'r', encoding='utf-8') as f:
+        assert sum(1 for _ in f) == app_module._relations_live
+    assert app_module._relations_lines == app_module._relations_live
+    assert app_module.get_relation_subjects_page('test_compact', 7, limit=100)[0] == subjects
+    assert subjects[0] == 'user3'
+
+    # Every worker numbers the rewritten journal's edges the same way
+    numbers = dict(app_module._relation_objects[('test_compact', 7)])
+    replay_from_scratch(app_module)
+    assert app_module._relation_objects[('test_compact', 7)] == numbers
+
+
+def test_writes_compact_once_the_journal_has_enough_slack(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'RELATIONS_COMPACT_SLACK', 10)
+    app_module._sync_relations()
+    inode = app_module._relations_inode
+    for _ in range(2 * app_module._relations_live + 20):
+        app_module.toggle_relation('test_slack', 'alice', 1)
+    assert app_module._relations_inode != inode
+    assert app_module._relations_lines <= 2 * app_module._relations_live + 10
+    assert not app_module.has_relation('test_slack', 'alice', 1)
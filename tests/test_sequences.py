@@ -0,0 +1,53 @@
+import threading
+
+
+def test_allocate_id_seeds_once_and_counts_up(app_module):
+    calls = []
+
+    def seed():
+        calls.append(1)
+        return 41
+
+    assert app_module.allocate_id('test_top_level', seed) == 42
+    assert app_module.allocate_id('test_top_level', seed) == 43
+    assert calls == [1]
+    assert app_module.load_sequences()['test_top_level'] == 43
+
+
+def test_thread_sequences_live_in_their_shard(app_module):
+    collection = 'post:9001:comments'
+    shard = app_module.get_sequence_shard(collection)
+    assert 0 <= shard < app_module.SEQUENCE_SHARDS
+    assert app_module.get_sequence_shard('posts') is None
+
+    assert app_module.allocate_id(collection) == 1
+    path, _ = app_module.get_sequence_paths(shard)
+    assert app_module.load_sequences(path)[collection] == 1
+    assert collection not in app_module.load_sequences()
+
+
+def test_ensure_sequence_never_lowers(app_module):
+    collection = 'post:9003:comments'
+    app_module.ensure_sequence(collection, 5)
+    app_module.ensure_sequence(collection, 2)
+    assert app_module.allocate_id(collection) == 6
+
+
+def test_concurrent_allocations_are_unique(app_module):
+    collection = 'post:9004:comments'
+    allocated = []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(10):
+            new_id = app_module.allocate_id(collection)
+            with lock:
+                allocated.append(new_id)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(allocated) == list(range(1, 81))
+
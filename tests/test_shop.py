@@ -0,0 +1,49 @@
+def test_shop_cursor_round_trip(app_module):
+    for sort, entry in [('newest', ('2025-10-20', 3)), ('price_asc', (19.99, 7)), ('popular', (120, 2))]:
+        cursor = app_module.encode_shop_cursor(entry)
+        assert app_module.decode_shop_cursor(cursor, sort) == entry
+
+
+def test_shop_cursor_rejects_garbage_and_wrong_types(app_module):
+    encode = app_module.encode_shop_cursor
+    decode = app_module.decode_shop_cursor
+    assert decode('not-a-cursor') is None
+    assert decode('') is None
+    # Key type must match the sort's field so it compares against the index entries
+    assert decode(encode((19.99, 7)), 'newest') is None
+    assert decode(encode(('2025-10-20', 7)), 'price_asc') is None
+    assert decode(encode((True, 7)), 'price_asc') is None
+    assert decode(encode((19.99, '7')), 'price_asc') is None
+    assert decode(encode((19.99, False)), 'price_asc') is None
+
+
+def test_shop_pages_follow_the_cursor(app_module):
+    products = app_module.load_shop()
+    for sort in app_module.SHOP_SORTS:
+        seen = []
+        cursor = None
+        while True:
+            page, next_cursor = app_module.query_shop_index(sort=sort, cursor=cursor, limit=2)
+            seen.extend(product['id'] for product in page)
+            if next_cursor is None:
+                break
+            cursor = app_module.decode_shop_cursor(next_cursor, sort)
+            assert cursor is not None
+        assert sorted(seen) == sorted(product['id'] for product in products)
+
+
+def test_search_shows_pending_views_without_touching_the_index(app_module):
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 6
+        session['username'] = 'john_doe'
+    product = app_module.get_featured_shop_products()[0]
+    stored = product.get('views', 0)
+
+    with app_module._counter_flush_lock:
+        app_module.increment_counter('shop', product['id'], 'views', 4)
+        results = client.get('/api/shop/search').get_json()['products']
+    assert next(p for p in results if p['id'] == product['id'])['views'] == stored + 4
+    assert 'is_new' not in product
+    assert product.get('views', 0) == stored
+    app_module.flush_counters()
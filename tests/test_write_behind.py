@@ -0,0 +1,61 @@
+def get_record(load, record_id):
+    return next(record for record in load() if record['id'] == record_id)
+
+
+def test_keyed_changes_replace_each_other(app_module):
+    product_id = app_module.load_shop()[0]['id']
+
+    # Keep the background flusher out while the queue is inspected
+    with app_module._write_behind_flush_lock:
+        app_module.queue_record_update('shop', product_id, lambda p: p.update(test_seen=1), key='seen')
+        app_module.queue_record_update('shop', product_id, lambda p: p.update(test_seen=2), key='seen')
+        app_module.queue_record_update('shop', product_id, lambda p: p.update(test_note='a'))
+        app_module.queue_record_update('shop', product_id, lambda p: p.update(test_note=p['test_note'] + 'b'))
+        with app_module._write_behind_condition:
+            assert len(app_module._write_behind[('shop', product_id)]) == 3
+
+    app_module.flush_record_updates()
+    product = get_record(app_module.load_shop, product_id)
+    assert product['test_seen'] == 2
+    assert product['test_note'] == 'ab'
+
+
+def test_changes_to_deleted_records_are_dropped(app_module):
+    app_module.queue_record_update('shop', -1, lambda p: p.update(test_ghost=True))
+    app_module.flush_record_updates()
+    assert ('shop', -1) not in app_module._write_behind
+    assert not any(product.get('test_ghost') for product in app_module.load_shop())
+
+
+def test_flush_names_changed_posts(app_module, monkeypatch):
+    post_id = app_module.load_posts()[0]['id']
+    saved_ids = []
+
+    def save(posts, changed_ids=None):
+        saved_ids.append(changed_ids)
+        return app_module.save_posts(posts, changed_ids)
+
+    monkeypatch.setitem(app_module.WRITE_BEHIND_COLLECTIONS, 'posts', (app_module.load_posts, save))
+    app_module.queue_record_update('posts', post_id, lambda p: p.update(test_flag=True))
+    app_module.flush_record_updates()
+    assert saved_ids == [[post_id]]
+    assert get_record(app_module.load_posts, post_id)['test_flag'] is True
+
+
+def test_failed_flush_requeues_behind_newer_changes(app_module, monkeypatch):
+    product_id = app_module.load_shop()[0]['id']
+
+    monkeypatch.setitem(app_module.WRITE_BEHIND_COLLECTIONS, 'shop', (app_module.load_shop, lambda products: False))
+    with app_module._write_behind_flush_lock:
+        app_module.queue_record_update('shop', product_id, lambda p: p.update(test_state='old'), key='state')
+        app_module.queue_record_update('shop', product_id, lambda p: p.update(test_other=True))
+    app_module.flush_record_updates()
+    with app_module._write_behind_flush_lock:
+        assert ('shop', product_id) in app_module._write_behind
+
+    monkeypatch.undo()
+    app_module.queue_record_update('shop', product_id, lambda p: p.update(test_state='new'), key='state')
+    app_module.flush_record_updates()
+    product = get_record(app_module.load_shop, product_id)
+    assert product['test_state'] == 'new'
+    assert product['test_other'] is True